@@ -0,0 +1,109 @@
+"""
+Admission control: separate concurrency pools for public and admin traffic.
+
+Routes take a slot from the "public" or "admin" bulkhead through a
+dependency. A full pool queues a bounded number of requests for at most
+ADMISSION_QUEUE_TIMEOUT_SECONDS. Past that it answers 503 with Retry-After
+right away instead of letting requests pile up on the MongoDB connection
+pool. The admin pool is small, so a burst of dashboard queries can hold only
+a few connections, and it never takes slots from the public pool.
+
+The event stream takes an admin slot only while it opens (the slot is
+released before the response starts); its subscriber cap lives in events.py.
+
+Batch requests are not admitted either; each of their sub-requests takes
+its own slot.
+"""
+
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+import metrics
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+ADMISSION_PUBLIC_LIMIT = int(os.environ.get('ADMISSION_PUBLIC_LIMIT', '64'))
+ADMISSION_PUBLIC_QUEUE = int(os.environ.get('ADMISSION_PUBLIC_QUEUE', '128'))
+ADMISSION_ADMIN_LIMIT = int(os.environ.get('ADMISSION_ADMIN_LIMIT', '4'))
+ADMISSION_ADMIN_QUEUE = int(os.environ.get('ADMISSION_ADMIN_QUEUE', '8'))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_SECONDS', '2'))
+
+in_flight = metrics.Gauge("admission_in_flight", "Requests holding a slot, by pool")
+queue_depth = metrics.Gauge("admission_queue_depth", "Requests waiting for a slot, by pool")
+rejections = metrics.Counter("admission_rejections_total", "Requests turned away, by pool and reason (queue_full, timeout)")
+wait_seconds = metrics.Histogram("admission_wait_seconds", "Time spent waiting for a slot, by pool")
+
+
+class Bulkhead:
+    """A concurrency limit with a bounded, time-limited wait queue"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self._waiting = 0
+
+    def _reject(self, reason: str):
+        rejections.inc(pool=self.name, reason=reason)
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, please try again shortly",
+            headers={"Retry-After": str(max(1, math.ceil(self.queue_timeout)))}
+        )
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one slot for the duration of the block, or raise a 503"""
+        if self._semaphore.locked():
+            if self._waiting >= self.queue_size:
+                self._reject("queue_full")
+            started = time.perf_counter()
+            self._waiting += 1
+            queue_depth.set(self._waiting, pool=self.name)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject("timeout")
+            finally:
+                self._waiting -= 1
+                queue_depth.set(self._waiting, pool=self.name)
+            wait_seconds.observe(time.perf_counter() - started, pool=self.name)
+        else:
+            await self._semaphore.acquire()
+
+        in_flight.inc(pool=self.name)
+        try:
+            yield
+        finally:
+            in_flight.dec(pool=self.name)
+            self._semaphore.release()
+
+
+bulkheads: Dict[str, Bulkhead] = {
+    "public": Bulkhead("public", ADMISSION_PUBLIC_LIMIT, ADMISSION_PUBLIC_QUEUE, ADMISSION_QUEUE_TIMEOUT),
+    "admin": Bulkhead("admin", ADMISSION_ADMIN_LIMIT, ADMISSION_ADMIN_QUEUE, ADMISSION_QUEUE_TIMEOUT),
+}
+
+
+async def public() -> AsyncIterator[None]:
+    """Dependency admitting a request through the public pool"""
+    async with bulkheads["public"].slot():
+        yield
+
+
+async def admin() -> AsyncIterator[None]:
+    """Dependency admitting a request through the admin pool"""
+    async with bulkheads["admin"].slot():
+        yield
@@ -0,0 +1,185 @@
+"""
+Retention: move cold records out of the live collections.
+
+Soft-deleted projects, services and reviews (after a grace period, so an
+accidental delete can still be undone) and completed contact forms older
+than the retention window are written, in batches, to gzip-compressed NDJSON
+files under ARCHIVE_DIR/<collection>/ (ARCHIVE_DIR/<tenant>/<collection>/
+with tenants) and then deleted. Each batch is synced to disk before its
+documents are removed, and restoring skips ids that already exist, so an
+interrupted run never loses or duplicates a record. Documents are archived
+whole, tenant id included, so they restore as they were.
+
+The API runs the archiver as a scheduler job on the ARCHIVE_CRON schedule
+(daily at 02:30 UTC by default; empty disables it).
+
+Run by hand:
+    python archive.py run [--dry-run]
+    python archive.py restore archives/projects/20250101T000000.ndjson.gz [...]
+"""
+
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from bson import json_util
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from cache import cache
+import tenancy
+from database import current_storage
+from storage import Repository, Storage, motor_storage
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = Path(os.environ.get('ARCHIVE_DIR', ROOT_DIR / 'archives'))
+ARCHIVE_CRON = os.environ.get('ARCHIVE_CRON', '30 2 * * *')
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+INACTIVE_GRACE_DAYS = int(os.environ.get('ARCHIVE_INACTIVE_AFTER_DAYS', '30'))
+CONTACT_RETENTION_DAYS = int(os.environ.get('ARCHIVE_CONTACT_FORMS_AFTER_DAYS', '365'))
+
+# Collections whose list responses are cached
+CACHED_COLLECTIONS = ("projects", "services")
+
+
+def retention_filters(now: datetime) -> Dict[str, Dict]:
+    """What each collection sheds, as of `now`"""
+    deactivated_before = now - timedelta(days=INACTIVE_GRACE_DAYS)
+    inactive = {
+        "is_active": False,
+        # Records soft-deleted before deactivated_at existed have none
+        "$or": [{"deactivated_at": None}, {"deactivated_at": {"$lt": deactivated_before}}]
+    }
+    return {
+        "projects": inactive,
+        "services": inactive,
+        "reviews": inactive,
+        "contact_forms": {
+            "status": "completed",
+            "created_at": {"$lt": now - timedelta(days=CONTACT_RETENTION_DAYS)}
+        },
+    }
+
+
+def _archive_dir() -> Path:
+    """ARCHIVE_DIR, or the current tenant's directory under it"""
+    tenant_id = tenancy.current_tenant_id()
+    return ARCHIVE_DIR / tenant_id if tenant_id else ARCHIVE_DIR
+
+
+def _append(path: Path, documents: List[Dict]):
+    """Append one gzip member to the archive and make it durable"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = "".join(json_util.dumps(document) + "\n" for document in documents)
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="ab") as archive:
+            archive.write(lines.encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def _read_batches(path: Path, batch_size: int) -> Iterator[List[Dict]]:
+    batch = []
+    # Reads every gzip member one after another
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            if line.strip():
+                batch.append(json_util.loads(line))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+async def archive_collection(repository: Repository, filter: Dict, path: Path, batch_size: int) -> int:
+    """Move matching documents into `path` batch by batch, returning how many moved"""
+    moved = 0
+    while True:
+        # Whole documents, so fields outside the model (related_ids, tenant_id) come back on restore
+        batch = await repository.find_raw(filter, [("id", 1)], limit=batch_size)
+        if not batch:
+            return moved
+        await asyncio.to_thread(_append, path, batch)
+        # Re-check the filter so a record restored meanwhile stays live
+        await repository.delete_many({"id": {"$in": [doc["id"] for doc in batch]}, **filter})
+        moved += len(batch)
+
+
+async def run_archiver(storage: Storage, dry_run: bool = False) -> Dict[str, int]:
+    """Archive every collection once, returning the counts per collection"""
+    now = datetime.utcnow()
+    stamp = now.strftime("%Y%m%dT%H%M%S")
+    counts = {}
+    for name, filter in retention_filters(now).items():
+        if dry_run:
+            counts[name] = await storage[name].count(filter)
+            continue
+        path = _archive_dir() / name / f"{stamp}.ndjson.gz"
+        counts[name] = await archive_collection(storage[name], filter, path, ARCHIVE_BATCH_SIZE)
+        if counts[name] and name in CACHED_COLLECTIONS:
+            cache.invalidate(name)
+    return counts
+
+
+async def restore_archive(storage: Storage, path: Path, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Put an archive file's documents back, skipping ids that already exist"""
+    repository = storage[path.parent.name]
+    restored = 0
+    for batch in _read_batches(path, batch_size):
+        unique = {doc["id"]: doc for doc in batch}
+        existing = await repository.find_many({"id": {"$in": list(unique)}}, fields={})
+        for doc in existing:
+            unique.pop(doc["id"], None)
+        if unique:
+            await repository.insert_many(list(unique.values()))
+            restored += len(unique)
+    return restored
+
+
+async def archive_old_records():
+    """Scheduler job: archive the API's own database"""
+    counts = await run_archiver(current_storage())
+    logger.info(f"Archived {counts}")
+
+
+async def main(options: argparse.Namespace):
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+    storage = motor_storage(client[os.environ.get('DB_NAME', 'alsawda_warehouses')])
+
+    if options.command == "run":
+        for tenant in tenancy.tenants.values() or [None]:
+            with tenancy.use_tenant(tenant):
+                scoped = storage.scoped(tenancy.TENANT_FIELD, tenant.id) if tenant else storage
+                counts = await run_archiver(scoped, options.dry_run)
+            for name, count in counts.items():
+                if options.dry_run:
+                    print(f"🔎 {name}: {count} documents to archive")
+                else:
+                    print(f"📦 {name}: archived {count} documents")
+    else:
+        for path in options.paths:
+            restored = await restore_archive(storage, Path(path))
+            print(f"♻️  {path}: restored {restored} documents")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive cold records or restore them")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="archive records past their retention window")
+    run_parser.add_argument("--dry-run", action="store_true", help="only count documents to archive")
+    restore_parser = commands.add_parser("restore", help="restore archive files into their collection")
+    restore_parser.add_argument("paths", nargs="+", help="archive files, named <collection>/<stamp>.ndjson.gz")
+    asyncio.run(main(parser.parse_args()))
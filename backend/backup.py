@@ -0,0 +1,318 @@
+"""
+Backup and restore of every collection.
+
+Backups stream each collection to its own compressed BSON file, all
+collections at once. Documents are copied as raw BSON, never decoded, and
+go out one cursor batch at a time, so memory stays bounded by the batch
+size. Files are zstd-compressed when the `zstandard` package is installed and
+gzip-compressed otherwise. manifest.json records the document count and a
+SHA-256 checksum for every file.
+
+Restores verify every checksum before writing anything, then load all
+collections concurrently with parallel unordered insert_many batches and
+build the indexes once the data is in (without --drop, the existing
+non-unique ones are dropped first). The first failed batch stops the whole
+restore.
+
+Each collection is read with its own cursor, so a backup taken while the API
+is writing is consistent per collection, not across collections.
+
+Run:
+    python backup.py backup [--out backups] [--batch-size 1000]
+    python backup.py verify backups/20250101T000000
+    python backup.py restore backups/20250101T000000 [--drop] [--concurrency 4]
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+from bson import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+from pymongo.errors import BulkWriteError
+
+import database
+from storage import COLLECTIONS
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = Path(os.environ.get('BACKUP_DIR', ROOT_DIR / 'backups'))
+MANIFEST = "manifest.json"
+EXTENSIONS = {"zstd": ".bson.zst", "gzip": ".bson.gz"}
+DUPLICATE_KEY = 11000
+HASH_CHUNK_SIZE = 1 << 20
+
+RAW_BSON = CodecOptions(document_class=RawBSONDocument)
+
+
+class HashingWriter:
+    """File wrapper that checksums everything written through it"""
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+
+def _compressor(raw: HashingWriter, compression: str):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+    return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+
+
+def _decompressor(path: Path, compression: str) -> BinaryIO:
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return gzip.open(path, "rb")
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def iter_documents(path: Path, compression: str) -> Iterator[RawBSONDocument]:
+    """Raw BSON documents from a backup file, in order"""
+    with _decompressor(path, compression) as stream:
+        while True:
+            header = _read_exact(stream, 4)
+            if not header:
+                return
+            (length,) = struct.unpack("<i", header)
+            body = _read_exact(stream, length - 4)
+            if len(body) != length - 4:
+                raise ValueError(f"{path} ends in the middle of a document")
+            yield RawBSONDocument(header + body)
+
+
+def iter_batches(path: Path, compression: str, batch_size: int) -> Iterator[List[RawBSONDocument]]:
+    batch = []
+    for document in iter_documents(path, compression):
+        batch.append(document)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def file_sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+async def backup_collection(collection: AsyncIOMotorCollection, path: Path,
+                            compression: str, batch_size: int) -> Dict:
+    """Stream one collection to `path`, returning its manifest entry"""
+    documents = 0
+    with open(path, "wb") as file:
+        raw = HashingWriter(file)
+        compressor = _compressor(raw, compression)
+        batch = []
+        async for document in collection.with_options(codec_options=RAW_BSON).find({}, batch_size=batch_size):
+            batch.append(document.raw)
+            if len(batch) == batch_size:
+                # Compress off the event loop so the other collections keep streaming
+                await asyncio.to_thread(compressor.write, b"".join(batch))
+                documents += len(batch)
+                batch = []
+        if batch:
+            await asyncio.to_thread(compressor.write, b"".join(batch))
+            documents += len(batch)
+        compressor.close()
+    return {"file": path.name, "documents": documents, "sha256": raw.sha256.hexdigest()}
+
+
+async def backup(db, out_dir: Path, batch_size: int) -> Path:
+    target = out_dir / datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    target.mkdir(parents=True)
+    compression = "zstd" if zstandard else "gzip"
+
+    entries = await asyncio.gather(*(
+        backup_collection(db[name], target / f"{name}{EXTENSIONS[compression]}", compression, batch_size)
+        for name in COLLECTIONS
+    ))
+    manifest = {
+        "created_at": datetime.utcnow().isoformat(),
+        "database": db.name,
+        "compression": compression,
+        "collections": dict(zip(COLLECTIONS, entries)),
+    }
+    # Written last: a backup without a manifest is incomplete
+    (target / MANIFEST).write_text(json.dumps(manifest, indent=2))
+    return target
+
+
+def load_manifest(backup_dir: Path) -> Dict:
+    manifest = json.loads((backup_dir / MANIFEST).read_text())
+    if manifest["compression"] == "zstd" and zstandard is None:
+        raise SystemExit("This backup is zstd-compressed; install the zstandard package to read it")
+    return manifest
+
+
+def verify(backup_dir: Path, manifest: Dict) -> List[str]:
+    """Names of files whose checksum does not match the manifest"""
+    return [
+        entry["file"] for entry in manifest["collections"].values()
+        if file_sha256(backup_dir / entry["file"]) != entry["sha256"]
+    ]
+
+
+async def _gather_or_cancel(tasks: List[asyncio.Task]) -> List:
+    """Wait for every task, cancelling the others as soon as one fails"""
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def insert_batch(collection: AsyncIOMotorCollection, batch: List[RawBSONDocument]) -> int:
+    """Insert one batch, returning how many documents went in"""
+    try:
+        result = await collection.insert_many(batch, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        # Restoring over existing data: keep what is already there
+        if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+            raise
+        return e.details["nInserted"]
+
+
+async def restore_collection(collection: AsyncIOMotorCollection, path: Path, compression: str,
+                             batch_size: int, concurrency: int) -> int:
+    """Load one backup file with up to `concurrency` insert_many batches in flight"""
+    batches = iter_batches(path, compression, batch_size)
+    reading = asyncio.Lock()
+    restored = 0
+
+    async def next_batch() -> Optional[List[RawBSONDocument]]:
+        async with reading:
+            return await asyncio.to_thread(next, batches, None)
+
+    async def load():
+        nonlocal restored
+        # Each loader decodes a batch only once its last one is in, which bounds memory too
+        while (batch := await next_batch()) is not None:
+            restored += await insert_batch(collection, batch)
+
+    await _gather_or_cancel([asyncio.create_task(load()) for _ in range(concurrency)])
+    return restored
+
+
+async def drop_secondary_indexes(db, names: List[str]):
+    """Drop the non-unique indexes ensure_indexes builds, so the load does not maintain them"""
+    for name in names:
+        existing = await db[name].index_information()
+        for index in database.INDEXES.get(name, []):
+            # Unique indexes stay, so restoring over existing data cannot add duplicates
+            if index.document["name"] in existing and not index.document.get("unique"):
+                await db[name].drop_index(index.document["name"])
+
+
+async def restore(db, backup_dir: Path, manifest: Dict, batch_size: int, concurrency: int, drop: bool) -> Dict[str, int]:
+    names = list(manifest["collections"])
+    if drop:
+        for name in names:
+            await db.drop_collection(name)
+    else:
+        await drop_secondary_indexes(db, names)
+
+    counts = await _gather_or_cancel([
+        asyncio.create_task(restore_collection(
+            db[name], backup_dir / entry["file"], manifest["compression"], batch_size, concurrency
+        ))
+        for name, entry in manifest["collections"].items()
+    ])
+
+    # Building indexes once over loaded data beats maintaining them per insert
+    await database.ensure_indexes(db)
+    return dict(zip(names, counts))
+
+
+async def main(options: argparse.Namespace):
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+    db = client[os.environ.get('DB_NAME', 'alsawda_warehouses')]
+    started = time.perf_counter()
+
+    if options.command == "backup":
+        target = await backup(db, Path(options.out), options.batch_size)
+        manifest = load_manifest(target)
+        for name, entry in manifest["collections"].items():
+            logger.info(f"{name}: {entry['documents']} documents")
+        logger.info(f"Backup written to {target} in {time.perf_counter() - started:.1f}s")
+    else:
+        backup_dir = Path(options.path)
+        manifest = load_manifest(backup_dir)
+        corrupt = verify(backup_dir, manifest)
+        if corrupt:
+            logger.error(f"Checksum mismatch: {', '.join(corrupt)}")
+            raise SystemExit(1)
+        logger.info(f"Checksums verified for {backup_dir}")
+
+        if options.command == "restore":
+            counts = await restore(db, backup_dir, manifest, options.batch_size, options.concurrency, options.drop)
+            for name, count in counts.items():
+                expected = manifest["collections"][name]["documents"]
+                logger.info(f"{name}: restored {count} of {expected} documents")
+            logger.info(f"Restore completed in {time.perf_counter() - started:.1f}s")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up or restore every collection")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = commands.add_parser("backup", help="write a new backup")
+    backup_parser.add_argument("--out", default=str(BACKUP_DIR), help="directory for backups")
+    backup_parser.add_argument("--batch-size", type=int, default=1000)
+
+    verify_parser = commands.add_parser("verify", help="check a backup's checksums")
+    verify_parser.add_argument("path")
+
+    restore_parser = commands.add_parser("restore", help="verify and load a backup")
+    restore_parser.add_argument("path")
+    restore_parser.add_argument("--batch-size", type=int, default=1000)
+    restore_parser.add_argument("--concurrency", type=int, default=4, help="insert batches in flight per collection")
+    restore_parser.add_argument("--drop", action="store_true", help="drop each collection before loading it")
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(main(parser.parse_args()))
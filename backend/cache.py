@@ -0,0 +1,108 @@
+"""
+In-process cache for read results that only change when we write.
+
+Entries are grouped in namespaces named after the collection they are
+derived from, so a write path can drop everything that depends on it with a
+single `cache.invalidate("projects")`. In multi-tenant mode namespaces are
+per tenant, so a write drops only its own tenant's entries.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+import tenancy
+import tracing
+
+CACHE_TTL = float(os.environ.get('CACHE_TTL_SECONDS', '300'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '1000'))
+
+
+class ResponseCache:
+    """Namespaced LRU cache with a TTL and single-flight loading"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._loading: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._generations: Dict[str, int] = {}
+
+    def get(self, namespace: str, key: str) -> Tuple[bool, Any]:
+        entry = self._entries.get((namespace, key))
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[(namespace, key)]
+            return False, None
+        self._entries.move_to_end((namespace, key))
+        return True, value
+
+    def set(self, namespace: str, key: str, value: Any):
+        self._entries[(namespace, key)] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end((namespace, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, namespace: str):
+        """Drop every entry derived from a namespace"""
+        self._invalidate(tenancy.scoped(namespace))
+
+    def _invalidate(self, namespace: str):
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        for entry_key in [k for k in self._entries if k[0] == namespace]:
+            del self._entries[entry_key]
+
+    def clear(self):
+        """Drop every entry in every namespace"""
+        for namespace in {key[0] for key in self._entries} | set(self._generations):
+            self._invalidate(namespace)
+
+    async def refresh(self, namespace: str, key: str, loader: Callable[[], Awaitable[Any]]):
+        """Reload an entry ahead of its expiry, unless a write invalidates it meanwhile"""
+        namespace = tenancy.scoped(namespace)
+        generation = self._generations.get(namespace, 0)
+        value = await loader()
+        if self._generations.get(namespace, 0) == generation:
+            self.set(namespace, key, value)
+
+    async def get_or_load(self, namespace: str, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value, loading it once for concurrent callers"""
+        namespace = tenancy.scoped(namespace)
+        hit, value = self.get(namespace, key)
+        if hit:
+            tracing.annotate("cache.hit", namespace=namespace, key=key)
+            return value
+
+        pending = self._loading.get((namespace, key))
+        if pending is not None:
+            tracing.annotate("cache.wait", namespace=namespace, key=key)
+        else:
+            tracing.annotate("cache.miss", namespace=namespace, key=key)
+            # Its own task, so a caller timing out does not cancel the load for the others
+            pending = asyncio.create_task(self._load(namespace, key, loader))
+            pending.add_done_callback(_retrieve_exception)
+            self._loading[(namespace, key)] = pending
+        return await asyncio.shield(pending)
+
+    async def _load(self, namespace: str, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        generation = self._generations.get(namespace, 0)
+        try:
+            value = await loader()
+        finally:
+            self._loading.pop((namespace, key), None)
+        # A write during the load makes the result stale; serve it but don't keep it
+        if self._generations.get(namespace, 0) == generation:
+            self.set(namespace, key, value)
+        return value
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Every caller may have given up waiting; don't log the failure as unhandled
+    if not task.cancelled():
+        task.exception()
+
+cache = ResponseCache(CACHE_TTL, CACHE_MAX_ENTRIES)
@@ -0,0 +1,91 @@
+"""
+Company statistics kept current from the real collection counts.
+
+Project and review writes apply `$inc` deltas to the live counts in the
+statistics document, and a scheduler job recounts them to correct any drift
+(also once at startup). Whenever the review counts move, the company's rating
+and review count are set from them.
+The public figures are computed from those counts when the document is read,
+unless an admin has overridden them.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict
+
+from cache import cache
+from database import current_storage
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Floors shown while the portfolio in the database is still small
+MIN_PROJECTS_COMPLETED = 100
+MIN_HAPPY_CLIENTS = 150
+# Each published review stands for roughly this many clients
+CLIENTS_PER_REVIEW = 10
+
+# Figures derived from counts, which an admin may override
+COMPUTED_FIGURES = ("projects_completed", "happy_clients")
+
+
+def present_statistics(stats: Dict) -> Dict:
+    """The public figures for a statistics document"""
+    figures = {
+        "projects_completed": max(stats.get("active_projects", 0), MIN_PROJECTS_COMPLETED),
+        "happy_clients": max(stats.get("active_reviews", 0) * CLIENTS_PER_REVIEW, MIN_HAPPY_CLIENTS),
+        "years_experience": stats.get("years_experience", 0),
+        "team_members": stats.get("team_members", 0),
+    }
+    figures.update(stats.get("overrides") or {})
+    figures["updated_at"] = stats.get("updated_at")
+    return figures
+
+
+async def adjust_statistics(db: Storage, **deltas: int):
+    """Apply count deltas from a write that has already succeeded"""
+    try:
+        await db.statistics.update_one({}, {"$inc": deltas, "$set": {"updated_at": datetime.utcnow()}})
+        if deltas.keys() & {"active_reviews", "active_rating_total"}:
+            await update_company_rating(db)
+    except Exception as e:
+        # The write itself went through; the next recount repairs the counts
+        logger.warning(f"Could not adjust statistics by {deltas}: {e!r}")
+    cache.invalidate("statistics")
+
+
+async def recompute_statistics():
+    """Recount the live statistics from the collections"""
+    db = current_storage()
+    projects_count, rating_groups = await asyncio.gather(
+        db.projects.count({"is_active": True}),
+        db.reviews.group_counts("rating", {"is_active": True})
+    )
+    stats = {
+        "active_projects": projects_count,
+        "active_reviews": sum(group["count"] for group in rating_groups),
+        "active_rating_total": sum(group["value"] * group["count"] for group in rating_groups),
+    }
+    # Keep the stored figures in step for tools that read the document directly
+    figures = present_statistics(stats)
+    await db.statistics.update_one({}, {"$set": {
+        **stats,
+        "projects_completed": figures["projects_completed"],
+        "happy_clients": figures["happy_clients"],
+        "updated_at": datetime.utcnow()
+    }})
+    cache.invalidate("statistics")
+    await update_company_rating(db)
+
+
+async def update_company_rating(db: Storage):
+    """Set the company's rating and review count from the live review counts"""
+    stats = await db.statistics.find_one({}, fields={"active_reviews": 1, "active_rating_total": 1})
+    if not stats or not stats.get("active_reviews") or not stats.get("active_rating_total"):
+        return
+    await db.company_info.update_one({}, {"$set": {
+        "rating": round(stats["active_rating_total"] / stats["active_reviews"], 1),
+        "review_count": stats["active_reviews"]
+    }})
+    cache.invalidate("company")
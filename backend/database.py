@@ -1,56 +1,200 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from typing import Optional
+import logging
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from models import CompanyInfo, Service, Statistics
+from storage import COLLECTIONS, Storage, motor_storage, memory_storage
+from monitoring import command_listener
+import tenancy
+import tracing
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Only active documents are served publicly, so the list indexes skip
+# soft-deleted rows instead of carrying them until they are archived
+ACTIVE_ONLY = {"partialFilterExpression": {"is_active": True}}
+
+# Secondary indexes backing the list queries; documents are keyed by the
+# model UUID in _id, so no separate index on "id" is needed
+INDEXES = {
+    "projects": [
+        IndexModel([("created_at", DESCENDING)], **ACTIVE_ONLY),
+        IndexModel([("category", ASCENDING), ("created_at", DESCENDING)], **ACTIVE_ONLY),
+        IndexModel([("is_featured", ASCENDING), ("created_at", DESCENDING)], **ACTIVE_ONLY),
+        IndexModel([("popularity_log", DESCENDING)], **ACTIVE_ONLY),
+        # Projects without coordinates are left out of a 2dsphere index
+        IndexModel([("geo", GEOSPHERE)], **ACTIVE_ONLY),
+    ],
+    "services": [
+        IndexModel([("category", ASCENDING)], **ACTIVE_ONLY),
+    ],
+    "reviews": [
+        IndexModel([("date", DESCENDING)], **ACTIVE_ONLY),
+        IndexModel([("rating", DESCENDING), ("date", DESCENDING)], **ACTIVE_ONLY),
+        # Synced reviews are matched on the provider's id; hand-entered ones have none
+        IndexModel(
+            [("google_review_id", ASCENDING)], unique=True,
+            partialFilterExpression={"google_review_id": {"$type": "string"}}
+        ),
+    ],
+    "contact_forms": [
+        IndexModel([("created_at", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+}
+
+# Indexes that earlier versions created and the ones above replace.
+# ensure_indexes drops only these, by name, once their replacements exist;
+# any other index (one added by hand, say) is left alone
+SUPERSEDED_INDEXES = {
+    "projects": [
+        "is_active_1_created_at_-1",
+        "is_active_1_category_1_created_at_-1",
+        "is_active_1_is_featured_1_created_at_-1",
+        "is_active_1_popularity_-1",
+        "popularity_-1",
+    ],
+    "services": ["is_active_1_category_1"],
+    "reviews": ["is_active_1_date_-1", "is_active_1_rating_-1_date_-1"],
+}
+
+if tenancy.enabled():
+    # A single-site deployment turned multi-tenant leaves its untenanted
+    # indexes behind, and tenant-led copies of the superseded ones may exist
+    SUPERSEDED_INDEXES = {
+        collection: [
+            *SUPERSEDED_INDEXES.get(collection, []),
+            *(f"{tenancy.TENANT_FIELD}_1_{name}" for name in SUPERSEDED_INDEXES.get(collection, [])),
+            *(index.document["name"] for index in indexes),
+        ]
+        for collection, indexes in INDEXES.items()
+    }
+    # Every query is scoped to a tenant, so the tenant id leads every index
+    INDEXES = {
+        collection: [
+            IndexModel(
+                [(tenancy.TENANT_FIELD, ASCENDING), *index.document["key"].items()],
+                **{option: value for option, value in index.document.items() if option not in ("key", "name")}
+            )
+            for index in indexes
+        ]
+        for collection, indexes in INDEXES.items()
+    }
+    # One company record and one statistics document per tenant
+    for collection in ("company_info", "statistics"):
+        INDEXES[collection] = [IndexModel([(tenancy.TENANT_FIELD, ASCENDING)], unique=True)]
+
+logger = logging.getLogger(__name__)
+
 class Database:
     client: Optional[AsyncIOMotorClient] = None
     database: Optional[AsyncIOMotorDatabase] = None
+    storage: Optional[Storage] = None
+    # Indexes and default data are in place (MongoDB may be down at startup)
+    prepared: bool = False
 
 database = Database()
 
 async def get_database() -> AsyncIOMotorDatabase:
     return database.database
 
+def current_storage() -> Storage:
+    """Storage scoped to the tenant being served (all of it when tenancy is off)"""
+    tenant_id = tenancy.current_tenant_id()
+    if tenant_id is None:
+        return database.storage
+    return database.storage.scoped(tenancy.TENANT_FIELD, tenant_id)
+
+async def get_storage() -> Storage:
+    return current_storage()
+
+async def connect_to_database():
+    """Set up the configured storage engine"""
+    engine = os.environ.get('STORAGE_ENGINE', 'mongo')
+    if engine == 'memory':
+        logger.info("Using in-memory storage")
+        database.storage = memory_storage()
+        await initialize_tenants()
+        database.prepared = True
+    else:
+        await connect_to_mongo()
+
 async def connect_to_mongo():
     """Create database connection"""
     mongo_url = os.environ.get('MONGO_URL')
     db_name = os.environ.get('DB_NAME', 'alsawda_warehouses')
     
-    print(f"Connecting to MongoDB: {db_name}")
+    logger.info(f"Connecting to MongoDB: {db_name}")
     
-    database.client = AsyncIOMotorClient(mongo_url)
+    database.client = AsyncIOMotorClient(
+        mongo_url,
+        serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        event_listeners=[command_listener, *tracing.command_listeners()]
+    )
     database.database = database.client[db_name]
+    database.storage = motor_storage(database.database)
     
     # Test the connection
     try:
         await database.client.admin.command('ismaster')
-        print("✅ MongoDB connection successful")
+        logger.info("MongoDB connection successful")
         
-        # Initialize default data
-        await initialize_default_data()
+        await prepare_database()
         
     except Exception as e:
-        print(f"❌ MongoDB connection failed: {e}")
+        logger.error(f"MongoDB connection failed: {e}")
         raise
 
+async def prepare_database():
+    """Build the indexes and default data; retried when MongoDB comes back if startup missed it"""
+    await ensure_indexes()
+    # Until migrate_ids has re-keyed them, documents are also looked up by `id`
+    for name in COLLECTIONS:
+        if await database.storage[name].detect_legacy_ids():
+            logger.info(f"{name} has documents keyed by ObjectId; looking them up by id too until 0001_model_ids re-keys them")
+    
+    # Initialize default data
+    await initialize_tenants()
+    database.prepared = True
+
 async def close_mongo_connection():
     """Close database connection"""
     if database.client:
         database.client.close()
-        print("✅ MongoDB connection closed")
+        logger.info("MongoDB connection closed")
+
+async def ensure_indexes(db: Optional[AsyncIOMotorDatabase] = None):
+    """Create the list queries' indexes in `db` (the app's by default) and drop superseded ones"""
+    if db is None:
+        db = database.database
+    for collection, indexes in INDEXES.items():
+        # Build the replacements first so the queries are never left without an index
+        await db[collection].create_indexes(indexes)
+        existing = await db[collection].index_information()
+        for name in existing.keys() & set(SUPERSEDED_INDEXES.get(collection, [])):
+            await db[collection].drop_index(name)
+
+async def initialize_tenants():
+    """Initialize the default data, or each tenant's statistics document"""
+    if not tenancy.enabled():
+        await initialize_default_data()
+        return
+    # Tenants bring their own company data (python tenancy.py adopt)
+    for tenant in tenancy.tenants.values():
+        with tenancy.use_tenant(tenant):
+            await initialize_statistics()
 
 async def initialize_default_data():
     """Initialize the database with default data"""
     
     # Initialize company info
-    company_collection = database.database.company_info
-    existing_company = await company_collection.find_one()
+    company_collection = database.storage.company_info
+    existing_company = await company_collection.find_one({})
     
     if not existing_company:
         default_company = {
@@ -71,12 +215,12 @@ async def initialize_default_data():
             "whatsapp": "+966568979993",
             "map_url": "https://g.co/kgs/wxTrhyM"
         }
-        await company_collection.insert_one(default_company)
-        print("✅ Company info initialized")
+        await company_collection.insert_one(CompanyInfo(**default_company).dict())
+        logger.info("Company info initialized")
 
     # Initialize services
-    services_collection = database.database.services
-    services_count = await services_collection.count_documents({})
+    services_collection = database.storage.services
+    services_count = await services_collection.count({})
     
     if services_count == 0:
         default_services = [
@@ -135,12 +279,17 @@ async def initialize_default_data():
                 "is_active": True
             }
         ]
-        await services_collection.insert_many(default_services)
-        print("✅ Services initialized")
+        await services_collection.insert_many([Service(**service).dict() for service in default_services])
+        logger.info("Services initialized")
+
+    await initialize_statistics()
 
-    # Initialize statistics
-    stats_collection = database.database.statistics
-    existing_stats = await stats_collection.find_one()
+    logger.info("Database initialization completed")
+
+async def initialize_statistics():
+    """Create the statistics document the write paths increment"""
+    stats_collection = current_storage().statistics
+    existing_stats = await stats_collection.find_one({})
     
     if not existing_stats:
         default_stats = {
@@ -149,7 +298,5 @@ async def initialize_default_data():
             "years_experience": 5,
             "team_members": 25
         }
-        await stats_collection.insert_one(default_stats)
-        print("✅ Statistics initialized")
-
-    print("✅ Database initialization completed")
\ No newline at end of file
+        await stats_collection.insert_one(Statistics(**default_stats).dict())
+        logger.info("Statistics initialized")
\ No newline at end of file
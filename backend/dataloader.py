@@ -0,0 +1,139 @@
+"""
+Per-request batching of lookups by id.
+
+`DataLoader.load(id)` calls made within one event-loop tick are collected,
+deduplicated and resolved with a single `$in` query. The DataLoaders live on
+`request.state`, so every handler working on the same request shares their
+results. `Loaders` only finds them there: a read closure holding one and
+re-run after the request (see resilience.refresh_all) gets fresh DataLoaders
+instead of the request's memoized results.
+"""
+
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set
+
+from fastapi import Depends, HTTPException, Request
+
+from database import get_storage
+from i18n import ALL, localized_fields
+from storage import COLLECTION_MODELS, Fields, Repository, Storage
+
+MAX_BATCH_IDS = 50
+
+BatchFunction = Callable[[List[str]], Awaitable[Dict[str, Any]]]
+
+
+class DataLoader:
+    """Batches and deduplicates loads issued in the same event-loop tick"""
+
+    def __init__(self, batch_fn: BatchFunction):
+        self._batch_fn = batch_fn
+        self._results: Dict[str, asyncio.Future] = {}
+        self._queue: List[str] = []
+        # The event loop only keeps weak references to tasks
+        self._dispatches: Set[asyncio.Task] = set()
+
+    def load(self, key: str) -> "asyncio.Future[Optional[Any]]":
+        """Resolve one key (None when it does not exist)"""
+        if key in self._results:
+            return self._results[key]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._results[key] = future
+        self._queue.append(key)
+        if len(self._queue) == 1:
+            # Dispatch after everything already scheduled for this tick has queued its keys
+            loop.call_soon(self._start_dispatch)
+        return future
+
+    async def load_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """Resolve several keys, preserving their order"""
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _start_dispatch(self):
+        task = asyncio.ensure_future(self._dispatch())
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self):
+        keys, self._queue = self._queue, []
+        try:
+            found = await self._batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                # Let a later load retry instead of caching the failure
+                self._results.pop(key).set_exception(e)
+            return
+        for key in keys:
+            self._results[key].set_result(found.get(key))
+
+
+def by_id_loader(repository: Repository, fields: Optional[Fields] = None) -> DataLoader:
+    async def batch(ids: List[str]) -> Dict[str, Any]:
+        documents = await repository.find_many({"id": {"$in": ids}}, fields=fields)
+        return {document["id"]: document for document in documents}
+
+    return DataLoader(batch)
+
+
+# The DataLoaders of the request being served, by storage, collection and language
+_request_loaders: contextvars.ContextVar[Optional[Dict[tuple, DataLoader]]] = contextvars.ContextVar(
+    "request_loaders", default=None
+)
+
+
+class Loaders:
+    """The id loaders available to the request being served"""
+
+    def __init__(self, db: Storage):
+        self._db = db
+
+    @property
+    def projects(self) -> DataLoader:
+        return self.localized("projects", ALL)
+
+    @property
+    def services(self) -> DataLoader:
+        return self.localized("services", ALL)
+
+    @property
+    def reviews(self) -> DataLoader:
+        return self.localized("reviews", ALL)
+
+    def localized(self, collection: str, language: str) -> DataLoader:
+        """Loader for `collection` returning documents in one language"""
+        fields = None if language == ALL else localized_fields(COLLECTION_MODELS[collection], language)
+        loaders = _request_loaders.get()
+        if loaders is None:
+            return by_id_loader(self._db[collection], fields)
+        key = (id(self._db), collection, language)
+        if key not in loaders:
+            loaders[key] = by_id_loader(self._db[collection], fields)
+        return loaders[key]
+
+
+async def get_loaders(request: Request, db: Storage = Depends(get_storage)) -> Loaders:
+    if not hasattr(request.state, "loaders"):
+        request.state.loaders = {}
+    _request_loaders.set(request.state.loaders)
+    return Loaders(db)
+
+
+@contextmanager
+def outside_request() -> Iterator[None]:
+    """Run the block with fresh DataLoaders, even if started from a request"""
+    token = _request_loaders.set(None)
+    try:
+        yield
+    finally:
+        _request_loaders.reset(token)
+
+
+def parse_ids(ids: str) -> List[str]:
+    """Split a comma-separated id list, dropping blanks and duplicates"""
+    parsed = list(dict.fromkeys(part.strip() for part in ids.split(",") if part.strip()))
+    if len(parsed) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    return parsed
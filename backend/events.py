@@ -0,0 +1,246 @@
+"""
+In-process pub/sub for pushing changes to open dashboards.
+
+Write routes publish events to a topic; each subscriber (one open
+server-sent events stream) reads them from its own bounded queue. Publishing
+never waits: a subscriber that falls a full queue behind is dropped and told
+to resync, so a slow client cannot hold up writers or grow memory.
+
+With several workers, a change made in one process is invisible to streams
+held by another. Setting EVENT_CHANGE_STREAMS=true makes every process tail
+a MongoDB change stream instead (replica set required); local publishing is
+then skipped so each change is delivered exactly once.
+
+In multi-tenant mode topics are per tenant, so a dashboard only hears about
+its own site.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pymongo.errors import OperationFailure, PyMongoError
+
+import tenancy
+from database import database
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', '100'))
+HEARTBEAT_INTERVAL = float(os.environ.get('EVENT_HEARTBEAT_SECONDS', '15'))
+MAX_SUBSCRIBERS = int(os.environ.get('EVENT_MAX_SUBSCRIBERS', '100'))
+USE_CHANGE_STREAMS = os.environ.get('EVENT_CHANGE_STREAMS', 'false').lower() == 'true'
+
+# How long a browser waits before reconnecting a dropped stream
+RECONNECT_MILLISECONDS = 3000
+# Server error code for "change streams need a replica set"
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+class Subscription:
+    """One stream's view of a topic"""
+
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+        self.closed = False
+
+
+class EventBus:
+    """Fan-out of published events to bounded subscriber queues"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._next_id = 0
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def subscribe(self, topic: str) -> Subscription:
+        if self.subscriber_count() >= MAX_SUBSCRIBERS:
+            raise HTTPException(status_code=503, detail="Too many open event streams")
+        subscription = Subscription(topic)
+        self._subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers[subscription.topic].discard(subscription)
+
+    def publish(self, topic: str, event: str, data: Any):
+        self._next_id += 1
+        message = {"id": self._next_id, "event": event, "data": jsonable_encoder(data)}
+        for subscription in list(self._subscribers[topic]):
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+
+    def close(self):
+        """End every open stream"""
+        for subscribers in self._subscribers.values():
+            for subscription in subscribers:
+                subscription.closed = True
+                try:
+                    # Wake a stream blocked on an empty queue
+                    subscription.queue.put_nowait(None)
+                except asyncio.QueueFull:
+                    pass
+        self._subscribers.clear()
+
+
+bus = EventBus()
+_watcher: Optional[asyncio.Task] = None
+_change_streams_active = False
+
+
+def notify(topic: str, event: str, data: Any):
+    """Publish a change made by this process"""
+    if _change_streams_active:
+        # The change stream delivers it to every process, this one included
+        return
+    bus.publish(tenancy.scoped(topic), event, data)
+
+
+def format_event(message: Dict[str, Any]) -> str:
+    data = json.dumps(message["data"], ensure_ascii=False)
+    event_id = f"id: {message['id']}\n" if "id" in message else ""
+    return f"{event_id}event: {message['event']}\ndata: {data}\n\n"
+
+
+def subscribe(topic: str) -> Subscription:
+    """Open a subscription for a stream, or raise a 503 when too many are open
+
+    Call it before starting the response: once the stream's headers are sent
+    an error can no longer reach the client as a status code.
+    """
+    return bus.subscribe(tenancy.scoped(topic))
+
+
+async def stream(request: Request, subscription: Subscription) -> AsyncIterator[str]:
+    """Server-sent events for one subscription, with heartbeats to keep proxies from timing out"""
+    try:
+        yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+        while True:
+            if subscription.overflowed and subscription.queue.empty():
+                # Events were lost; the client should refetch before listening again
+                yield format_event({"event": "resync", "data": {}})
+                return
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": heartbeat\n\n"
+                continue
+            if message is None or subscription.closed:
+                return
+            yield format_event(message)
+    finally:
+        bus.unsubscribe(subscription)
+
+
+class EventStreamResponse(StreamingResponse):
+    """A server-sent events response that releases its subscription however it ends
+
+    The stream's own cleanup never runs when the client is gone before the
+    body starts, which would leave the subscription counting against
+    MAX_SUBSCRIBERS for good.
+    """
+
+    media_type = "text/event-stream"
+
+    def __init__(self, request: Request, subscription: Subscription):
+        super().__init__(
+            stream(request, subscription),
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        self.subscription = subscription
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            bus.unsubscribe(self.subscription)
+
+
+def _contact_event(change: Dict[str, Any]) -> Optional[tuple]:
+    """Translate a contact_forms change into the event the routes would publish"""
+    form_id = change["documentKey"]["_id"]
+    operation = change["operationType"]
+    if operation == "insert":
+        document = dict(change["fullDocument"])
+        document["id"] = document.pop("_id")
+        return "contact.created", document
+    if operation == "delete":
+        return "contact.deleted", {"id": form_id}
+    if operation == "replace":
+        return "contact.status", {"id": form_id, "status": change["fullDocument"].get("status")}
+    updated = change.get("updateDescription", {}).get("updatedFields", {})
+    if "status" in updated:
+        return "contact.status", {"id": form_id, "status": updated["status"]}
+    return None
+
+
+def _publish_change(topic: str, change: Dict[str, Any], event: tuple):
+    if not tenancy.enabled():
+        bus.publish(topic, *event)
+        return
+    document = change.get("fullDocument")
+    if document is not None:
+        bus.publish(tenancy.scoped(topic, document.get(tenancy.TENANT_FIELD)), *event)
+        return
+    # A delete carries only the id, which every tenant's dashboards may safely see
+    for scoped_topic in list(bus._subscribers):
+        if scoped_topic.endswith(f":{topic}"):
+            bus.publish(scoped_topic, *event)
+
+
+async def _watch_contact_forms():
+    global _change_streams_active
+    collection = database.database["contact_forms"]
+    pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+    resume_token = None
+    while True:
+        try:
+            # With tenants, updates look up the document for its tenant id
+            full_document = "updateLookup" if tenancy.enabled() else None
+            async with collection.watch(pipeline, resume_after=resume_token, full_document=full_document) as changes:
+                async for change in changes:
+                    resume_token = changes.resume_token
+                    event = _contact_event(change)
+                    if event:
+                        _publish_change("contact", change, event)
+        except OperationFailure as e:
+            if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                logger.warning("Change streams need a replica set, publishing contact events locally")
+                _change_streams_active = False
+                return
+            logger.warning(f"Contact change stream failed: {e!r}")
+        except PyMongoError as e:
+            logger.warning(f"Contact change stream failed: {e!r}")
+        await asyncio.sleep(RECONNECT_MILLISECONDS / 1000)
+
+
+async def start():
+    """Tail MongoDB change streams when enabled and connected"""
+    global _watcher, _change_streams_active
+    if USE_CHANGE_STREAMS and database.database is not None:
+        _change_streams_active = True
+        _watcher = asyncio.create_task(_watch_contact_forms())
+
+
+async def stop():
+    """Stop tailing and close every open stream"""
+    global _change_streams_active
+    if _watcher:
+        _watcher.cancel()
+    _change_streams_active = False
+    bus.close()
@@ -0,0 +1,144 @@
+"""
+Place-name lookup for project coordinates.
+
+GAZETTEER_PATH (default gazetteer.csv next to this file) lists places with
+their Arabic and English names and coordinates. A project location such as
+"جدة، المملكة العربية السعودية" or "Riyadh - Olaya" matches a place when one
+of its comma- or dash-separated parts is a known name. Spelling variants of
+alef, taa marbuta and alef maqsura are folded, and diacritics are ignored.
+
+New and updated projects get coordinates from their location when none are
+given. Existing projects are backfilled by the 0002_project_coordinates
+migration (see migrations.py), or by hand:
+    python gazetteer.py backfill [--batch-size 500] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import csv
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from cache import cache
+from storage import Storage, motor_storage
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+GAZETTEER_PATH = Path(os.environ.get('GAZETTEER_PATH', ROOT_DIR / 'gazetteer.csv'))
+BACKFILL_BATCH_SIZE = int(os.environ.get('GEO_BACKFILL_BATCH_SIZE', '500'))
+
+DIACRITICS = re.compile("[\u064b-\u0652\u0640]")  # harakat and tatweel
+SEPARATORS = re.compile(r"\s*(?:,|،|\s-\s)\s*")
+FOLDED_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ة": "ه", "ى": "ي"})
+
+
+def normalize(name: str) -> str:
+    return " ".join(DIACRITICS.sub("", name).translate(FOLDED_LETTERS).lower().split())
+
+
+class Gazetteer:
+    def __init__(self, places: Dict[str, Tuple[float, float]]):
+        self.places = places
+
+    @classmethod
+    def load(cls, path: Path) -> "Gazetteer":
+        places = {}
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                point = (float(row["longitude"]), float(row["latitude"]))
+                for column in ("name", "name_en"):
+                    if row.get(column):
+                        places[normalize(row[column])] = point
+        return cls(places)
+
+    def lookup(self, location: Optional[str]) -> Optional[Dict]:
+        """GeoJSON point of the first known place named in `location`"""
+        if not location:
+            return None
+        for part in [location, *SEPARATORS.split(location)]:
+            point = self.places.get(normalize(part))
+            if point is not None:
+                return {"type": "Point", "coordinates": point}
+        return None
+
+
+@lru_cache(maxsize=1)
+def default_gazetteer() -> Gazetteer:
+    return Gazetteer.load(GAZETTEER_PATH)
+
+
+def with_coordinates(project_data: Dict) -> Dict:
+    """Fill in `geo` from the location when the client sent no coordinates"""
+    if project_data.get("geo") is None and project_data.get("location"):
+        project_data["geo"] = default_gazetteer().lookup(project_data["location"])
+    return project_data
+
+
+async def backfill_project_coordinates(
+    storage: Storage,
+    gazetteer: Gazetteer,
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    dry_run: bool = False
+) -> Tuple[int, Counter]:
+    """Geocode projects that have a location but no coordinates
+
+    Returns the number of projects located and the unmatched locations.
+    """
+    located, unmatched = 0, Counter()
+    last_id = ""
+    while True:
+        # Walk by id so unmatched projects are not fetched again
+        batch = await storage.projects.find_many(
+            {"geo": None, "location": {"$ne": None}, "id": {"$gt": last_id}},
+            [("id", 1)],
+            limit=batch_size
+        )
+        if not batch:
+            break
+        last_id = batch[-1]["id"]
+        updates = {}
+        for project in batch:
+            point = gazetteer.lookup(project["location"])
+            if point is None:
+                unmatched[project["location"]] += 1
+            else:
+                updates[project["id"]] = {"geo": point}
+        if updates and not dry_run:
+            await storage.projects.set_many(updates)
+        located += len(updates)
+    if located and not dry_run:
+        cache.invalidate("projects")
+    return located, unmatched
+
+
+async def main(options: argparse.Namespace):
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+    storage = motor_storage(client[os.environ.get('DB_NAME', 'alsawda_warehouses')])
+
+    gazetteer = Gazetteer.load(Path(options.file))
+    located, unmatched = await backfill_project_coordinates(storage, gazetteer, options.batch_size, options.dry_run)
+    verb = "would locate" if options.dry_run else "located"
+    print(f"📍 {verb} {located} projects")
+    for location, count in unmatched.most_common(10):
+        print(f"❔ {count} x {location}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Geocode project locations from the gazetteer")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = commands.add_parser("backfill", help="set coordinates on projects that lack them")
+    backfill_parser.add_argument("--file", default=str(GAZETTEER_PATH), help="gazetteer CSV")
+    backfill_parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    backfill_parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,347 @@
+"""
+Data generator for local development, index tuning and load testing.
+
+Profiles:
+    seed       the hand-written sample data from seed_data.py
+    synthetic  N projects, reviews, services and contact forms with realistic
+               Arabic/English text and skewed category, rating and date
+               distributions
+
+Synthetic documents carry every field of their model, as the API writes
+them. Synthetic output is deterministic for a given --seed: every batch draws
+from its own RNG seeded by (seed, collection, batch number), so the result
+does not depend on how batches are spread across worker processes.
+
+Examples:
+    python generate_data.py --profile seed
+    python generate_data.py --contact-forms 1000000 --batch-size 5000 --workers 8
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Type
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pydantic import BaseModel
+
+import seed_data
+from database import ensure_indexes
+from gazetteer import default_gazetteer
+from models import ContactForm, GeoPoint, Project, Review, Service
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Fixed reference point so generated dates are reproducible too
+REFERENCE_DATE = datetime(2025, 1, 1)
+
+CITIES = [
+    ("الرياض", "Riyadh"), ("جدة", "Jeddah"), ("نجران", "Najran"), ("الدمام", "Dammam"),
+    ("مكة المكرمة", "Makkah"), ("المدينة المنورة", "Madinah"), ("أبها", "Abha"),
+    ("الخبر", "Khobar"), ("تبوك", "Tabuk"), ("جازان", "Jazan"),
+]
+CITY_WEIGHTS = [30, 22, 15, 9, 7, 6, 4, 3, 2, 2]
+
+PROJECT_CATEGORIES = [
+    ("ديكور داخلي", "Interior Decor"), ("فلل", "Villas"), ("غرف معيشة", "Living Rooms"),
+    ("مكاتب", "Offices"), ("منازل", "Homes"), ("واجهات", "Facades"), ("حدائق", "Gardens"),
+    ("ديكور خارجي", "Exterior Decor"), ("معماري", "Architecture"),
+]
+# Zipf-like skew: a few categories hold most of the portfolio
+PROJECT_CATEGORY_WEIGHTS = [1 / (rank + 1) for rank in range(len(PROJECT_CATEGORIES))]
+
+SPACES = [
+    ("صالة معيشة", "living room"), ("مجلس رجال", "men's majlis"), ("مكتب تنفيذي", "executive office"),
+    ("غرفة نوم رئيسية", "master bedroom"), ("مطبخ", "kitchen"), ("واجهة فيلا", "villa facade"),
+    ("حديقة منزلية", "home garden"), ("مطعم", "restaurant"), ("معرض تجاري", "showroom"),
+]
+STYLES = [
+    ("فاخر", "luxury"), ("عصري", "modern"), ("كلاسيكي", "classic"), ("نجدي", "Najdi"),
+    ("بسيط", "minimalist"), ("صناعي", "industrial"),
+]
+MATERIALS = [
+    ("رخام إيطالي", "Italian marble"), ("خشب البلوط", "oak wood"), ("جبس مزخرف", "ornate gypsum"),
+    ("حجر طبيعي", "natural stone"), ("إضاءة مخفية", "hidden lighting"), ("زجاج معشق", "stained glass"),
+]
+
+SERVICE_CATEGORIES = ["design", "construction", "finishing", "technology"]
+SERVICE_CATEGORY_WEIGHTS = [45, 25, 20, 10]
+SERVICE_ICONS = ["fas fa-home", "fas fa-tree", "fas fa-tools", "fas fa-drafting-compass",
+                 "fas fa-paint-brush", "fas fa-laptop"]
+SERVICE_NAMES = [
+    ("تصميم", "Design"), ("تنفيذ", "Implementation"), ("صيانة", "Maintenance"),
+    ("استشارات", "Consulting"), ("تجديد", "Renovation"), ("إشراف هندسي", "Engineering Supervision"),
+]
+
+FIRST_NAMES = ["أحمد", "محمد", "عبدالله", "خالد", "فهد", "سلطان", "يوسف", "فاطمة", "نورة", "سارة",
+               "ريم", "مريم", "هند", "عبدالرحمن", "تركي", "لمى", "جود", "ناصر", "منيرة", "سعود"]
+LAST_NAMES = ["السعيد", "الزهراني", "العتيبي", "القحطاني", "المطيري", "الدوسري", "الشمري",
+              "العنزي", "الحربي", "البقمي", "اليامي", "الغامدي", "الشهري", "السبيعي", "المالكي"]
+LATIN_NAMES = ["ahmed", "mohammed", "abdullah", "khalid", "fahad", "sultan", "yousef", "fatimah",
+               "noura", "sara", "reem", "maryam", "hind", "turki", "lama", "nasser", "saud"]
+EMAIL_DOMAINS = ["gmail.com", "hotmail.com", "outlook.com", "yahoo.com", "icloud.com"]
+
+REVIEW_PHRASES = {
+    "positive": [
+        "خدمة ممتازة وفريق عمل محترف جداً.", "التزموا بالمواعيد والنتيجة فاقت التوقعات.",
+        "جودة التشطيبات عالية والأسعار مناسبة.", "أنصح بالتعامل معهم بكل ثقة.",
+        "اهتمام رائع بالتفاصيل وتصاميم إبداعية.", "حولوا بيتي إلى تحفة فنية.",
+    ],
+    "neutral": [
+        "العمل جيد بشكل عام مع بعض التأخير.", "التصميم جميل لكن التواصل يحتاج تحسين.",
+        "النتيجة مقبولة والأسعار متوسطة.",
+    ],
+    "negative": [
+        "تأخروا كثيراً عن الموعد المتفق عليه.", "جودة التنفيذ لم تكن كما هو متوقع.",
+        "احتجنا لإعادة بعض الأعمال أكثر من مرة.",
+    ],
+}
+RATINGS = [5, 4, 3, 2, 1]
+RATING_WEIGHTS = [55, 28, 9, 4, 4]
+
+CONTACT_MESSAGES = [
+    "أرغب في تصميم ديكور داخلي لفيلا جديدة.", "أحتاج عرض سعر لتشطيب شقة.",
+    "نرغب في تجهيز مكتب الشركة بالكامل.", "هل تقدمون خدمة تنسيق الحدائق في نجران؟",
+    "أريد تجديد واجهة المنزل.", "I would like a quote for an office fit-out.",
+    "Please call me about a villa interior project.",
+]
+
+PROJECT_IMAGES = [
+    "https://i.ibb.co/vv1YCV0X/unnamed-13.webp", "https://i.ibb.co/K898SWs/2025-02-25-7.webp",
+    "https://i.ibb.co/4g8qr5gJ/unnamed-11.webp", "https://i.ibb.co/sLhjdXM/unnamed-12.webp",
+    "https://i.ibb.co/KzbyP5CZ/unnamed-10.webp", "https://i.ibb.co/KzfcCL55/2025-02-25-6.webp",
+    "https://i.ibb.co/xK3hkmQ4/2025-02-25-4.webp", "https://i.ibb.co/h11p2wmw/2025-02-25-5.webp",
+    "https://i.ibb.co/TMMJNSKP/unnamed-8.webp", "https://i.ibb.co/fVG1GK1Z/unnamed-9.webp",
+]
+
+
+def random_id(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def recent_date(rng: random.Random, mean_days: float, max_days: int) -> datetime:
+    """Dates skewed towards the present (exponential age)"""
+    age = min(rng.expovariate(1 / mean_days), max_days)
+    return REFERENCE_DATE - timedelta(days=age, seconds=rng.randint(0, 86399))
+
+
+def deactivated_at(rng: random.Random, created_at: datetime, is_active: bool) -> Optional[datetime]:
+    """When an inactive document was soft-deleted, some time after it was created"""
+    return None if is_active else created_at + (REFERENCE_DATE - created_at) * rng.random()
+
+
+def stored(model: Type[BaseModel], **fields) -> Dict:
+    """The document as the API writes it: every model field, keyed by its id in _id
+
+    Generated values are valid already, so they skip validation, which would
+    otherwise dominate (e-mail checks above all).
+    """
+    document = model.model_construct(**fields).model_dump()
+    document["_id"] = document.pop("id")
+    return document
+
+
+def make_project(rng: random.Random) -> Dict:
+    category_ar, category_en = rng.choices(PROJECT_CATEGORIES, PROJECT_CATEGORY_WEIGHTS)[0]
+    space_ar, space_en = rng.choice(SPACES)
+    style_ar, style_en = rng.choice(STYLES)
+    city_ar, city_en = rng.choices(CITIES, CITY_WEIGHTS)[0]
+    material_ar, material_en = rng.choice(MATERIALS)
+    created_at = recent_date(rng, 240, 1800)
+    is_active = rng.random() < 0.95
+    location = f"{city_ar}، المملكة العربية السعودية"
+    point = default_gazetteer().lookup(location)
+    return stored(
+        Project,
+        id=random_id(rng),
+        title=f"{space_ar} {style_ar} - {city_ar}",
+        title_en=f"{style_en.capitalize()} {space_en} - {city_en}",
+        description=f"تصميم وتنفيذ {space_ar} بطراز {style_ar} باستخدام {material_ar} في {city_ar}.",
+        description_en=f"Design and build of a {style_en} {space_en} using {material_en} in {city_en}.",
+        image_url=rng.choice(PROJECT_IMAGES),
+        category=category_ar,
+        location=location,
+        geo=GeoPoint(**point) if point else None,
+        completion_date=created_at - timedelta(days=rng.randint(7, 120)),
+        is_featured=rng.random() < 0.1,
+        is_active=is_active,
+        deactivated_at=deactivated_at(rng, created_at, is_active),
+        created_at=created_at,
+        updated_at=created_at,
+    )
+
+
+def make_review(rng: random.Random) -> Dict:
+    rating = rng.choices(RATINGS, RATING_WEIGHTS)[0]
+    tone = "positive" if rating >= 4 else "neutral" if rating == 3 else "negative"
+    phrases = rng.sample(REVIEW_PHRASES[tone], k=min(2, len(REVIEW_PHRASES[tone])))
+    date = recent_date(rng, 300, 2000)
+    is_active = rng.random() < 0.97
+    return stored(
+        Review,
+        id=random_id(rng),
+        name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        rating=rating,
+        text=" ".join(phrases),
+        date=date,
+        is_verified=rng.random() < 0.8,
+        is_active=is_active,
+        deactivated_at=deactivated_at(rng, date, is_active),
+        google_review_id=f"google_{random_id(rng)}" if rng.random() < 0.6 else None,
+    )
+
+
+def make_service(rng: random.Random) -> Dict:
+    name_ar, name_en = rng.choice(SERVICE_NAMES)
+    space_ar, space_en = rng.choice(SPACES)
+    created_at = recent_date(rng, 400, 1800)
+    is_active = rng.random() < 0.9
+    return stored(
+        Service,
+        id=random_id(rng),
+        title=f"{name_ar} {space_ar}",
+        title_en=f"{space_en.capitalize()} {name_en}",
+        description=f"نقدم خدمة {name_ar} {space_ar} بأعلى معايير الجودة وبأسعار تنافسية.",
+        description_en=f"We provide {space_en} {name_en.lower()} to the highest quality standards at competitive prices.",
+        icon=rng.choice(SERVICE_ICONS),
+        category=rng.choices(SERVICE_CATEGORIES, SERVICE_CATEGORY_WEIGHTS)[0],
+        is_active=is_active,
+        deactivated_at=deactivated_at(rng, created_at, is_active),
+        created_at=created_at,
+    )
+
+
+def make_contact_form(rng: random.Random) -> Dict:
+    created_at = recent_date(rng, 120, 1500)
+    age_days = (REFERENCE_DATE - created_at).days
+    # Older submissions have mostly been handled
+    if age_days > 60:
+        status = rng.choices(["pending", "contacted", "completed"], [2, 18, 80])[0]
+    elif age_days > 7:
+        status = rng.choices(["pending", "contacted", "completed"], [20, 50, 30])[0]
+    else:
+        status = rng.choices(["pending", "contacted", "completed"], [80, 18, 2])[0]
+    has_email = rng.random() < 0.6
+    return stored(
+        ContactForm,
+        id=random_id(rng),
+        name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        phone=f"+9665{rng.randint(0, 99999999):08d}",
+        email=f"{rng.choice(LATIN_NAMES)}{rng.randint(1, 9999)}@{rng.choice(EMAIL_DOMAINS)}" if has_email else None,
+        service=rng.choice(SERVICE_NAMES)[0] if rng.random() < 0.8 else None,
+        message=rng.choice(CONTACT_MESSAGES) if rng.random() < 0.7 else None,
+        created_at=created_at,
+        status=status,
+    )
+
+
+GENERATORS: Dict[str, Callable[[random.Random], Dict]] = {
+    "projects": make_project,
+    "reviews": make_review,
+    "services": make_service,
+    "contact_forms": make_contact_form,
+}
+
+
+def make_batch(collection: str, seed: int, batch_number: int, size: int) -> List[Dict]:
+    rng = random.Random(f"{seed}:{collection}:{batch_number}")
+    make = GENERATORS[collection]
+    return [make(rng) for _ in range(size)]
+
+
+async def insert_batches(collection: str, count: int, options: argparse.Namespace, worker: int) -> int:
+    """Insert this worker's share of batches with bounded concurrency"""
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+    db = client[os.environ.get('DB_NAME', 'alsawda_warehouses')]
+    semaphore = asyncio.Semaphore(options.concurrency)
+    batch_count = (count + options.batch_size - 1) // options.batch_size
+
+    async def insert(batch_number: int) -> int:
+        size = min(options.batch_size, count - batch_number * options.batch_size)
+        async with semaphore:
+            documents = make_batch(collection, options.seed, batch_number, size)
+            await db[collection].insert_many(documents, ordered=False)
+        return size
+
+    try:
+        sizes = await asyncio.gather(*(
+            insert(batch_number)
+            for batch_number in range(worker, batch_count, options.workers)
+        ))
+    finally:
+        client.close()
+    return sum(sizes)
+
+
+def run_worker(collection: str, count: int, options: argparse.Namespace, worker: int) -> int:
+    return asyncio.run(insert_batches(collection, count, options, worker))
+
+
+async def generate_synthetic(options: argparse.Namespace):
+    """Load synthetic collections using one process per worker"""
+    targets = {
+        "projects": options.projects,
+        "reviews": options.reviews,
+        "services": options.services,
+        "contact_forms": options.contact_forms,
+    }
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+    db = client[os.environ.get('DB_NAME', 'alsawda_warehouses')]
+
+    if options.drop:
+        for collection, count in targets.items():
+            if count:
+                await db[collection].drop()
+                print(f"🗑️  Dropped {collection}")
+
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=options.workers) as pool:
+        for collection, count in targets.items():
+            if not count:
+                continue
+            started = time.perf_counter()
+            inserted = await asyncio.gather(*(
+                loop.run_in_executor(pool, run_worker, collection, count, options, worker)
+                for worker in range(options.workers)
+            ))
+            elapsed = time.perf_counter() - started
+            print(f"🌱 Generated {sum(inserted)} {collection} in {elapsed:.1f}s "
+                  f"({sum(inserted) / max(elapsed, 1e-9):,.0f} docs/s)")
+
+    if options.drop:
+        # Dropping took the collections' indexes with them
+        await ensure_indexes(db)
+    await seed_data.update_statistics(db)
+    client.close()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate sample data for the Al-Sawda API")
+    parser.add_argument("--profile", choices=["seed", "synthetic"], default="synthetic")
+    parser.add_argument("--projects", type=int, default=0)
+    parser.add_argument("--reviews", type=int, default=0)
+    parser.add_argument("--services", type=int, default=0)
+    parser.add_argument("--contact-forms", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=42, help="RNG seed; same seed, same data")
+    parser.add_argument("--batch-size", type=int, default=2000, help="documents per insert_many")
+    parser.add_argument("--concurrency", type=int, default=4, help="in-flight batches per worker")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--drop", action="store_true", help="drop target collections first")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    if options.profile == "seed":
+        asyncio.run(seed_data.seed_database())
+    else:
+        asyncio.run(generate_synthetic(options))
@@ -0,0 +1,101 @@
+"""
+Response language negotiation.
+
+Models carry Arabic text in the base fields (`title`) and English in a
+paired `_en` field (`title_en`). A client asking for one language through
+`?lang=ar|en` or Accept-Language gets only that language, in the base field
+names, so it can read `title` either way. English falls back to the Arabic
+text when no translation exists. `lang=all`, or a request with no preference
+for either language, keeps both, as before.
+
+The shaping happens in the database projection, so unused-language text is
+never read off the wire. Localized responses also leave out bookkeeping
+fields (view counts, ranking scores, deletion times) that no page shows.
+"""
+
+from typing import Any, Dict, Optional, Type
+
+from fastapi import Header, Query, Response
+from pydantic import BaseModel
+
+LANGUAGES = ("ar", "en")
+ALL = "all"
+TRANSLATION_SUFFIX = "_en"
+# Internal fields kept out of localized responses
+INTERNAL_FIELDS = frozenset({"deactivated_at", "view_count", "popularity_log"})
+
+
+def negotiate_language(accept_language: Optional[str]) -> str:
+    """The preferred supported language in an Accept-Language header, else "all" """
+    if not accept_language:
+        return ALL
+    preferences = []
+    for position, part in enumerate(accept_language.split(",")):
+        tag, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        language = tag.strip().lower().split("-")[0]
+        if language in LANGUAGES and quality > 0:
+            # Higher quality first, then header order
+            preferences.append((-quality, position, language))
+    return min(preferences)[2] if preferences else ALL
+
+
+def get_language(
+    response: Response,
+    lang: Optional[str] = Query(None, pattern="^(ar|en|all)$", description="Response language"),
+    accept_language: Optional[str] = Header(None)
+) -> str:
+    """Dependency resolving the response language of a request"""
+    language = lang or negotiate_language(accept_language)
+    response.headers["Vary"] = "Accept-Language"
+    if language != ALL:
+        response.headers["Content-Language"] = language
+    return language
+
+
+def _translated_fields(model: Type[BaseModel]) -> Dict[str, str]:
+    """{base field: translation field} for every paired field of a model"""
+    fields = model.model_fields
+    return {
+        name: name + TRANSLATION_SUFFIX
+        for name in fields
+        if name + TRANSLATION_SUFFIX in fields
+    }
+
+
+def localized_fields(model: Type[BaseModel], language: str) -> Optional[Dict[str, Any]]:
+    """Repository projection returning `model` in one language (None for all)"""
+    if language == ALL:
+        return None
+    translated = _translated_fields(model)
+    translations = set(translated.values())
+    fields: Dict[str, Any] = {}
+    for name in model.model_fields:
+        if name == "id" or name in translations or name in INTERNAL_FIELDS:
+            continue
+        if name in translated and language == "en":
+            fields[name] = {"$ifNull": [f"${translated[name]}", f"${name}"]}
+        else:
+            fields[name] = 1
+    return fields
+
+
+def localize(document: Dict[str, Any], model: Type[BaseModel], language: str) -> Dict[str, Any]:
+    """Shape an already loaded document like `localized_fields` would"""
+    if language == ALL:
+        return document
+    translated = _translated_fields(model)
+    localized = {
+        k: v for k, v in document.items()
+        if k not in translated.values() and k not in INTERNAL_FIELDS
+    }
+    if language == "en":
+        for name, translation in translated.items():
+            if document.get(translation) is not None:
+                localized[name] = document[translation]
+    return localized
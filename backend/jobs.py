@@ -0,0 +1,91 @@
+"""
+The background jobs the API schedules at startup.
+"""
+
+import asyncio
+import os
+
+import archive
+import company_stats
+import migrations
+import popularity
+import publishing
+import related
+import resilience
+import review_sync
+import tenancy
+from cache import CACHE_TTL, cache
+from database import current_storage
+from routes.projects import project_category_facets
+from routes.services import service_category_facets
+from scheduler import CronTrigger, IntervalTrigger, Job, Scheduler
+from tenancy import for_each_tenant
+
+STATS_RECOMPUTE_INTERVAL = float(os.environ.get('STATS_RECOMPUTE_SECONDS', '900'))
+# Refresh a little before entries expire so readers never hit a cold cache
+CACHE_WARM_INTERVAL = float(os.environ.get('CACHE_WARM_SECONDS', str(CACHE_TTL * 0.8)))
+
+
+async def warm_caches():
+    """Reload the hottest cached reads before they expire"""
+    db = current_storage()
+    await asyncio.gather(
+        cache.refresh("projects", "popular", lambda: popularity.rank_projects(db)),
+        cache.refresh("projects", "facets", lambda: project_category_facets(db)),
+        cache.refresh("services", "facets", lambda: service_category_facets(db))
+    )
+
+
+def register_jobs(scheduler: Scheduler):
+    # Jobs over a site's data run once per tenant in multi-tenant mode
+    # Per-process state: every worker flushes its own
+    scheduler.add(Job(
+        "snapshot-flush", resilience.snapshots.flush,
+        IntervalTrigger(resilience.SNAPSHOT_FLUSH_INTERVAL), timeout=30
+    ))
+    scheduler.add(Job(
+        "view-flush", popularity.flush,
+        IntervalTrigger(popularity.FLUSH_INTERVAL), timeout=30
+    ))
+    scheduler.add(Job(
+        "cache-warm", for_each_tenant(warm_caches),
+        IntervalTrigger(CACHE_WARM_INTERVAL), timeout=30, jitter=5, run_at_start=True
+    ))
+    # Rebuilds what this worker's writes changed; the first run rebuilds everything
+    scheduler.add(Job(
+        "feeds-publish", for_each_tenant(publishing.publish_changes),
+        IntervalTrigger(publishing.PUBLISH_INTERVAL), timeout=300, run_at_start=True
+    ))
+    # Recomputes what this worker's writes changed; the full rebuild below takes a lease
+    scheduler.add(Job(
+        "related-projects", for_each_tenant(related.refresh_related),
+        IntervalTrigger(related.RELATED_INTERVAL), timeout=300
+    ))
+
+    # Shared data: one worker per occurrence
+    scheduler.add(Job(
+        "statistics-recompute", for_each_tenant(company_stats.recompute_statistics),
+        IntervalTrigger(STATS_RECOMPUTE_INTERVAL), timeout=60, jitter=30, exclusive=True, run_at_start=True
+    ))
+    scheduler.add(Job(
+        "related-projects-rebuild", for_each_tenant(related.rebuild_related),
+        IntervalTrigger(related.RELATED_FULL_REBUILD_INTERVAL), timeout=900, jitter=30, exclusive=True,
+        run_at_start=True
+    ))
+    if review_sync.REVIEW_SYNC_SOURCE or any(tenant.review_source for tenant in tenancy.tenants.values()):
+        scheduler.add(Job(
+            "review-sync", for_each_tenant(review_sync.sync_external_reviews),
+            IntervalTrigger(review_sync.REVIEW_SYNC_INTERVAL), timeout=300, jitter=30, exclusive=True, run_at_start=True
+        ))
+    # Spans every tenant; the runner holds its own lease, renewed every batch
+    if migrations.MIGRATIONS_AUTO:
+        scheduler.add(Job(
+            "migrations", migrations.run_pending_migrations,
+            IntervalTrigger(migrations.MIGRATION_CHECK_INTERVAL), timeout=migrations.MIGRATION_JOB_TIMEOUT,
+            jitter=30, run_at_start=True
+        ))
+    if archive.ARCHIVE_CRON:
+        scheduler.add(Job(
+            "archive", for_each_tenant(archive.archive_old_records),
+            CronTrigger(archive.ARCHIVE_CRON), timeout=3600, jitter=60, exclusive=True
+        ))
@@ -0,0 +1,196 @@
+"""
+Logging that stays off the event loop.
+
+`configure_logging()` gives the root logger a single handler that puts
+records on a bounded queue. A listener thread takes them off and does the
+formatting and the writes, so a slow stdout or log collector never stalls a
+request. When the queue is full, records are dropped and counted in
+`log_records_dropped_total` instead of blocking.
+
+Records are JSON lines when LOG_FORMAT=json (the default) and plain text
+otherwise. Records logged while handling a request carry its request id.
+
+`RequestLoggingMiddleware` assigns the request id and echoes it in
+X-Request-ID. It keeps a caller's id when one is sent. It also writes one
+access record per request with the route, status, latency and MongoDB time.
+Errors and slow requests are always logged. Other requests are sampled at
+ACCESS_LOG_SAMPLE_RATE.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+import metrics
+import monitoring
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', '0.1'))
+ACCESS_LOG_SLOW_MS = float(os.environ.get('ACCESS_LOG_SLOW_MS', '1000'))
+
+REQUEST_ID_HEADER = b"x-request-id"
+# Caller-supplied ids are kept only when they look like ids
+VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+records_dropped = metrics.Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+access_logger = logging.getLogger("access")
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the id of the request being handled"""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            records_dropped.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including `extra` fields"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in STANDARD_ATTRIBUTES and value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging():
+    """Route all logging through the queue and start the writer thread"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+    # Let uvicorn's own loggers go through the queue too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _incoming_request_id(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == REQUEST_ID_HEADER:
+            candidate = value.decode("latin-1")
+            return candidate if VALID_REQUEST_ID.match(candidate) else None
+    return None
+
+
+class RequestLoggingMiddleware:
+    """ASGI middleware assigning request ids and writing sampled access logs"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _incoming_request_id(scope) or uuid.uuid4().hex
+        token = _request_id.set(request_id)
+        status = {"code": 500}
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER, request_id.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            with monitoring.track_request() as stats:
+                await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if status["code"] >= 500 or duration_ms >= ACCESS_LOG_SLOW_MS or random.random() < ACCESS_LOG_SAMPLE_RATE:
+                route = scope.get("route")
+                access_logger.info(
+                    f"{scope['method']} {scope['path']} {status['code']}",
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "route": route.path if route else None,
+                        "tenant": scope.get("tenant"),
+                        "status": status["code"],
+                        "duration_ms": round(duration_ms, 2),
+                        "db_ms": round(stats.db_seconds * 1000, 2),
+                        "db_commands": stats.commands,
+                    }
+                )
+            _request_id.reset(token)
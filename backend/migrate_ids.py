@@ -0,0 +1,106 @@
+"""
+Online migration: make the model UUID the MongoDB _id.
+
+Documents written before this change carry an ObjectId _id plus a separate
+"id" field. Each document is re-keyed on its own: its copy keyed by "id" is
+written (replacing any copy an interrupted run left), then the ObjectId
+original is deleted only if it is still exactly as read. A write that lands
+on the original in between makes the delete miss, and the next pass copies
+the document again with the write included. A document without an "id" is
+first given one, so every pass copies it to the same _id.
+
+Until the last legacy document is gone, the Motor engine looks documents up
+by `_id` or `id` (see storage.py), so reads by id find both kinds.
+
+It is registered with the migration runner as 0001_model_ids (see
+migrations.py), which runs it online; by hand:
+    python migrate_ids.py [--batch-size 500] [--pause 0.05] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from storage import COLLECTIONS, LEGACY_IDS
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def rekey(collection, doc: Dict) -> bool:
+    """Move one legacy document to its UUID _id, returning False if it changed meanwhile"""
+    if not doc.get("id"):
+        # Fix the new _id on the original first, so a retry copies to the same key
+        await collection.update_one({"_id": doc["_id"], "id": None}, {"$set": {"id": str(uuid.uuid4())}})
+        return False
+    copy = {key: value for key, value in doc.items() if key not in ("_id", "id")}
+    await collection.replace_one({"_id": str(doc["id"])}, copy, upsert=True)
+    # Only an original nothing has written to since it was read may go
+    result = await collection.delete_one({"_id": doc["_id"], "$expr": {"$eq": ["$$ROOT", {"$literal": doc}]}})
+    return result.deleted_count == 1
+
+
+async def migrate_batch(collection, batch_size: int) -> Tuple[int, int]:
+    """Re-key up to `batch_size` legacy documents, returning how many were visited and moved"""
+    batch = await collection.find(LEGACY_IDS).limit(batch_size).to_list(length=batch_size)
+    moved = 0
+    for doc in batch:
+        moved += await rekey(collection, doc)
+    return len(batch), moved
+
+
+async def migrate_collection(collection, batch_size: int, pause: float, dry_run: bool) -> int:
+    """Re-key one collection in batches, returning the number of documents moved"""
+    if dry_run:
+        return await collection.count_documents(LEGACY_IDS)
+
+    moved = 0
+    while True:
+        visited, count = await migrate_batch(collection, batch_size)
+        if not visited:
+            break
+        moved += count
+        # Give production traffic room between batches
+        await asyncio.sleep(pause)
+    return moved
+
+
+async def drop_legacy_id_index(collection) -> List[str]:
+    """Drop the secondary index on "id", now covered by _id, returning what was dropped"""
+    dropped = []
+    for name, info in (await collection.index_information()).items():
+        if info["key"] == [("id", 1)]:
+            await collection.drop_index(name)
+            dropped.append(name)
+    return dropped
+
+
+async def migrate(options: argparse.Namespace):
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+    db = client[os.environ.get('DB_NAME', 'alsawda_warehouses')]
+
+    for name in COLLECTIONS:
+        moved = await migrate_collection(db[name], options.batch_size, options.pause, options.dry_run)
+        if options.dry_run:
+            print(f"🔎 {name}: {moved} documents to migrate")
+            continue
+        print(f"🔑 {name}: migrated {moved} documents")
+        for index in await drop_legacy_id_index(db[name]):
+            print(f"🗑️  Dropped {name}.{index}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Use the model UUID as MongoDB _id")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between batches")
+    parser.add_argument("--dry-run", action="store_true", help="only count documents to migrate")
+    asyncio.run(migrate(parser.parse_args()))
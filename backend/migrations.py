@@ -0,0 +1,416 @@
+"""
+Versioned online migrations.
+
+MIGRATIONS lists every schema change that needs existing documents
+rewritten, named so they sort in the order they apply ("0003_..."). The
+runner applies those not done yet, oldest first, and records each one's
+progress in the `migrations` collection; a migration that fails stops the
+ones after it.
+
+A `Backfill` walks one collection in _id order, in batches read with one
+range query and written with one bulk_write, and saves the last _id after
+every batch, so an interrupted or failed run resumes where it stopped.
+After each batch the runner pauses. When a batch spends more than
+MIGRATION_TARGET_BATCH_MS in the database (as measured by the command
+accounting in monitoring.py), the next batches are halved and the pauses
+doubled, up to MIGRATION_MAX_PAUSE_SECONDS; while the database keeps up they
+grow back. A backfill therefore yields to production traffic when the
+database is busy.
+
+A dry run goes through the same batches without writing, recording what it
+would change separately from the real run.
+
+One worker runs migrations at a time, holding the "migrations" lease in
+scheduler_leases. With MIGRATIONS_AUTO=on (the default) the API checks for
+pending migrations every MIGRATION_CHECK_SECONDS; GET /api/migrations shows
+progress and POST /api/migrations[?dry_run=true] starts a run. By hand:
+    python migrations.py status
+    python migrations.py run [--dry-run] [--only NAME ...]
+"""
+
+import argparse
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import metrics
+from cache import cache
+from database import database
+from gazetteer import default_gazetteer
+from migrate_ids import drop_legacy_id_index, migrate_batch
+from models import MigrationProgress, MigrationRecord
+from monitoring import command_listener, track_request
+from scheduler import acquire_lease, release_lease
+from storage import COLLECTIONS, LEGACY_IDS, Fields, Filter, MemoryRepository, MotorRepository, Repository, motor_storage
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_AUTO = os.environ.get('MIGRATIONS_AUTO', 'on') == 'on'
+MIGRATION_CHECK_INTERVAL = float(os.environ.get('MIGRATION_CHECK_SECONDS', '600'))
+MIGRATION_JOB_TIMEOUT = float(os.environ.get('MIGRATION_JOB_TIMEOUT_SECONDS', '3600'))
+MIGRATION_BATCH_SIZE = int(os.environ.get('MIGRATION_BATCH_SIZE', '500'))
+MIGRATION_MIN_BATCH_SIZE = int(os.environ.get('MIGRATION_MIN_BATCH_SIZE', '25'))
+MIGRATION_TARGET_BATCH_SECONDS = float(os.environ.get('MIGRATION_TARGET_BATCH_MS', '200')) / 1000
+MIGRATION_MIN_PAUSE = float(os.environ.get('MIGRATION_MIN_PAUSE_SECONDS', '0.05'))
+MIGRATION_MAX_PAUSE = float(os.environ.get('MIGRATION_MAX_PAUSE_SECONDS', '5'))
+MIGRATION_LEASE_SECONDS = float(os.environ.get('MIGRATION_LEASE_SECONDS', '120'))
+
+MIGRATIONS_COLLECTION = "migrations"
+LEASE_NAME = "migrations"
+
+documents = metrics.Counter("migration_documents_total", "Documents visited by migrations, by migration and outcome (scanned, changed)")
+
+
+class LeaseLost(Exception):
+    """Another worker took over the migrations"""
+
+
+class Throttle:
+    """Sizes batches and the pauses between them by the database time each batch takes"""
+
+    def __init__(self, batch_size: int = MIGRATION_BATCH_SIZE):
+        self.max_batch_size = batch_size
+        self.batch_size = batch_size
+        self.pause = MIGRATION_MIN_PAUSE
+
+    def observe(self, db_seconds: float):
+        if db_seconds > MIGRATION_TARGET_BATCH_SECONDS:
+            self.batch_size = max(MIGRATION_MIN_BATCH_SIZE, self.batch_size // 2)
+            self.pause = min(MIGRATION_MAX_PAUSE, max(self.pause * 2, 0.1))
+        else:
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+            self.pause = max(MIGRATION_MIN_PAUSE, self.pause / 2)
+
+
+class Run:
+    """One run of a migration: where it is, and the pacing of its batches"""
+
+    def __init__(self, log: Repository, name: str, dry_run: bool, progress: Dict, throttle: Throttle, owner: str):
+        self.log = log
+        self.name = name
+        self.dry_run = dry_run
+        self.progress = progress
+        self.throttle = throttle
+        self.owner = owner
+        self.field = "dry_run" if dry_run else "run"
+
+    @property
+    def batch_size(self) -> int:
+        return self.throttle.batch_size
+
+    def cursor(self, collection: str) -> Optional[str]:
+        return self.progress["cursors"].get(collection)
+
+    async def save(self):
+        await self.log.update_one({"id": self.name}, {"$set": {
+            self.field: self.progress,
+            "batch_size": self.throttle.batch_size,
+            "pause_seconds": self.throttle.pause,
+            "updated_at": datetime.utcnow(),
+        }}, upsert=True)
+
+    async def advance(self, collection: str, cursor: Optional[str], scanned: int, changed: int, db_seconds: float):
+        """Record a finished batch, then pause before the next"""
+        if cursor is not None:
+            self.progress["cursors"][collection] = cursor
+        self.progress["scanned"] += scanned
+        self.progress["changed"] += changed
+        documents.inc(scanned, migration=self.name, outcome="scanned")
+        documents.inc(changed, migration=self.name, outcome="changed")
+        self.throttle.observe(db_seconds)
+        await self.save()
+        if not await acquire_lease(LEASE_NAME, self.owner, MIGRATION_LEASE_SECONDS):
+            raise LeaseLost(f"Lost the {LEASE_NAME} lease")
+        await asyncio.sleep(self.throttle.pause)
+
+
+class Migration(ABC):
+    name: str
+    description: str
+
+    @abstractmethod
+    async def remaining(self, run: Run) -> int:
+        """Documents still to visit from where `run` stands"""
+
+    @abstractmethod
+    async def apply(self, run: Run):
+        """Rewrite the documents in batches, calling `run.advance` after each"""
+
+
+class Backfill(Migration):
+    """Sets fields computed by `transform` on the documents matching `filter`
+
+    `transform` returns the fields to set, or None to leave a document alone.
+    Documents written by the current code should already have the fields,
+    so the filter only matches older ones.
+    """
+
+    def __init__(self, name: str, description: str, collection: str, filter: Filter,
+                 transform: Callable[[Dict], Optional[Dict]], fields: Optional[Fields] = None):
+        self.name = name
+        self.description = description
+        self.collection = collection
+        self.filter = filter
+        self.transform = transform
+        # Fields `transform` reads, when not all in the collection's model
+        self.fields = fields
+
+    def _after(self, cursor: Optional[str]) -> Filter:
+        return {**self.filter, "id": {"$gt": cursor}} if cursor else self.filter
+
+    async def write(self, repository: Repository, updates: Dict[str, Dict]):
+        await repository.set_many(updates)
+
+    async def remaining(self, run):
+        return await database.storage[self.collection].count(self._after(run.cursor(self.collection)))
+
+    async def apply(self, run):
+        repository = database.storage[self.collection]
+        while True:
+            with track_request() as stats:
+                batch = await repository.find_many(
+                    self._after(run.cursor(self.collection)), [("id", 1)], limit=run.batch_size, fields=self.fields
+                )
+                if not batch:
+                    break
+                updates = {}
+                for doc in batch:
+                    fields = self.transform(doc)
+                    if fields:
+                        updates[doc["id"]] = fields
+                if updates and not run.dry_run:
+                    await self.write(repository, updates)
+            await run.advance(self.collection, batch[-1]["id"], len(batch), len(updates), stats.db_seconds)
+
+
+class ModelIds(Migration):
+    """Re-keys documents from ObjectId _ids to the model UUID (see migrate_ids.py)"""
+
+    name = "0001_model_ids"
+    description = "Use the model UUID as MongoDB _id and drop the index on id"
+
+    async def remaining(self, run):
+        if database.database is None:
+            return 0
+        return sum([await database.database[name].count_documents(LEGACY_IDS) for name in COLLECTIONS])
+
+    async def apply(self, run):
+        # The memory engine has always keyed documents by id
+        if database.database is None:
+            return
+        for name in COLLECTIONS:
+            collection = database.database[name]
+            if run.dry_run:
+                count = await collection.count_documents(LEGACY_IDS)
+                await run.advance(name, None, count, count, 0)
+                continue
+            while True:
+                with track_request() as stats:
+                    visited, moved = await migrate_batch(collection, run.batch_size)
+                if not visited:
+                    break
+                await run.advance(name, None, visited, moved, stats.db_seconds)
+            # Every document is keyed by its UUID now; lookups can stop trying `id`
+            database.storage[name].legacy_ids = False
+            for index in await drop_legacy_id_index(collection):
+                logger.info(f"Dropped {name}.{index}")
+
+
+class PopularityLog(Backfill):
+    """Folds linear `popularity` scores into `popularity_log` (see popularity.py)"""
+
+    def __init__(self):
+        super().__init__(
+            "0004_popularity_log", "Move project popularity scores to log space",
+            "projects", {"popularity": {"$gt": 0}}, lambda project: {"popularity": project["popularity"]},
+            fields={"popularity": 1}
+        )
+
+    async def write(self, repository, updates):
+        # One atomic update per project: views flushed since the deploy already
+        # went to popularity_log, and a resumed batch finds popularity at 0
+        await repository.increment_many(
+            {project_id: {"popularity": -fields["popularity"]} for project_id, fields in updates.items()},
+            {project_id: {"popularity_log": math.log(fields["popularity"])} for project_id, fields in updates.items()}
+        )
+
+
+def _project_coordinates(project: Dict) -> Optional[Dict]:
+    point = default_gazetteer().lookup(project.get("location"))
+    return {"geo": point} if point else None
+
+
+def _project_updated_at(project: Dict) -> Dict:
+    return {"updated_at": project.get("created_at") or datetime.utcnow()}
+
+
+MIGRATIONS: List[Migration] = [
+    ModelIds(),
+    Backfill(
+        "0002_project_coordinates", "Geocode project locations from the gazetteer (see gazetteer.py)",
+        "projects", {"geo": None, "location": {"$ne": None}}, _project_coordinates
+    ),
+    Backfill(
+        "0003_project_updated_at", "Give projects written before updated_at existed their created_at",
+        "projects", {"updated_at": None}, _project_updated_at
+    ),
+    PopularityLog(),
+]
+
+
+def migration_log() -> Repository:
+    if database.database is None:
+        return _memory_log
+    return MotorRepository(database.database[MIGRATIONS_COLLECTION], MigrationRecord)
+
+
+_memory_log = MemoryRepository(MigrationRecord)
+
+
+class MigrationRunner:
+    def __init__(self, migrations: List[Migration]):
+        self.migrations = migrations
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._task: Optional[asyncio.Task] = None
+
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def status(self) -> List[Dict]:
+        """Every migration with its recorded progress, in order"""
+        records = {record["id"]: record for record in await migration_log().find_many({})}
+        return [
+            {**MigrationRecord(id=migration.name, description=migration.description).dict(),
+             **records.get(migration.name, {}), "description": migration.description}
+            for migration in self.migrations
+        ]
+
+    async def run_pending(self, dry_run: bool = False, only: Optional[List[str]] = None) -> Dict[str, str]:
+        """Apply (or dry-run) the migrations not done yet, returning each one's outcome"""
+        if not await acquire_lease(LEASE_NAME, self.owner, MIGRATION_LEASE_SECONDS):
+            logger.info("Migrations are running on another worker")
+            return {}
+        log = migration_log()
+        outcomes = {}
+        throttle = Throttle()
+        try:
+            for migration in self.migrations:
+                if only and migration.name not in only:
+                    continue
+                record = await log.find_one({"id": migration.name}) or {}
+                if record.get("run", {}).get("status") == "done":
+                    continue
+                outcomes[migration.name] = await self._run(log, migration, record, dry_run, throttle)
+                if outcomes[migration.name] != "done" and not dry_run:
+                    # Later migrations may depend on this one
+                    break
+        finally:
+            await release_lease(LEASE_NAME, self.owner)
+        return outcomes
+
+    async def _run(self, log: Repository, migration: Migration, record: Dict, dry_run: bool, throttle: Throttle) -> str:
+        progress = record.get("run") if not dry_run else None
+        if not progress or progress["status"] == "pending":
+            progress = MigrationProgress().dict()
+        # A resumed run keeps its counts and cursors
+        progress.update(status="running", error=None, finished_at=None, started_at=progress["started_at"] or datetime.utcnow())
+        run = Run(log, migration.name, dry_run, progress, throttle, self.owner)
+        await log.update_one(
+            {"id": migration.name}, {"$set": {"description": migration.description}}, upsert=True
+        )
+        progress["total"] = progress["scanned"] + await migration.remaining(run)
+        await run.save()
+
+        started = time.perf_counter()
+        try:
+            await migration.apply(run)
+            progress["status"] = "done"
+        except (asyncio.CancelledError, LeaseLost):
+            progress["status"] = "interrupted"
+            await run.save()
+            raise
+        except Exception as e:
+            progress["status"] = "failed"
+            progress["error"] = repr(e)
+            logger.error(f"Migration {migration.name} failed: {e!r}")
+        finally:
+            progress["finished_at"] = datetime.utcnow()
+        await run.save()
+
+        if progress["changed"] and not dry_run:
+            # The reads cached before the migration are now stale
+            cache.clear()
+        verb = "Dry-ran" if dry_run else "Ran"
+        logger.info(f"{verb} migration {migration.name} in {time.perf_counter() - started:.1f}s: {progress['status']}, "
+                    f"{progress['changed']} of {progress['scanned']} documents changed")
+        return progress["status"]
+
+    def start(self, dry_run: bool = False) -> bool:
+        """Run the pending migrations in the background, unless already running here"""
+        if self.running():
+            return False
+        # A fresh context: migrations span tenants and outlive the request starting them
+        self._task = asyncio.create_task(self.run_pending(dry_run), name="migrations", context=contextvars.Context())
+        return True
+
+
+runner = MigrationRunner(MIGRATIONS)
+
+
+async def run_pending_migrations():
+    """Scheduler job: apply the migrations not done yet"""
+    await runner.run_pending()
+
+
+def print_status(records: List[Dict]):
+    for record in records:
+        progress = record["run"]
+        total = f"/{progress['total']}" if progress.get("total") is not None else ""
+        print(f"{'✅' if progress['status'] == 'done' else '⏳'} {record['id']}: {progress['status']}, "
+              f"{progress['changed']} changed, {progress['scanned']}{total} scanned")
+        if record.get("dry_run"):
+            plan = record["dry_run"]
+            print(f"   🔎 dry run: {plan['changed']} of {plan['scanned']} would change ({plan['status']})")
+        if progress.get("error"):
+            print(f"   ❌ {progress['error']}")
+
+
+async def main(options: argparse.Namespace):
+    database.client = AsyncIOMotorClient(os.environ.get('MONGO_URL'), event_listeners=[command_listener])
+    database.database = database.client[os.environ.get('DB_NAME', 'alsawda_warehouses')]
+    database.storage = motor_storage(database.database)
+
+    if options.command == "run":
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        outcomes = await runner.run_pending(options.dry_run, options.only)
+        if not outcomes:
+            print("✅ Nothing to migrate")
+    print_status(await runner.status())
+
+    database.client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply versioned data migrations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="show each migration's progress")
+    run_parser = commands.add_parser("run", help="apply the migrations not done yet")
+    run_parser.add_argument("--dry-run", action="store_true", help="only count what would change")
+    run_parser.add_argument("--only", nargs="+", metavar="NAME", help="run just these migrations")
+    asyncio.run(main(parser.parse_args()))
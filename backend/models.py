@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, Tuple, Literal, Annotated
 from datetime import datetime
 import uuid
 
@@ -31,6 +31,7 @@ class Service(BaseModel):
     icon: str
     category: str
     is_active: bool = True
+    deactivated_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class ServiceCreate(BaseModel):
@@ -41,6 +42,11 @@ class ServiceCreate(BaseModel):
     icon: str
     category: str
 
+# GeoJSON point, [longitude, latitude] as in MongoDB
+class GeoPoint(BaseModel):
+    type: Literal["Point"] = "Point"
+    coordinates: Tuple[Annotated[float, Field(ge=-180, le=180)], Annotated[float, Field(ge=-90, le=90)]]
+
 # Project/Gallery Models
 class Project(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -51,10 +57,16 @@ class Project(BaseModel):
     image_url: str
     category: str
     location: Optional[str] = None
+    geo: Optional[GeoPoint] = None
     completion_date: Optional[datetime] = None
     is_featured: bool = False
     is_active: bool = True
+    deactivated_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Older projects get theirs from the project-updated-at migration
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    view_count: int = 0
+    popularity_log: Optional[float] = None  # log of the time-decayed view score, see popularity.py
 
 class ProjectCreate(BaseModel):
     title: str
@@ -64,6 +76,7 @@ class ProjectCreate(BaseModel):
     image_url: str
     category: str
     location: Optional[str] = None
+    geo: Optional[GeoPoint] = None
     completion_date: Optional[datetime] = None
     is_featured: bool = False
 
@@ -76,6 +89,7 @@ class Review(BaseModel):
     date: datetime = Field(default_factory=datetime.utcnow)
     is_verified: bool = True
     is_active: bool = True
+    deactivated_at: Optional[datetime] = None
     google_review_id: Optional[str] = None
 
 class ReviewCreate(BaseModel):
@@ -141,6 +155,15 @@ class Statistics(BaseModel):
     happy_clients: int = 0
     years_experience: int = 0
     team_members: int = 0
+    # Live counts kept current by the write paths and the recount job (see company_stats.py)
+    active_projects: int = 0
+    active_reviews: int = 0
+    # Sum of the active reviews' ratings, for the company's average rating
+    active_rating_total: int = 0
+    # Where the external review sync resumes (see review_sync.py)
+    review_sync_cursor: Optional[str] = None
+    # Figures set by an admin, shown instead of the computed ones
+    overrides: Dict[str, int] = Field(default_factory=dict)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class StatisticsUpdate(BaseModel):
@@ -149,6 +172,38 @@ class StatisticsUpdate(BaseModel):
     years_experience: Optional[int] = None
     team_members: Optional[int] = None
 
+# Migration Models
+class MigrationProgress(BaseModel):
+    status: str = "pending"  # pending, running, interrupted, failed, done
+    scanned: int = 0
+    changed: int = 0
+    total: Optional[int] = None  # documents to visit, counted when the run starts
+    # Last id visited per collection, where an interrupted run resumes
+    cursors: Dict[str, str] = Field(default_factory=dict)
+    error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class MigrationRecord(BaseModel):
+    id: str  # the migration's name, e.g. "0003_project_updated_at"
+    description: str = ""
+    run: MigrationProgress = Field(default_factory=MigrationProgress)
+    # The last dry run, which changes nothing and never resumes
+    dry_run: Optional[MigrationProgress] = None
+    batch_size: Optional[int] = None
+    pause_seconds: float = 0.0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Batch Models
+class BatchSubRequest(BaseModel):
+    id: Optional[str] = None  # echoed back to match responses to requests
+    method: str = "GET"
+    path: str
+    params: Dict[str, Any] = {}
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest]
+
 # API Response Models
 class APIResponse(BaseModel):
     success: bool
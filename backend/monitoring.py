@@ -0,0 +1,77 @@
+"""
+Per-request MongoDB command accounting.
+
+`command_listener` is registered on the Motor client. Motor runs each
+operation in an executor thread with a copy of the caller's context, so the
+listener can find the stats object of the request that issued the command
+and add to it. Commands sent outside a tracked request are not counted.
+Tracking blocks nest: a command counts towards every enclosing block, so the
+access log and the profiler both see it.
+
+`track_request(record=True)` also keeps each command document, which the
+query audit (query_audit.py) explains after the request.
+"""
+
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo import monitoring
+
+
+@dataclass
+class RequestStats:
+    commands: int = 0
+    failed_commands: int = 0
+    db_seconds: float = 0.0
+    recorded: Optional[List[Dict[str, Any]]] = None
+    parent: Optional["RequestStats"] = None
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """Stats of the request being handled, if it is tracked"""
+    return _current.get()
+
+
+@contextmanager
+def track_request(record: bool = False) -> Iterator[RequestStats]:
+    """Count (and optionally record) the MongoDB commands issued inside the block"""
+    stats = RequestStats(recorded=[] if record else None, parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+class CommandListener(monitoring.CommandListener):
+    def started(self, event):
+        stats = _current.get()
+        if stats is not None and stats.recorded is not None:
+            stats.recorded.append({
+                "name": event.command_name,
+                "database": event.database_name,
+                "command": dict(event.command),
+            })
+
+    def succeeded(self, event):
+        stats = _current.get()
+        while stats is not None:
+            stats.commands += 1
+            stats.db_seconds += event.duration_micros / 1_000_000
+            stats = stats.parent
+
+    def failed(self, event):
+        stats = _current.get()
+        while stats is not None:
+            stats.commands += 1
+            stats.failed_commands += 1
+            stats.db_seconds += event.duration_micros / 1_000_000
+            stats = stats.parent
+
+
+command_listener = CommandListener()
@@ -0,0 +1,138 @@
+"""
+Buffered project view counters and the popularity-ranked featured gallery.
+
+View beacons only bump in-memory counters. A scheduler job periodically
+drains them and writes every pending count in one bulk `$inc`, so traffic
+costs one write per flush rather than one per view.
+
+Popularity is a time-decayed view count with a configurable half-life.
+Instead of decaying every stored score, each view is weighted by
+exp(rate * (t - epoch)); ordering by the accumulated sum is then the same as
+ordering by the decayed score. Those weights double every half-life without
+bound, so projects store the sum's logarithm in `popularity_log`, and each
+flush adds to it in log space (`increment_many`'s log increments), which
+grows only linearly with time.
+Project ids are unique across tenants, so one flush writes every tenant's
+views and then refreshes the rankings of the tenants that had any.
+"""
+
+import logging
+import math
+import os
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+import tenancy
+from cache import cache
+from database import current_storage, database
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+HALF_LIFE_DAYS = float(os.environ.get('POPULARITY_HALF_LIFE_DAYS', '7'))
+FLUSH_INTERVAL = float(os.environ.get('VIEW_FLUSH_SECONDS', '10'))
+COUNTER_SHARDS = int(os.environ.get('VIEW_COUNTER_SHARDS', '16'))
+MAX_PENDING_PROJECTS = int(os.environ.get('VIEW_MAX_PENDING_PROJECTS', '10000'))
+TOP_N = 20
+
+DECAY_RATE = math.log(2) / (HALF_LIFE_DAYS * 86400)
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+def log_view_weight(at: float) -> float:
+    """Logarithm of the weight of one view recorded at unix time `at`"""
+    return DECAY_RATE * (at - EPOCH)
+
+
+class ViewCounters:
+    """Pending view counts, sharded by project id"""
+
+    def __init__(self, shards: int):
+        self._shards: List[Dict[str, int]] = [defaultdict(int) for _ in range(shards)]
+        self._pending = 0
+        self.tenants: Set[Optional[tenancy.Tenant]] = set()
+
+    def record(self, project_id: str, views: int = 1):
+        shard = self._shards[zlib.crc32(project_id.encode()) % len(self._shards)]
+        if project_id not in shard:
+            # Unknown ids cost nothing at flush time, but bound the memory they can take
+            if self._pending >= MAX_PENDING_PROJECTS:
+                return
+            self._pending += 1
+        shard[project_id] += views
+        self.tenants.add(tenancy.current_tenant())
+
+    def drain(self) -> Dict[str, int]:
+        """Take every pending count, leaving the counters empty"""
+        drained: Dict[str, int] = {}
+        for index, shard in enumerate(self._shards):
+            self._shards[index] = defaultdict(int)
+            drained.update(shard)
+        self._pending = 0
+        return drained
+
+    def restore(self, counts: Dict[str, int]):
+        """Put back counts whose flush failed"""
+        for project_id, views in counts.items():
+            self.record(project_id, views)
+
+
+view_counters = ViewCounters(COUNTER_SHARDS)
+
+
+async def rank_projects(db: Storage) -> List[Dict]:
+    """Top projects by popularity, topped up with hand-featured ones"""
+    ranked = await db.projects.find_many(
+        {"is_active": True, "popularity_log": {"$ne": None}},
+        [("popularity_log", -1)],
+        limit=TOP_N
+    )
+    if len(ranked) < TOP_N:
+        featured = await db.projects.find_many(
+            {"is_active": True, "is_featured": True},
+            [("created_at", -1)],
+            limit=TOP_N
+        )
+        seen = {project["id"] for project in ranked}
+        ranked += [project for project in featured if project["id"] not in seen][:TOP_N - len(ranked)]
+    return ranked
+
+
+async def top_projects(db: Storage) -> List[Dict]:
+    """Precomputed top-N list, rebuilt after flushes and project writes"""
+    return await cache.get_or_load("projects", "popular", lambda: rank_projects(db))
+
+
+async def flush():
+    """Write pending views with one bulk $inc and refresh the ranking"""
+    pending = view_counters.drain()
+    if not pending:
+        return
+    tenants, view_counters.tenants = view_counters.tenants, set()
+    log_weight = log_view_weight(time.time())
+    increments = {project_id: {"view_count": views} for project_id, views in pending.items()}
+    log_increments = {
+        project_id: {"popularity_log": math.log(views) + log_weight}
+        for project_id, views in pending.items()
+    }
+    try:
+        await database.storage.projects.increment_many(increments, log_increments)
+    except Exception:
+        view_counters.restore(pending)
+        view_counters.tenants |= tenants
+        raise
+    for tenant in tenants:
+        with tenancy.use_tenant(tenant):
+            db = current_storage()
+            await cache.refresh("projects", "popular", lambda: rank_projects(db))
+
+
+async def stop():
+    """Write what is still pending (the scheduler flushes periodically)"""
+    try:
+        await flush()
+    except Exception as e:
+        logger.warning(f"Could not flush project views: {e!r}")
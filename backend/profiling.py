@@ -0,0 +1,159 @@
+"""
+On-demand request profiling.
+
+A request is profiled when it carries a valid signed X-Profile header or is
+picked by 1-in-PROFILE_SAMPLE_RATE sampling. With no PROFILE_SECRET and no
+sampling, the middleware passes requests straight through.
+
+The profile goes to PROFILE_DIR. It is a speedscope file when pyinstrument
+is installed and a cProfile .prof file otherwise. Next to it, a .json file
+records the route, status, wall and CPU time, and the MongoDB command count
+and time. CPU time is that of the event loop thread, so it includes requests
+that ran concurrently. Only one request is profiled at a time; requests
+arriving meanwhile run unprofiled.
+
+Signed headers cover the request path and an expiry time:
+    python profiling.py sign /api/projects/featured [--ttl 300]
+"""
+
+import argparse
+import asyncio
+import cProfile
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+import monitoring
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:
+    Profiler = None
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SECRET = os.environ.get('PROFILE_SECRET', '')
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', ROOT_DIR / 'profiles'))
+
+PROFILE_HEADER = b"x-profile"
+
+
+class _CProfile(cProfile.Profile):
+    """cProfile with pyinstrument's start/stop names"""
+    start = cProfile.Profile.enable
+    stop = cProfile.Profile.disable
+
+
+def sign(path: str, expires: int, secret: str = PROFILE_SECRET) -> str:
+    """X-Profile header value allowing `path` to be profiled until `expires`"""
+    signature = hmac.new(secret.encode(), f"{expires}:{path}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}:{signature}"
+
+
+def is_valid_signature(value: str, path: str) -> bool:
+    expires, _, _ = value.partition(":")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(value, sign(path, int(expires)))
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles signed or sampled requests"""
+
+    def __init__(self, app):
+        self.app = app
+        self.enabled = bool(PROFILE_SECRET) or PROFILE_SAMPLE_RATE > 0
+        self._requests = itertools.count(1)
+        self._busy = False
+
+    def _wants_profile(self, scope) -> bool:
+        if PROFILE_SAMPLE_RATE > 0 and next(self._requests) % PROFILE_SAMPLE_RATE == 0:
+            return True
+        if PROFILE_SECRET:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return is_valid_signature(value.decode("latin-1"), scope["path"])
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or self._busy or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._busy = True
+        status = {}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        profiler = Profiler(interval=0.001, async_mode="enabled") if Profiler else _CProfile()
+        started_at = datetime.utcnow()
+        wall_started, cpu_started = time.perf_counter(), time.thread_time()
+        try:
+            with monitoring.track_request() as stats:
+                profiler.start()
+                try:
+                    await self.app(scope, receive, send_with_status)
+                finally:
+                    profiler.stop()
+        finally:
+            self._busy = False
+
+        route = scope.get("route")
+        metadata = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": route.path if route else None,
+            "status": status.get("code"),
+            "started_at": started_at.isoformat(),
+            "wall_seconds": round(time.perf_counter() - wall_started, 6),
+            "cpu_seconds": round(time.thread_time() - cpu_started, 6),
+            "mongo_commands": stats.commands,
+            "mongo_seconds": round(stats.db_seconds, 6),
+            "profiler": "pyinstrument" if Profiler else "cProfile",
+        }
+        try:
+            await asyncio.to_thread(_write_profile, profiler, metadata)
+        except Exception as e:
+            logger.warning(f"Could not write profile: {e!r}")
+
+
+def _write_profile(profiler, metadata: dict):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", metadata["route"] or metadata["path"]).strip("_") or "root"
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{metadata['method']}-{slug}"
+    if Profiler:
+        (PROFILE_DIR / f"{name}.speedscope.json").write_text(profiler.output(SpeedscopeRenderer()))
+    else:
+        profiler.dump_stats(PROFILE_DIR / f"{name}.prof")
+    (PROFILE_DIR / f"{name}.json").write_text(json.dumps(metadata, indent=2))
+    logger.info(f"Profiled {metadata['method']} {metadata['path']} -> {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create signed X-Profile header values")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sign_parser = commands.add_parser("sign", help="sign a request path")
+    sign_parser.add_argument("path", help="request path, e.g. /api/projects/featured")
+    sign_parser.add_argument("--ttl", type=int, default=300, help="seconds the header stays valid")
+    options = parser.parse_args()
+    if not PROFILE_SECRET:
+        raise SystemExit("PROFILE_SECRET is not set")
+    print(f"X-Profile: {sign(options.path, int(time.time()) + options.ttl)}")
@@ -0,0 +1,363 @@
+"""
+Sitemaps and feeds published as static files.
+
+Crawlers read files from PUBLISH_DIR, served at /api/published/ with ETags,
+instead of paging through the list endpoints:
+
+    sitemap.xml                  sitemap index
+    sitemaps/pages.xml           the site's home page
+    sitemaps/projects-<n>.xml    active projects, sharded
+    sitemaps/services-<n>.xml    active services, sharded
+    feeds/projects.rss|json      newest projects (RSS 2.0 and JSON Feed)
+    feeds/reviews.rss|json       newest reviews
+
+Documents are sharded by a hash of their id, so shards stay even whatever
+the ids look like. Shards aim for SITEMAP_SHARD_TARGET URLs, which leaves
+room below the 50,000 URL limit. A shard's lastmod in the index is the
+latest `updated_at` (or `created_at`) among its documents, or the latest
+removal from it, so it only moves when the shard's content does. Writing
+any shard reads the ids and dates of the whole collection in one query.
+
+Write routes mark what changed, and the feeds-publish job rebuilds only
+those shards and feeds. When a collection outgrows its shard count, its
+sitemap is rebuilt in full. The first run after startup rebuilds everything.
+
+In multi-tenant mode each tenant's files go to PUBLISH_DIR/<tenant>, with
+its own site URL and name, and requests for /api/published/ are served
+from the requesting tenant's directory. Links to published files keep the
+/t/<tenant> prefix with TENANCY=path.
+
+Build by hand:
+    python publishing.py
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+from xml.sax.saxutils import escape
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import tenancy
+from database import current_storage
+from storage import Storage, motor_storage
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_DIR = Path(os.environ.get('PUBLISH_DIR', ROOT_DIR / 'published'))
+PUBLISH_INTERVAL = float(os.environ.get('FEEDS_PUBLISH_SECONDS', '60'))
+SITE_URL = os.environ.get('SITE_URL', 'https://alsawda-warehouses.sa').rstrip('/')
+SITE_NAME = os.environ.get('SITE_NAME', 'شركة المستودعات السوداء المحدودة')
+# Pages of the site for each document; the site is a single page for now
+PAGE_PATHS = {
+    "projects": os.environ.get('SITEMAP_PROJECT_PATH', '/?project={id}#gallery'),
+    "services": os.environ.get('SITEMAP_SERVICE_PATH', '/?service={id}#services'),
+}
+SITEMAP_MAX_URLS = 50000
+SITEMAP_SHARD_TARGET = int(os.environ.get('SITEMAP_SHARD_TARGET', '40000'))
+FEED_SIZE = int(os.environ.get('FEED_SIZE', '50'))
+
+SITEMAP_COLLECTIONS = ("projects", "services")
+FEED_COLLECTIONS = ("projects", "reviews")
+FEED_TITLES = {
+    "projects": "أحدث مشاريع {name}",
+    "reviews": "آراء عملاء {name}",
+}
+FEED_SORT = {"projects": "created_at", "reviews": "date"}
+ALL = None
+
+
+def shard_count(documents: int) -> int:
+    return max(1, math.ceil(documents / SITEMAP_SHARD_TARGET))
+
+
+def shard_of(doc_id: str, shards: int) -> int:
+    digest = hashlib.blake2b(doc_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def _page_url(site_url: str, collection: str, doc_id: str) -> str:
+    return site_url + PAGE_PATHS[collection].format(id=doc_id)
+
+
+def _iso(moment: Optional[datetime]) -> Optional[str]:
+    if moment is None:
+        return None
+    return moment.replace(tzinfo=moment.tzinfo or timezone.utc).isoformat()
+
+
+def render_urlset(urls: List[Dict]) -> str:
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    for url in urls:
+        lastmod = f"<lastmod>{url['lastmod']}</lastmod>" if url.get("lastmod") else ""
+        lines.append(f"<url><loc>{escape(url['loc'])}</loc>{lastmod}</url>")
+    lines.append("</urlset>")
+    return "\n".join(lines) + "\n"
+
+
+def render_sitemap_index(published_url: str, sitemaps: List[Dict]) -> str:
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    for sitemap in sitemaps:
+        lastmod = f"<lastmod>{sitemap['lastmod']}</lastmod>" if sitemap.get("lastmod") else ""
+        lines.append(f"<sitemap><loc>{escape(published_url)}/sitemaps/{sitemap['name']}.xml</loc>{lastmod}</sitemap>")
+    lines.append("</sitemapindex>")
+    return "\n".join(lines) + "\n"
+
+
+def feed_items(site_url: str, collection: str, documents: List[Dict]) -> List[Dict]:
+    """Title, link, date and summary of each feed entry"""
+    items = []
+    for doc in documents:
+        if collection == "projects":
+            items.append({
+                "id": doc["id"],
+                "title": doc["title"],
+                "link": _page_url(site_url, "projects", doc["id"]),
+                "date": doc.get("created_at"),
+                "summary": doc.get("description", ""),
+                "image": doc.get("image_url"),
+            })
+        else:
+            items.append({
+                "id": doc["id"],
+                "title": f"{doc['name']} - {'★' * doc['rating']}",
+                "link": f"{site_url}/#reviews",
+                "date": doc.get("date"),
+                "summary": doc.get("text", ""),
+                "image": None,
+            })
+    return items
+
+
+def render_rss(site_url: str, site_name: str, collection: str, items: List[Dict]) -> str:
+    title = FEED_TITLES[collection].format(name=site_name)
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<rss version="2.0"><channel>',
+             f"<title>{escape(title)}</title>",
+             f"<link>{escape(site_url)}/</link>",
+             f"<description>{escape(title)}</description>",
+             "<language>ar</language>"]
+    for item in items:
+        published = f"<pubDate>{format_datetime(item['date'].replace(tzinfo=timezone.utc))}</pubDate>" if item["date"] else ""
+        lines.append(
+            f"<item><title>{escape(item['title'])}</title><link>{escape(item['link'])}</link>"
+            f'<guid isPermaLink="false">{escape(item["id"])}</guid>{published}'
+            f"<description>{escape(item['summary'])}</description></item>"
+        )
+    lines.append("</channel></rss>")
+    return "\n".join(lines) + "\n"
+
+
+def render_json_feed(site_url: str, published_url: str, site_name: str, collection: str, items: List[Dict]) -> str:
+    feed = {
+        "version": "https://jsonfeed.org/version/1.1",
+        "title": FEED_TITLES[collection].format(name=site_name),
+        "home_page_url": f"{site_url}/",
+        "feed_url": f"{published_url}/feeds/{collection}.json",
+        "language": "ar",
+        "items": [
+            {
+                "id": item["id"],
+                "url": item["link"],
+                "title": item["title"],
+                "content_text": item["summary"],
+                **({"date_published": _iso(item["date"])} if item["date"] else {}),
+                **({"image": item["image"]} if item["image"] else {}),
+            }
+            for item in items
+        ],
+    }
+    return json.dumps(feed, ensure_ascii=False, indent=2) + "\n"
+
+
+def _write(path: Path, content: str):
+    """Atomically replace a published file (blocking, run it off the loop)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(content, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class Publisher:
+    """Tracks what changed since the last run and rebuilds just that"""
+
+    def __init__(self, directory: Path, site_url: str = SITE_URL, site_name: str = SITE_NAME, root_path: str = ""):
+        self.directory = directory
+        self.site_url = site_url.rstrip('/')
+        # Where /api/published/ is reached from outside
+        self.published_url = f"{self.site_url}{root_path}/api/published"
+        self.site_name = site_name
+        self._changed: Dict[str, Optional[Set[str]]] = {}
+        self._full = True
+
+    def mark(self, collection: str, doc_id: Optional[str] = ALL):
+        """Note a write to `collection` (to one document, or to any)"""
+        if collection in self._changed and self._changed[collection] is ALL:
+            return
+        if doc_id is ALL:
+            self._changed[collection] = ALL
+        else:
+            self._changed.setdefault(collection, set()).add(doc_id)
+
+    def _restore(self, changed: Dict[str, Optional[Set[str]]], full: bool):
+        self._full = self._full or full
+        for collection, ids in changed.items():
+            for doc_id in (ids if ids is not ALL else [ALL]):
+                self.mark(collection, doc_id)
+
+    def _manifest(self) -> Dict[str, Any]:
+        try:
+            return json.loads((self.directory / "manifest.json").read_text())
+        except (OSError, ValueError):
+            return {}
+
+    async def _publish_sitemap(self, storage: Storage, collection: str, shards: int,
+                               only: Optional[Set[int]]) -> Dict[str, Optional[str]]:
+        """Write the shards (all, or those in `only`), returning each written shard's lastmod"""
+        documents = await storage[collection].find_many(
+            {}, [("id", 1)],
+            fields={"is_active": 1, "deactivated_at": 1, "lastmod": {"$ifNull": ["$updated_at", "$created_at"]}}
+        )
+        by_shard: Dict[int, List[Dict]] = {index: [] for index in range(shards) if only is None or index in only}
+        for doc in documents:
+            index = shard_of(doc["id"], shards)
+            if index in by_shard:
+                by_shard[index].append(doc)
+        lastmods = {}
+        for index, shard in by_shard.items():
+            active = [doc for doc in shard if doc.get("is_active")]
+            if len(active) > SITEMAP_MAX_URLS:
+                raise ValueError(f"{collection} shard {index} has {len(active)} URLs")
+            urls = [{"loc": _page_url(self.site_url, collection, doc["id"]), "lastmod": _iso(doc.get("lastmod"))}
+                    for doc in active]
+            await asyncio.to_thread(_write, self.directory / "sitemaps" / f"{collection}-{index}.xml", render_urlset(urls))
+            # A removal changes the shard too
+            changes = [doc.get("lastmod") for doc in active] + [doc.get("deactivated_at") for doc in shard]
+            changes = [moment for moment in changes if moment is not None]
+            lastmods[f"{collection}-{index}"] = _iso(max(changes)) if changes else None
+        # Shards beyond the current count are left over from a larger collection
+        for stale in (self.directory / "sitemaps").glob(f"{collection}-*.xml"):
+            if int(stale.stem.rsplit("-", 1)[1]) >= shards:
+                stale.unlink()
+        return lastmods
+
+    async def _publish_feed(self, storage: Storage, collection: str):
+        documents = await storage[collection].find_many(
+            {"is_active": True}, [(FEED_SORT[collection], -1)], limit=FEED_SIZE
+        )
+        items = feed_items(self.site_url, collection, documents)
+        rss = render_rss(self.site_url, self.site_name, collection, items)
+        json_feed = render_json_feed(self.site_url, self.published_url, self.site_name, collection, items)
+        await asyncio.to_thread(_write, self.directory / "feeds" / f"{collection}.rss", rss)
+        await asyncio.to_thread(_write, self.directory / "feeds" / f"{collection}.json", json_feed)
+
+    async def publish(self, storage: Storage) -> Dict[str, str]:
+        """Rebuild what changed since the last run, returning what was rebuilt"""
+        changed, self._changed = self._changed, {}
+        full, self._full = self._full, False
+        try:
+            return await self._publish(storage, changed, full)
+        except Exception:
+            self._restore(changed, full)
+            raise
+
+    async def _publish(self, storage: Storage, changed: Dict[str, Optional[Set[str]]], full: bool) -> Dict[str, str]:
+        manifest = self._manifest()
+        lastmods = manifest.setdefault("lastmod", {})
+        rebuilt = {}
+        for collection in SITEMAP_COLLECTIONS:
+            if not full and collection not in changed and collection in manifest:
+                continue
+            shards = shard_count(await storage[collection].count({"is_active": True}))
+            ids = changed.get(collection, ALL)
+            if full or ids is ALL or manifest.get(collection) != shards:
+                lastmods.update(await self._publish_sitemap(storage, collection, shards, None))
+                rebuilt[collection] = f"{shards} shards"
+            else:
+                touched = {shard_of(doc_id, shards) for doc_id in ids}
+                lastmods.update(await self._publish_sitemap(storage, collection, shards, touched))
+                rebuilt[collection] = f"shards {sorted(touched)}"
+            manifest[collection] = shards
+
+        if rebuilt or not (self.directory / "sitemap.xml").exists():
+            pages = render_urlset([{"loc": f"{self.site_url}/"}])
+            await asyncio.to_thread(_write, self.directory / "sitemaps" / "pages.xml", pages)
+            names = ["pages"] + [f"{collection}-{index}"
+                                 for collection in SITEMAP_COLLECTIONS for index in range(manifest[collection])]
+            # Kept in the manifest, so shards that were not rebuilt keep theirs
+            sitemaps = [{"name": name, "lastmod": lastmods.get(name)} for name in names]
+            index = render_sitemap_index(self.published_url, sitemaps)
+            await asyncio.to_thread(_write, self.directory / "sitemap.xml", index)
+            await asyncio.to_thread(_write, self.directory / "manifest.json", json.dumps(manifest))
+
+        for collection in FEED_COLLECTIONS:
+            if full or collection in changed:
+                await self._publish_feed(storage, collection)
+                rebuilt[f"{collection} feed"] = "rebuilt"
+        return rebuilt
+
+
+class TenantPublishers:
+    """The publisher of the tenant being served, writing under PUBLISH_DIR/<tenant>"""
+
+    def __init__(self):
+        self._publishers: Dict[Optional[str], Publisher] = {}
+
+    def current(self) -> Publisher:
+        tenant = tenancy.current_tenant()
+        key = tenant.id if tenant else None
+        if key not in self._publishers:
+            if tenant is None:
+                self._publishers[key] = Publisher(PUBLISH_DIR)
+            else:
+                self._publishers[key] = Publisher(
+                    PUBLISH_DIR / tenant.id, tenant.site_url or SITE_URL, tenant.name or SITE_NAME,
+                    tenancy.root_path(tenant)
+                )
+        return self._publishers[key]
+
+    def mark(self, collection: str, doc_id: Optional[str] = ALL):
+        self.current().mark(collection, doc_id)
+
+    async def publish(self, storage: Storage) -> Dict[str, str]:
+        return await self.current().publish(storage)
+
+
+publisher = TenantPublishers()
+
+
+async def publish_changes():
+    """Scheduler job: bring the published files up to date"""
+    rebuilt = await publisher.publish(current_storage())
+    if rebuilt:
+        logger.info(f"Published {rebuilt}")
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+    storage = motor_storage(client[os.environ.get('DB_NAME', 'alsawda_warehouses')])
+    for tenant in tenancy.tenants.values() or [None]:
+        with tenancy.use_tenant(tenant):
+            scoped = storage.scoped(tenancy.TENANT_FIELD, tenant.id) if tenant else storage
+            rebuilt = await publisher.publish(scoped)
+            for name, what in rebuilt.items():
+                print(f"🗺️  {name}: {what}")
+            print(f"✅ Published to {publisher.current().directory}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+"""
+Query audit: per-route MongoDB command budgets, checked against a real mongod.
+
+The cases live in tests/test_query_budgets.py. Each audited GET route is
+called in-process while every command it sends is recorded through the
+command listener (monitoring.py). Each recorded find, aggregate, count and
+distinct is then run again under `explain` with executionStats. A route fails
+the audit when it:
+
+    - sends more commands than its budget (an N+1 creeping in)
+    - has a COLLSCAN in any plan, unless the collection is small
+      (SMALL_COLLECTION_DOCS) or the case allows it
+    - examines more than `max_examined_ratio` documents per document
+      returned by a find
+
+The audit seeds a throwaway database with deterministic synthetic data from
+generate_data.py:
+
+    TEST_MONGO_URL=mongodb://localhost:27017 python -m pytest tests/test_query_budgets.py
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List
+
+import httpx
+
+import generate_data
+import monitoring
+import seed_data
+from cache import cache
+from database import database, ensure_indexes, initialize_default_data
+from gazetteer import backfill_project_coordinates, default_gazetteer
+from related import related_projects
+
+# Below this size a collection scan is what the planner should pick anyway
+SMALL_COLLECTION_DOCS = 100
+
+EXPLAINABLE = {"find", "aggregate", "count", "distinct"}
+# Driver fields the explain command does not accept
+SESSION_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber"}
+
+SEED_SIZES = {
+    "projects": 5000,
+    "reviews": 5000,
+    "services": 60,
+    "contact_forms": 20000,
+}
+
+
+@dataclass
+class AuditCase:
+    path: str
+    max_commands: int
+    max_examined_ratio: float = 2.0
+    allow_collscan: bool = False
+
+
+def fill_path(path: str, values: Dict[str, str]) -> str:
+    """Substitute sample document values for the {placeholders} in a case path"""
+    for name, value in values.items():
+        path = path.replace("{" + name + "}", value)
+    return path
+
+
+def _find_all(document: Any, key: str) -> Iterator[Any]:
+    """Every value stored under `key` anywhere in an explain document"""
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                yield value
+            yield from _find_all(value, key)
+    elif isinstance(document, list):
+        for value in document:
+            yield from _find_all(value, key)
+
+
+async def explain(command: Dict[str, Any], database_name: str) -> Dict[str, Any]:
+    """Plan stages and execution counts of one recorded command"""
+    explained = {name: value for name, value in command.items() if name not in SESSION_FIELDS}
+    result = await database.client[database_name].command(
+        {"explain": explained, "verbosity": "executionStats"}
+    )
+    stages = {stage for plan in _find_all(result, "winningPlan") for stage in _find_all(plan, "stage")}
+    stats = list(_find_all(result, "executionStats"))
+    return {
+        "stages": stages,
+        "examined": sum(s.get("totalDocsExamined", 0) for s in stats),
+        "returned": stats[0].get("nReturned", 0) if stats else 0,
+    }
+
+
+async def collection_sizes() -> Dict[str, int]:
+    names = await database.database.list_collection_names()
+    return {name: await database.database[name].estimated_document_count() for name in names}
+
+
+async def audit_case(
+    client: httpx.AsyncClient,
+    case: AuditCase,
+    path: str,
+    sizes: Dict[str, int]
+) -> List[str]:
+    """Run one route and return its budget violations"""
+    # Every case starts cold so the route really reaches the database
+    cache.clear()
+    with monitoring.track_request(record=True) as stats:
+        response = await client.get(path)
+    if response.status_code != 200:
+        return [f"status {response.status_code}: {response.text[:200]}"]
+
+    problems = []
+    if stats.commands > case.max_commands:
+        problems.append(f"{stats.commands} commands (budget {case.max_commands})")
+
+    for recorded in stats.recorded:
+        if recorded["name"] not in EXPLAINABLE:
+            continue
+        collection = recorded["command"][recorded["name"]]
+        plan = await explain(recorded["command"], recorded["database"])
+        # Shown by pytest when the case fails
+        print(f"{recorded['name']} {collection}: {sorted(plan['stages'])} "
+              f"examined={plan['examined']} returned={plan['returned']}")
+        small = sizes.get(collection, 0) <= SMALL_COLLECTION_DOCS
+        if "COLLSCAN" in plan["stages"] and not (small or case.allow_collscan):
+            problems.append(f"COLLSCAN on {collection} ({recorded['name']})")
+        if recorded["name"] == "find" and not small:
+            limit = case.max_examined_ratio * max(plan["returned"], 1)
+            if plan["examined"] > limit:
+                problems.append(
+                    f"find on {collection} examined {plan['examined']} docs "
+                    f"to return {plan['returned']} (ratio {case.max_examined_ratio})"
+                )
+    return problems
+
+
+async def sample_values() -> Dict[str, str]:
+    """Ids and fields of real documents for the case paths"""
+    db = database.database
+    project = await db.projects.find_one({"is_active": True, "geo": {"$ne": None}, "related_ids.0": {"$exists": True}})
+    projects = await db.projects.find({"is_active": True}, {"_id": 1}).limit(3).to_list(length=3)
+    services = await db.services.find({"is_active": True}, {"_id": 1}).limit(3).to_list(length=3)
+    reviews = await db.reviews.find({"is_active": True}, {"_id": 1}).limit(3).to_list(length=3)
+    form = await db.contact_forms.find_one({})
+    lng, lat = project["geo"]["coordinates"]
+    return {
+        "project": project["_id"],
+        "project.category": project["category"],
+        "project.lat": str(lat),
+        "project.lng": str(lng),
+        "projects": ",".join(document["_id"] for document in projects),
+        "service": services[0]["_id"],
+        "services": ",".join(document["_id"] for document in services),
+        "review": reviews[0]["_id"],
+        "reviews": ",".join(document["_id"] for document in reviews),
+        "form": form["_id"],
+    }
+
+
+async def seed():
+    """Fill the (empty) audit database with indexes and synthetic data"""
+    await ensure_indexes()
+    await initialize_default_data()
+    for collection, size in SEED_SIZES.items():
+        documents = generate_data.make_batch(collection, 42, 0, size)
+        await database.database[collection].insert_many(documents, ordered=False)
+    await seed_data.update_statistics(database.database)
+    # The nearby and related routes read what these jobs precompute
+    await backfill_project_coordinates(database.storage, default_gazetteer())
+    await related_projects.rebuild(database.storage)
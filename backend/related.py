@@ -0,0 +1,314 @@
+"""
+Related projects, precomputed.
+
+Each active project is a vector: TF-IDF weights of the words in its title
+and description (Arabic and English, normalized like the gazetteer's place
+names, with common prefixes and stop words dropped) plus a one-hot category
+feature. The RELATED_K nearest projects by cosine similarity are stored on
+the project as `related_ids`, so GET /api/projects/{id}/related reads them
+by id instead of searching.
+
+The vectors are kept sparse (a project has few distinct words), and
+similarities are computed with NumPy a block of RELATED_BLOCK_SIZE projects
+against a block of candidates at a time, keeping the best K so far, so
+memory stays at block x block scores on top of the nonzero weights.
+RELATED_MAX_FEATURES caps the vocabulary.
+
+Project writes mark the project, and the related-projects job then only
+recomputes the marked projects and those that listed one of them; every
+other project just checks whether a marked project now beats its last
+neighbor. Lists that did not change are not written back. The
+related-projects-rebuild job recomputes everything (and refreshes the IDF
+weights) at startup and every RELATED_FULL_REBUILD_SECONDS, on one worker at
+a time.
+
+`related_ids` is not part of the Project model, so project responses leave
+it out.
+
+Build by hand:
+    python related.py
+"""
+
+import asyncio
+import logging
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import tenancy
+from cache import cache
+from database import current_storage
+from gazetteer import normalize
+from storage import Storage, motor_storage
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+RELATED_K = int(os.environ.get('RELATED_K', '8'))
+RELATED_INTERVAL = float(os.environ.get('RELATED_REFRESH_SECONDS', '60'))
+RELATED_FULL_REBUILD_INTERVAL = float(os.environ.get('RELATED_FULL_REBUILD_SECONDS', '86400'))
+RELATED_BLOCK_SIZE = int(os.environ.get('RELATED_BLOCK_SIZE', '256'))
+RELATED_MAX_FEATURES = int(os.environ.get('RELATED_MAX_FEATURES', '2048'))
+# Share of a vector's weight given to the category
+CATEGORY_WEIGHT = float(os.environ.get('RELATED_CATEGORY_WEIGHT', '0.5'))
+
+TEXT_FIELDS = ("title", "title_en", "description", "description_en")
+PROJECT_FIELDS = {**{name: 1 for name in TEXT_FIELDS}, "category": 1, "related_ids": 1}
+
+WORD = re.compile(r"[^\W\d_]{2,}")
+# Article and attached prepositions, longest first
+ARABIC_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+STOP_WORDS = {normalize(word) for word in (
+    "في", "من", "إلى", "على", "عن", "مع", "أو", "ثم", "هذا", "هذه", "ذلك", "التي", "الذي",
+    "كل", "بين", "تم", "حيث", "قد", "كما", "بعد", "قبل", "عند", "لدى", "ما", "لا",
+    "the", "and", "of", "for", "with", "in", "on", "at", "by", "from", "to", "an", "is",
+    "are", "was", "were", "this", "that", "our", "we", "its", "as", "or",
+)}
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    tokens = []
+    for word in WORD.findall(normalize(text or "")):
+        for prefix in ARABIC_PREFIXES:
+            if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+                word = word[len(prefix):]
+                break
+        if word not in STOP_WORDS:
+            tokens.append(word)
+    return tokens
+
+
+class SparseVectors:
+    """Rows of a sparse matrix in compressed sparse row form"""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, width: int):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.width = width
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def dense(self, rows: np.ndarray) -> np.ndarray:
+        """The given rows as a dense len(rows) x width array"""
+        starts = self.indptr[rows]
+        counts = self.indptr[rows + 1] - starts
+        line = np.repeat(np.arange(len(rows)), counts)
+        entries = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        out = np.zeros((len(rows), self.width), dtype=np.float32)
+        out[line, self.indices[entries]] = self.data[entries]
+        return out
+
+
+def project_vectors(projects: List[Dict]) -> SparseVectors:
+    """Unit-length TF-IDF plus category vectors, one row per project"""
+    documents = [[token for name in TEXT_FIELDS for token in tokenize(project.get(name))] for project in projects]
+    document_frequency: Dict[str, int] = {}
+    for tokens in documents:
+        for token in set(tokens):
+            document_frequency[token] = document_frequency.get(token, 0) + 1
+    # Words in a single project cannot make two projects similar
+    shared = [token for token, count in document_frequency.items() if count > 1]
+    shared.sort(key=lambda token: (-document_frequency[token], token))
+    vocabulary = {token: column for column, token in enumerate(shared[:RELATED_MAX_FEATURES])}
+    categories = {category: column for column, category in
+                  enumerate(sorted({project.get("category") or "" for project in projects}))}
+
+    rows, columns, counts = [], [], []
+    for row, tokens in enumerate(documents):
+        found = Counter(vocabulary[token] for token in tokens if token in vocabulary)
+        for column in sorted(found):
+            rows.append(row)
+            columns.append(column)
+            counts.append(found[column])
+    rows, columns = np.array(rows, dtype=int), np.array(columns, dtype=int)
+    idf = np.log((1 + len(projects)) / (1 + np.array(
+        [document_frequency[token] for token in vocabulary], dtype=np.float32))) + 1
+    words = np.log1p(np.array(counts, dtype=np.float32)) * idf[columns]
+    norms = np.sqrt(np.bincount(rows, words ** 2, minlength=len(projects)))
+    words = words / norms[rows] * math.sqrt(1 - CATEGORY_WEIGHT)
+
+    # Each row's category goes after its words, keeping the columns in order
+    category_columns = len(vocabulary) + np.array(
+        [categories[project.get("category") or ""] for project in projects], dtype=int)
+    indptr = np.zeros(len(projects) + 1, dtype=int)
+    indptr[1:] = np.cumsum(np.bincount(rows, minlength=len(projects)) + 1)
+    category_entries = indptr[1:] - 1
+    indices = np.empty(indptr[-1], dtype=int)
+    data = np.empty(indptr[-1], dtype=np.float32)
+    word_entries = np.setdiff1d(np.arange(indptr[-1]), category_entries, assume_unique=True)
+    indices[word_entries], data[word_entries] = columns, words
+    indices[category_entries], data[category_entries] = category_columns, math.sqrt(CATEGORY_WEIGHT)
+
+    norms = np.repeat(np.sqrt(np.add.reduceat(data ** 2, indptr[:-1])) if len(projects) else [], np.diff(indptr))
+    data = np.divide(data, norms, out=np.zeros_like(data), where=norms > 0)
+    return SparseVectors(indptr, indices, data, len(vocabulary) + len(categories))
+
+
+def _keep_best(scores: np.ndarray, candidates: np.ndarray, k: int):
+    """Per row, the k highest scores and their candidates, in no particular order"""
+    k = min(k, scores.shape[1])
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k else np.empty((len(scores), 0), dtype=int)
+    return np.take_along_axis(scores, best, axis=1), np.take_along_axis(candidates, best, axis=1)
+
+
+def _ranked(scores: np.ndarray, candidates: np.ndarray) -> List[List[int]]:
+    """Per row, the candidates with a positive score, best first"""
+    order = np.argsort(-scores, axis=1, kind="stable")
+    scores, candidates = np.take_along_axis(scores, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+    return [[int(candidate) for candidate, score in zip(candidates[row], scores[row]) if score > 0]
+            for row in range(len(scores))]
+
+
+def nearest(vectors: SparseVectors, rows: np.ndarray, k: int, block_size: int = RELATED_BLOCK_SIZE) -> List[List[int]]:
+    """The k nearest other projects of each of `rows`, a block of rows against a block of candidates at a time"""
+    neighbors: List[List[int]] = []
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        queries = vectors.dense(block)
+        best_scores = np.empty((len(block), 0), dtype=np.float32)
+        best = np.empty((len(block), 0), dtype=int)
+        for first in range(0, len(vectors), block_size):
+            candidates = np.arange(first, min(first + block_size, len(vectors)))
+            scores = queries @ vectors.dense(candidates).T
+            scores[block[:, None] == candidates[None, :]] = -np.inf
+            best_scores, best = _keep_best(np.hstack([best_scores, scores]),
+                                           np.hstack([best, np.broadcast_to(candidates, scores.shape)]), k)
+        neighbors += _ranked(best_scores, best)
+    return neighbors
+
+
+def merge_nearest(vectors: SparseVectors, rows: np.ndarray, current: np.ndarray, changed: np.ndarray, k: int,
+                  block_size: int = RELATED_BLOCK_SIZE) -> List[List[int]]:
+    """Re-rank each row's current neighbors (padded with -1) together with the changed projects"""
+    neighbors: List[List[int]] = []
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        candidates = np.hstack([current[start:start + block_size], np.broadcast_to(changed, (len(block), len(changed)))])
+        # Score each distinct candidate once, then look the scores up per row
+        pool = np.unique(candidates[candidates >= 0])
+        pool_scores = vectors.dense(block) @ vectors.dense(pool).T
+        scores = np.take_along_axis(pool_scores, np.minimum(np.searchsorted(pool, candidates), len(pool) - 1), axis=1)
+        # Padding, the project itself, and a changed project it already lists are not candidates
+        duplicate = np.zeros_like(candidates, dtype=bool)
+        duplicate[:, current.shape[1]:] = (candidates[:, current.shape[1]:, None] == current[start:start + block_size, None, :]).any(axis=2)
+        scores[(candidates < 0) | (candidates == block[:, None]) | duplicate] = -np.inf
+        neighbors += _ranked(*_keep_best(scores, candidates, k))
+    return neighbors
+
+
+def compute_related(projects: List[Dict], changed: Optional[Set[str]], k: int = RELATED_K) -> Dict[str, List[str]]:
+    """New related ids per project; all projects when `changed` is None, else those affected"""
+    if not projects:
+        return {}
+    vectors = project_vectors(projects)
+    ids = [project["id"] for project in projects]
+    position = {project_id: row for row, project_id in enumerate(ids)}
+
+    if changed is None:
+        rows = np.arange(len(projects))
+        return {ids[row]: [ids[n] for n in found] for row, found in zip(rows, nearest(vectors, rows, k))}
+
+    changed_rows = np.array(sorted(position[project_id] for project_id in changed if project_id in position), dtype=int)
+    full, merge = [], []
+    for row, project in enumerate(projects):
+        listed = project.get("related_ids") or []
+        # A project whose list includes a changed one may now need a replacement neighbor
+        if project["id"] in changed or changed.intersection(listed) or any(i not in position for i in listed):
+            full.append(row)
+        else:
+            merge.append(row)
+
+    related = {}
+    full_rows = np.array(full, dtype=int)
+    for row, found in zip(full_rows, nearest(vectors, full_rows, k)):
+        related[ids[row]] = [ids[n] for n in found]
+    if len(changed_rows) and merge:
+        merge_rows = np.array(merge, dtype=int)
+        current = np.full((len(merge_rows), k), -1, dtype=int)
+        for line, row in enumerate(merge_rows):
+            listed = [position[i] for i in projects[row].get("related_ids") or []][:k]
+            current[line, :len(listed)] = listed
+        for row, found in zip(merge_rows, merge_nearest(vectors, merge_rows, current, changed_rows, k)):
+            related[ids[row]] = [ids[n] for n in found]
+    return related
+
+
+class RelatedProjects:
+    """Tracks which projects changed per tenant and refreshes the affected lists"""
+
+    def __init__(self):
+        self._changed: Dict[Optional[str], Set[str]] = {}
+
+    def mark(self, project_id: str):
+        """Note a write to a project"""
+        self._changed.setdefault(tenancy.current_tenant_id(), set()).add(project_id)
+
+    async def refresh(self, storage: Storage) -> int:
+        """Recompute the lists this worker's writes affected, returning the lists rewritten"""
+        tenant_id = tenancy.current_tenant_id()
+        changed = self._changed.pop(tenant_id, set())
+        if not changed:
+            return 0
+        try:
+            return await self._update(storage, changed)
+        except Exception:
+            self._changed.setdefault(tenant_id, set()).update(changed)
+            raise
+
+    async def rebuild(self, storage: Storage) -> int:
+        """Recompute every list with fresh IDF weights, returning the lists rewritten"""
+        return await self._update(storage, None)
+
+    async def _update(self, storage: Storage, changed: Optional[Set[str]]) -> int:
+        projects = await storage.projects.find_many({"is_active": True}, [("id", 1)], fields=PROJECT_FIELDS)
+        related = await asyncio.to_thread(compute_related, projects, changed)
+        stored = {project["id"]: project.get("related_ids") or [] for project in projects}
+        updates = {project_id: {"related_ids": ids} for project_id, ids in related.items()
+                   if ids != stored[project_id]}
+        await storage.projects.set_many(updates)
+        if updates:
+            cache.invalidate("projects")
+        return len(updates)
+
+
+related_projects = RelatedProjects()
+
+
+async def refresh_related():
+    """Scheduler job: bring the lists this worker's writes affected up to date"""
+    updated = await related_projects.refresh(current_storage())
+    if updated:
+        logger.info(f"Updated related projects of {updated} projects")
+
+
+async def rebuild_related():
+    """Scheduler job: recompute every related project list"""
+    updated = await related_projects.rebuild(current_storage())
+    logger.info(f"Rebuilt related projects, {updated} lists changed")
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+    storage = motor_storage(client[os.environ.get('DB_NAME', 'alsawda_warehouses')])
+    for tenant in tenancy.tenants.values() or [None]:
+        with tenancy.use_tenant(tenant):
+            scoped = storage.scoped(tenancy.TENANT_FIELD, tenant.id) if tenant else storage
+            updated = await related_projects.rebuild(scoped)
+            print(f"🔗 {tenant.id + ': ' if tenant else ''}updated related projects of {updated} projects")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,226 @@
+"""
+Resilient reads for the public API.
+
+Read handlers run through a per-route timeout budget and a circuit breaker
+around the MongoDB connection. Every successful read is remembered as the
+last good result, in memory and in a local snapshot file, so the site keeps
+serving (marked stale) while MongoDB is slow or down.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import PyMongoError
+
+import tenancy
+import tracing
+from database import database, prepare_database, ROOT_DIR
+from dataloader import outside_request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_READ_TIMEOUT = float(os.environ.get('DB_READ_TIMEOUT', '2.0'))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('DB_BREAKER_FAILURES', '5'))
+BREAKER_RESET_TIMEOUT = float(os.environ.get('DB_BREAKER_RESET_SECONDS', '30'))
+SNAPSHOT_PATH = Path(os.environ.get('SNAPSHOT_PATH', ROOT_DIR / 'snapshots' / 'reads.json'))
+SNAPSHOT_MAX_ENTRIES = int(os.environ.get('SNAPSHOT_MAX_ENTRIES', '2000'))
+SNAPSHOT_FLUSH_INTERVAL = float(os.environ.get('SNAPSHOT_FLUSH_SECONDS', '30'))
+
+# Seconds since the served data was read from MongoDB ("0" when live)
+STALENESS_HEADER = "X-Data-Staleness"
+
+Fetcher = Callable[[], Awaitable[Any]]
+
+
+def cache_key(*parts: Any) -> str:
+    """Build a cache/snapshot key from route name and parameters"""
+    return ":".join(str(part) for part in parts)
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open probe -> closed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe: Optional[asyncio.Task] = None
+
+    def allow_request(self) -> bool:
+        """Whether a request may hit the database right now"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Requests keep getting the snapshot; the probe refreshes it in the background
+            self.state = self.HALF_OPEN
+            self._probe = asyncio.create_task(self._half_open_probe())
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("Database circuit closed")
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self):
+        if self.state != self.OPEN:
+            logger.warning("Database circuit opened, serving last good results")
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    async def _half_open_probe(self):
+        try:
+            if database.client is not None:
+                await asyncio.wait_for(database.client.admin.command('ping'), DEFAULT_READ_TIMEOUT)
+                if not database.prepared:
+                    # Startup found MongoDB down and skipped this
+                    await prepare_database()
+        except Exception as e:
+            logger.warning(f"Database probe failed: {e}")
+            self.trip()
+            return
+        self.record_success()
+        await snapshots.refresh_all()
+
+
+class SnapshotStore:
+    """Last good result per read key, bounded and persisted to a JSON file"""
+
+    def __init__(self, path: Path, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Each read's fetcher and the tenant it ran for
+        self._fetchers: Dict[str, Tuple[Fetcher, Optional[tenancy.Tenant]]] = {}
+        self._dirty = False
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    def put(self, key: str, data: Any, fetch: Optional[Fetcher] = None):
+        self._entries[key] = {"data": data, "stored_at": time.time()}
+        self._entries.move_to_end(key)
+        if fetch is not None:
+            self._fetchers[key] = (fetch, tenancy.current_tenant())
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._fetchers.pop(evicted, None)
+        self._dirty = True
+
+    def load(self):
+        """Load the snapshot file written by a previous process"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable snapshot {self.path}: {e}")
+            return
+        self._entries = OrderedDict(list(entries.items())[-self.max_entries:])
+        logger.info(f"Loaded {len(self._entries)} read snapshots")
+
+    def save(self):
+        """Atomically write the snapshot file (blocking, run it off the loop)"""
+        self._dirty = False
+        payload = json.dumps(self._entries, ensure_ascii=False)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    async def flush(self):
+        if self._dirty:
+            await asyncio.to_thread(self.save)
+
+    async def refresh_all(self):
+        """Re-run every known read after the database comes back"""
+        for key, (fetch, tenant) in list(self._fetchers.items()):
+            try:
+                # Not with the DataLoaders of the request that first ran the read
+                with tenancy.use_tenant(tenant), outside_request():
+                    data = await asyncio.wait_for(fetch(), DEFAULT_READ_TIMEOUT)
+            except (asyncio.TimeoutError, PyMongoError) as e:
+                logger.warning(f"Background refresh of {key} failed: {e!r}")
+                breaker.record_failure()
+                return
+            except Exception:
+                continue
+            self.put(key, jsonable_encoder(data))
+
+
+breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+snapshots = SnapshotStore(SNAPSHOT_PATH, SNAPSHOT_MAX_ENTRIES)
+
+
+async def resilient_read(
+    key: str,
+    fetch: Fetcher,
+    response: Response,
+    timeout: Optional[float] = None
+) -> Any:
+    """Run a read within its timeout budget, falling back to the last good result"""
+    key = tenancy.scoped(key)
+    if breaker.allow_request():
+        try:
+            data = await asyncio.wait_for(fetch(), timeout or DEFAULT_READ_TIMEOUT)
+        except HTTPException:
+            # The database answered (e.g. 404), so it is healthy
+            breaker.record_success()
+            raise
+        except (asyncio.TimeoutError, PyMongoError) as e:
+            logger.warning(f"Read {key} failed: {e!r}")
+            breaker.record_failure()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error retrieving data: {str(e)}")
+        else:
+            breaker.record_success()
+            with tracing.span("serialize", key=key):
+                data = jsonable_encoder(data)
+            snapshots.put(key, data, fetch)
+            response.headers[STALENESS_HEADER] = "0"
+            return data
+
+    entry = snapshots.get(key)
+    if entry is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Service temporarily unavailable, please try again shortly",
+            headers={"Retry-After": str(int(breaker.reset_timeout))}
+        )
+    response.headers[STALENESS_HEADER] = str(int(time.time() - entry["stored_at"]))
+    tracing.annotate("snapshot.served", key=key)
+    return entry["data"]
+
+
+async def start():
+    """Load persisted snapshots (the scheduler flushes them periodically)"""
+    snapshots.load()
+
+
+async def stop():
+    """Persist the latest snapshots"""
+    try:
+        await snapshots.flush()
+    except OSError as e:
+        logger.warning(f"Could not write read snapshot: {e}")
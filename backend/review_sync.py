@@ -0,0 +1,287 @@
+"""
+Incremental sync of reviews from an external provider.
+
+A `ReviewSource` returns the reviews changed since a cursor, oldest change
+first, and the cursor to resume from. Each page is applied with one
+`find_many` on the changed `google_review_id`s and one batched upsert keyed
+on them (unique index), so a sync costs O(changes) rather than a re-import.
+The cursor is saved in the statistics document after every page, so an
+interrupted sync resumes where it stopped.
+
+The same pass moves the live review counts by the changes' deltas and sets
+the company's rating and review count from them. A review hidden by an admin
+stays hidden when the provider updates it; one removed at the provider is
+soft-deleted, and shown again if the provider restores it. New reviews that
+do not validate as a ReviewCreate (no name, text or rating) are skipped.
+
+REVIEW_SYNC_SOURCE selects the source:
+    path/to/reviews.json       a local fixture (see review_fixture.json)
+    https://host/reviews       a provider adapter answering
+                               GET ?since=<cursor>&limit=<n> with
+                               {"reviews": [...], "cursor": "..."}
+
+The API runs the sync as a scheduler job every REVIEW_SYNC_SECONDS when a
+source is configured; in multi-tenant mode each tenant's `review_source`
+takes precedence. Run by hand, or serve a fixture as a stub provider:
+    python review_sync.py run [--source ...] [--full]
+    python review_sync.py serve [--file review_fixture.json] [--port 8099]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pydantic import ValidationError
+
+from company_stats import adjust_statistics
+import tenancy
+from database import current_storage
+from models import ReviewCreate
+from publishing import publisher
+from storage import Storage, motor_storage
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+REVIEW_SYNC_SOURCE = os.environ.get('REVIEW_SYNC_SOURCE', '')
+REVIEW_SYNC_INTERVAL = float(os.environ.get('REVIEW_SYNC_SECONDS', '3600'))
+REVIEW_SYNC_BATCH_SIZE = int(os.environ.get('REVIEW_SYNC_BATCH_SIZE', '500'))
+REVIEW_SYNC_TIMEOUT = float(os.environ.get('REVIEW_SYNC_TIMEOUT_SECONDS', '30'))
+
+# Fields a provider review carries over to the stored review
+SYNCED_FIELDS = ("name", "rating", "text", "date")
+
+
+class ReviewSource(ABC):
+    """A provider of reviews, read incrementally"""
+
+    @abstractmethod
+    async def changes(self, cursor: Optional[str], limit: int) -> Tuple[List[Dict], Optional[str]]:
+        """Up to `limit` reviews changed after `cursor` and the cursor after them
+
+        Each review has google_review_id, name, rating, text, date and, when
+        the provider has removed it, `removed: true`.
+        """
+
+
+class FixtureSource(ReviewSource):
+    """Reviews from a JSON file, each with an `updated_at` timestamp"""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    async def changes(self, cursor, limit):
+        with open(self.path, encoding="utf-8") as f:
+            reviews = json.load(f)
+        # The cursor is "<updated_at>|<google_review_id>", so equal timestamps split across pages
+        ordered = sorted(reviews, key=lambda review: (review["updated_at"], review["google_review_id"]))
+        page = [
+            review for review in ordered
+            if cursor is None or f"{review['updated_at']}|{review['google_review_id']}" > cursor
+        ][:limit]
+        if not page:
+            return [], cursor
+        return page, f"{page[-1]['updated_at']}|{page[-1]['google_review_id']}"
+
+
+class HttpSource(ReviewSource):
+    """Reviews from a provider adapter speaking the sync's HTTP contract"""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    async def changes(self, cursor, limit):
+        params = {"limit": limit}
+        if cursor:
+            params["since"] = cursor
+        async with httpx.AsyncClient(timeout=REVIEW_SYNC_TIMEOUT) as client:
+            response = await client.get(self.url, params=params)
+            response.raise_for_status()
+        body = response.json()
+        return body["reviews"], body.get("cursor") or cursor
+
+
+def source_for(location: str) -> ReviewSource:
+    if location.startswith(("http://", "https://")):
+        return HttpSource(location)
+    return FixtureSource(Path(location))
+
+
+def _review_fields(review: Dict) -> Dict:
+    fields = {name: review[name] for name in SYNCED_FIELDS if name in review}
+    if "rating" in fields:
+        fields["rating"] = int(fields["rating"])
+    if isinstance(fields.get("date"), str):
+        fields["date"] = datetime.fromisoformat(fields["date"].replace("Z", "+00:00")).replace(tzinfo=None)
+    return fields
+
+
+async def apply_changes(storage: Storage, reviews: List[Dict]) -> Dict[str, int]:
+    """Upsert one page of provider reviews and move the live counts to match"""
+    # The latest change to a review wins within a page
+    changed = {review["google_review_id"]: review for review in reviews}
+    existing = {
+        doc["google_review_id"]: doc
+        for doc in await storage.reviews.find_many(
+            {"google_review_id": {"$in": list(changed)}},
+            fields={"google_review_id": 1, "rating": 1, "is_active": 1, "removed_at_source": 1}
+        )
+    }
+
+    counts = {"added": 0, "updated": 0, "removed": 0, "skipped": 0}
+    updates, touched = {}, []
+    active_delta = rating_delta = 0
+    for google_id, review in changed.items():
+        current = existing.get(google_id)
+        if current is None:
+            if review.get("removed"):
+                continue
+            try:
+                fields = _review_fields(review)
+                ReviewCreate(**fields, google_review_id=google_id)
+            except (ValidationError, ValueError, TypeError) as e:
+                logger.warning(f"Skipping provider review {google_id}: {e}")
+                counts["skipped"] += 1
+                continue
+            review_id = str(uuid.uuid4())
+            on_insert = {"id": review_id, "is_verified": True, "is_active": True, "deactivated_at": None}
+            if "date" not in fields:
+                on_insert["date"] = datetime.utcnow()
+            updates[google_id] = {"$set": fields, "$setOnInsert": on_insert}
+            counts["added"] += 1
+            active_delta += 1
+            rating_delta += fields["rating"]
+        elif review.get("removed"):
+            if not current["is_active"]:
+                continue
+            updates[google_id] = {"$set": {
+                "is_active": False, "deactivated_at": datetime.utcnow(), "removed_at_source": True
+            }}
+            counts["removed"] += 1
+            active_delta -= 1
+            rating_delta -= current["rating"]
+            review_id = current["id"]
+        else:
+            fields = _review_fields(review)
+            rating = fields.get("rating", current["rating"])
+            if current["is_active"]:
+                rating_delta += rating - current["rating"]
+            elif current.get("removed_at_source"):
+                # Restored at the provider; a review an admin hid stays hidden
+                fields.update(is_active=True, deactivated_at=None, removed_at_source=False)
+                active_delta += 1
+                rating_delta += rating
+            updates[google_id] = {"$set": fields}
+            counts["updated"] += 1
+            review_id = current["id"]
+        touched.append(review_id)
+
+    await storage.reviews.upsert_many("google_review_id", updates)
+    if active_delta or rating_delta:
+        await adjust_statistics(storage, active_reviews=active_delta, active_rating_total=rating_delta)
+    for review_id in touched:
+        publisher.mark("reviews", review_id)
+    return counts
+
+
+async def sync_reviews(
+    storage: Storage,
+    source: ReviewSource,
+    batch_size: int = REVIEW_SYNC_BATCH_SIZE,
+    full: bool = False
+) -> Dict[str, int]:
+    """Apply the reviews changed at the source since the last sync"""
+    stats = await storage.statistics.find_one({}, fields={"review_sync_cursor": 1})
+    cursor = None if full or not stats else stats.get("review_sync_cursor")
+
+    totals = {"added": 0, "updated": 0, "removed": 0, "skipped": 0}
+    while True:
+        reviews, next_cursor = await source.changes(cursor, batch_size)
+        if not reviews:
+            break
+        for name, count in (await apply_changes(storage, reviews)).items():
+            totals[name] += count
+        cursor = next_cursor
+        await storage.statistics.update_one({}, {"$set": {"review_sync_cursor": cursor}})
+        if len(reviews) < batch_size:
+            break
+    return totals
+
+
+def configured_source() -> str:
+    """The current tenant's review source, or REVIEW_SYNC_SOURCE"""
+    tenant = tenancy.current_tenant()
+    return (tenant.review_source if tenant else "") or REVIEW_SYNC_SOURCE
+
+
+async def sync_external_reviews():
+    """Scheduler job: sync the API's own database from the configured source"""
+    location = configured_source()
+    if not location:
+        return
+    totals = await sync_reviews(current_storage(), source_for(location))
+    logger.info(f"Synced reviews {totals}")
+
+
+def serve_fixture(path: Path, port: int):
+    """Serve a fixture file over the HTTP contract, as a stub provider"""
+    source = FixtureSource(path)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            reviews, cursor = asyncio.run(source.changes(
+                query.get("since", [None])[0],
+                int(query.get("limit", [REVIEW_SYNC_BATCH_SIZE])[0])
+            ))
+            body = json.dumps({"reviews": reviews, "cursor": cursor}, ensure_ascii=False).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    print(f"🛰️  Serving {path} at http://localhost:{port}/reviews")
+    ThreadingHTTPServer(("", port), Handler).serve_forever()
+
+
+async def main(options: argparse.Namespace):
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+    storage = motor_storage(client[os.environ.get('DB_NAME', 'alsawda_warehouses')])
+
+    totals = await sync_reviews(storage, source_for(options.source), options.batch_size, options.full)
+    print(f"⭐ added {totals['added']}, updated {totals['updated']}, removed {totals['removed']} reviews")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync reviews from an external provider")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="apply the reviews changed since the last sync")
+    run_parser.add_argument("--source", default=REVIEW_SYNC_SOURCE or str(ROOT_DIR / "review_fixture.json"))
+    run_parser.add_argument("--batch-size", type=int, default=REVIEW_SYNC_BATCH_SIZE)
+    run_parser.add_argument("--full", action="store_true", help="ignore the saved cursor and sync everything")
+    serve_parser = commands.add_parser("serve", help="serve a fixture file as a stub provider")
+    serve_parser.add_argument("--file", default=str(ROOT_DIR / "review_fixture.json"))
+    serve_parser.add_argument("--port", type=int, default=8099)
+    options = parser.parse_args()
+    if options.command == "serve":
+        serve_fixture(Path(options.file), options.port)
+    else:
+        asyncio.run(main(options))
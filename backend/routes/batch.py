@@ -0,0 +1,114 @@
+from fastapi import APIRouter, HTTPException, Request
+from typing import Any, Dict
+from urllib.parse import urlencode
+from models import BatchRequest, BatchSubRequest
+import asyncio
+import json
+import math
+import os
+
+router = APIRouter(prefix="/api/batch", tags=["Batch"])
+
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', '20'))
+BATCH_MAX_COST = int(os.environ.get('BATCH_MAX_COST', '40'))
+BATCH_TIMEOUT = float(os.environ.get('BATCH_TIMEOUT_SECONDS', '10'))
+
+# Response headers worth passing back per sub-request
+FORWARDED_RESPONSE_HEADERS = {"x-data-staleness", "retry-after", "content-language"}
+# Request headers not meaningful for a sub-request without a body
+DROPPED_REQUEST_HEADERS = {b"content-length", b"content-type", b"transfer-encoding"}
+
+def sub_request_cost(item: BatchSubRequest) -> int:
+    """One unit per call, plus one per ten documents a page or id list asks for"""
+    size = item.params.get("per_page") or item.params.get("limit") or 0
+    ids = item.params.get("ids")
+    if ids:
+        size = len(str(ids).split(","))
+    try:
+        return 1 + math.ceil(int(size) / 10)
+    except (TypeError, ValueError):
+        return 1
+
+async def run_sub_request(request: Request, item: BatchSubRequest) -> Dict[str, Any]:
+    """Run one GET through the app in-process and capture its response"""
+    parent = request.scope
+    scope = {
+        "type": "http",
+        "asgi": parent.get("asgi", {"version": "3.0"}),
+        "http_version": parent.get("http_version", "1.1"),
+        "method": "GET",
+        "scheme": parent.get("scheme", "http"),
+        "path": item.path,
+        "raw_path": item.path.encode(),
+        "root_path": parent.get("root_path", ""),
+        "query_string": urlencode(item.params, doseq=True).encode(),
+        "headers": [(k, v) for k, v in parent["headers"] if k not in DROPPED_REQUEST_HEADERS],
+        "client": parent.get("client"),
+        "server": parent.get("server"),
+        # Shared with the batch request, so per-request loaders batch across sub-requests
+        "state": parent["state"],
+    }
+    response = {"status": 500, "headers": {}, "body": b""}
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Ends streaming responses instead of holding the batch open
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {
+                k.decode("latin-1"): v.decode("latin-1") for k, v in message["headers"]
+            }
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    try:
+        await asyncio.wait_for(request.app(scope, receive, send), BATCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        response["status"] = 504
+        response["body"] = b'{"detail": "Sub-request timed out"}'
+    except Exception:
+        # The app has already sent its 500 response when it re-raises
+        pass
+
+    body = response["body"].decode("utf-8", errors="replace")
+    if response["headers"].get("content-type", "").startswith("application/json") and body:
+        body = json.loads(body)
+    return {
+        "id": item.id,
+        "status": response["status"],
+        "headers": {k: v for k, v in response["headers"].items() if k in FORWARDED_RESPONSE_HEADERS},
+        "body": body
+    }
+
+@router.post("")
+async def run_batch(batch: BatchRequest, request: Request):
+    """Run several GET requests concurrently and return every response at once"""
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} requests per batch")
+    
+    for item in batch.requests:
+        if item.method.upper() != "GET":
+            # Reads only: concurrent writes would run in no defined order
+            raise HTTPException(status_code=400, detail="Only GET requests can be batched")
+        if not item.path.startswith("/api/") or item.path.startswith("/api/batch"):
+            raise HTTPException(status_code=400, detail=f"Cannot batch path {item.path}")
+    
+    cost = sum(sub_request_cost(item) for item in batch.requests)
+    if cost > BATCH_MAX_COST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch cost {cost} exceeds the limit of {BATCH_MAX_COST}"
+        )
+    
+    # Materialize the shared per-request state before the sub-requests start
+    request.state
+    responses = await asyncio.gather(*(run_sub_request(request, item) for item in batch.requests))
+    
+    return {"success": True, "responses": responses}
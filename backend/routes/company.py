@@ -1,32 +1,40 @@
-from fastapi import APIRouter, HTTPException, Depends
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi.encoders import jsonable_encoder
+from storage import Storage
 from typing import List
-from models import CompanyInfo, CompanyInfoUpdate, APIResponse
-from database import get_database
+from models import CompanyInfo, CompanyInfoUpdate, StatisticsUpdate, APIResponse
+from database import get_storage
+from admission import admin, public
+from resilience import resilient_read
+from cache import cache
+from company_stats import COMPUTED_FIGURES, present_statistics
+from i18n import get_language, localized_fields
 
 router = APIRouter(prefix="/api/company", tags=["Company"])
 
-@router.get("/info", response_model=CompanyInfo)
-async def get_company_info(db: AsyncIOMotorDatabase = Depends(get_database)):
+@router.get("/info", response_model=CompanyInfo, response_model_exclude_unset=True, dependencies=[Depends(public)])
+async def get_company_info(
+    response: Response,
+    db: Storage = Depends(get_storage),
+    language: str = Depends(get_language)
+):
     """Get company information"""
-    try:
-        company_info = await db.company_info.find_one()
+    async def load():
+        company_info = await db.company_info.find_one({}, fields=localized_fields(CompanyInfo, language))
         if not company_info:
             raise HTTPException(status_code=404, detail="Company information not found")
         
-        # Convert MongoDB ObjectId to string for the response
-        company_info["id"] = str(company_info.get("_id", ""))
-        if "_id" in company_info:
-            del company_info["_id"]
-            
-        return CompanyInfo(**company_info)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving company info: {str(e)}")
+        return jsonable_encoder(CompanyInfo(**company_info), exclude_unset=True)
 
-@router.put("/info", response_model=APIResponse)
+    async def fetch():
+        return await cache.get_or_load("company", f"info:{language}", load)
+
+    return await resilient_read(f"company:info:{language}", fetch, response, timeout=1.0)
+
+@router.put("/info", response_model=APIResponse, dependencies=[Depends(admin)])
 async def update_company_info(
     update_data: CompanyInfoUpdate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage)
 ):
     """Update company information"""
     try:
@@ -36,13 +44,14 @@ async def update_company_info(
         if not update_dict:
             raise HTTPException(status_code=400, detail="No data provided for update")
         
-        result = await db.company_info.update_one(
+        matched = await db.company_info.update_one(
             {},  # Update the first (and should be only) company record
             {"$set": update_dict}
         )
         
-        if result.matched_count == 0:
+        if matched == 0:
             raise HTTPException(status_code=404, detail="Company information not found")
+        cache.invalidate("company")
         
         return APIResponse(
             success=True,
@@ -51,11 +60,11 @@ async def update_company_info(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating company info: {str(e)}")
 
-@router.get("/stats")
-async def get_company_statistics(db: AsyncIOMotorDatabase = Depends(get_database)):
+@router.get("/stats", dependencies=[Depends(public)])
+async def get_company_statistics(response: Response, db: Storage = Depends(get_storage)):
     """Get company statistics"""
-    try:
-        stats = await db.statistics.find_one()
+    async def load():
+        stats = await db.statistics.find_one({})
         if not stats:
             # Return default stats if none exist
             default_stats = {
@@ -65,11 +74,57 @@ async def get_company_statistics(db: AsyncIOMotorDatabase = Depends(get_database
                 "team_members": 25
             }
             return {"success": True, "data": default_stats}
-        
-        # Remove MongoDB ObjectId
-        if "_id" in stats:
-            del stats["_id"]
             
-        return {"success": True, "data": stats}
+        return {"success": True, "data": present_statistics(stats)}
+
+    async def fetch():
+        return await cache.get_or_load("statistics", "public", load)
+
+    return await resilient_read("company:stats", fetch, response, timeout=1.0)
+
+@router.put("/stats", response_model=APIResponse, dependencies=[Depends(admin)])
+async def update_company_statistics(
+    update_data: StatisticsUpdate,
+    db: Storage = Depends(get_storage)
+):
+    """Set company statistics; computed figures given here override the live counts"""
+    try:
+        # Remove None values from update data
+        update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
+        
+        if not update_dict:
+            raise HTTPException(status_code=400, detail="No data provided for update")
+        
+        set_fields = {
+            f"overrides.{k}" if k in COMPUTED_FIGURES else k: v
+            for k, v in update_dict.items()
+        }
+        matched = await db.statistics.update_one({}, {"$set": set_fields})
+        
+        if matched == 0:
+            raise HTTPException(status_code=404, detail="Statistics not found")
+        cache.invalidate("statistics")
+        
+        return APIResponse(
+            success=True,
+            message="Statistics updated successfully"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating statistics: {str(e)}")
+
+@router.delete("/stats/overrides", response_model=APIResponse, dependencies=[Depends(admin)])
+async def clear_statistics_overrides(db: Storage = Depends(get_storage)):
+    """Go back to showing the figures computed from live counts"""
+    try:
+        matched = await db.statistics.update_one({}, {"$set": {"overrides": {}}})
+        
+        if matched == 0:
+            raise HTTPException(status_code=404, detail="Statistics not found")
+        cache.invalidate("statistics")
+        
+        return APIResponse(
+            success=True,
+            message="Statistics overrides cleared"
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving statistics: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error clearing statistics overrides: {str(e)}")
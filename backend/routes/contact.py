@@ -1,16 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from storage import Storage
 from typing import List, Optional
 from models import ContactForm, ContactFormCreate, APIResponse, PaginatedResponse
-from database import get_database
+from database import get_storage
+from admission import admin, public
 from datetime import datetime
+import asyncio
+import events
 
 router = APIRouter(prefix="/api/contact", tags=["Contact"])
 
-@router.post("/submit", response_model=APIResponse)
+@router.post("/submit", response_model=APIResponse, dependencies=[Depends(public)])
 async def submit_contact_form(
     form_data: ContactFormCreate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage)
 ):
     """Submit a new contact form"""
     try:
@@ -18,7 +21,8 @@ async def submit_contact_form(
         contact = ContactForm(**form_data.dict())
         contact_dict = contact.dict()
         
-        result = await db.contact_forms.insert_one(contact_dict)
+        await db.contact_forms.insert_one(contact_dict)
+        events.notify("contact", "contact.created", contact_dict)
         
         # TODO: Send email notification to admin
         # TODO: Send auto-reply email to customer
@@ -31,12 +35,12 @@ async def submit_contact_form(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error submitting contact form: {str(e)}")
 
-@router.get("/forms", response_model=PaginatedResponse)
+@router.get("/forms", response_model=PaginatedResponse, dependencies=[Depends(admin)])
 async def get_contact_forms(
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=100),
     status: Optional[str] = Query(None),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage)
 ):
     """Get paginated list of contact forms (admin only)"""
     try:
@@ -45,23 +49,10 @@ async def get_contact_forms(
         if status:
             filter_query["status"] = status
         
-        # Get total count
-        total = await db.contact_forms.count_documents(filter_query)
-        
-        # Calculate pagination
-        skip = (page - 1) * per_page
+        # Get contact forms sorted by creation date (newest first) along with the total count
+        forms, total = await db.contact_forms.paginate(filter_query, [("created_at", -1)], page, per_page)
         total_pages = (total + per_page - 1) // per_page
         
-        # Get contact forms sorted by creation date (newest first)
-        cursor = db.contact_forms.find(filter_query).sort("created_at", -1).skip(skip).limit(per_page)
-        forms = await cursor.to_list(length=per_page)
-        
-        # Convert MongoDB ObjectIds
-        for form in forms:
-            form["id"] = str(form.get("_id", ""))
-            if "_id" in form:
-                del form["_id"]
-        
         return PaginatedResponse(
             success=True,
             data=forms,
@@ -73,28 +64,23 @@ async def get_contact_forms(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving contact forms: {str(e)}")
 
-@router.get("/forms/{form_id}", response_model=ContactForm)
-async def get_contact_form(form_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+@router.get("/forms/{form_id}", response_model=ContactForm, dependencies=[Depends(admin)])
+async def get_contact_form(form_id: str, db: Storage = Depends(get_storage)):
     """Get a specific contact form by ID (admin only)"""
     try:
         form = await db.contact_forms.find_one({"id": form_id})
         if not form:
             raise HTTPException(status_code=404, detail="Contact form not found")
         
-        # Convert MongoDB ObjectId
-        form["id"] = str(form.get("_id", form_id))
-        if "_id" in form:
-            del form["_id"]
-            
         return ContactForm(**form)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving contact form: {str(e)}")
 
-@router.put("/forms/{form_id}/status", response_model=APIResponse)
+@router.put("/forms/{form_id}/status", response_model=APIResponse, dependencies=[Depends(admin)])
 async def update_contact_form_status(
     form_id: str,
     status: str,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage)
 ):
     """Update contact form status (admin only)"""
     try:
@@ -105,13 +91,14 @@ async def update_contact_form_status(
                 detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}"
             )
         
-        result = await db.contact_forms.update_one(
+        matched = await db.contact_forms.update_one(
             {"id": form_id},
             {"$set": {"status": status}}
         )
         
-        if result.matched_count == 0:
+        if matched == 0:
             raise HTTPException(status_code=404, detail="Contact form not found")
+        events.notify("contact", "contact.status", {"id": form_id, "status": status})
         
         return APIResponse(
             success=True,
@@ -120,14 +107,15 @@ async def update_contact_form_status(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating contact form status: {str(e)}")
 
-@router.delete("/forms/{form_id}", response_model=APIResponse)
-async def delete_contact_form(form_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+@router.delete("/forms/{form_id}", response_model=APIResponse, dependencies=[Depends(admin)])
+async def delete_contact_form(form_id: str, db: Storage = Depends(get_storage)):
     """Delete a contact form (admin only)"""
     try:
-        result = await db.contact_forms.delete_one({"id": form_id})
+        deleted = await db.contact_forms.delete_one({"id": form_id})
         
-        if result.deleted_count == 0:
+        if deleted == 0:
             raise HTTPException(status_code=404, detail="Contact form not found")
+        events.notify("contact", "contact.deleted", {"id": form_id})
         
         return APIResponse(
             success=True,
@@ -136,32 +124,27 @@ async def delete_contact_form(form_id: str, db: AsyncIOMotorDatabase = Depends(g
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting contact form: {str(e)}")
 
-@router.get("/stats")
-async def get_contact_statistics(db: AsyncIOMotorDatabase = Depends(get_database)):
+@router.get("/stream", dependencies=[Depends(admin)])
+async def stream_contact_events(request: Request):
+    """Push new contact forms and status changes as server-sent events (admin only)"""
+    subscription = events.subscribe("contact")
+    return events.EventStreamResponse(request, subscription)
+
+@router.get("/stats", dependencies=[Depends(admin)])
+async def get_contact_statistics(db: Storage = Depends(get_storage)):
     """Get contact form statistics (admin only)"""
     try:
-        total = await db.contact_forms.count_documents({})
-        pending = await db.contact_forms.count_documents({"status": "pending"})
-        contacted = await db.contact_forms.count_documents({"status": "contacted"})
-        completed = await db.contact_forms.count_documents({"status": "completed"})
-        
-        # Get submissions by month
-        pipeline = [
-            {
-                "$group": {
-                    "_id": {
-                        "year": {"$year": "$created_at"},
-                        "month": {"$month": "$created_at"}
-                    },
-                    "count": {"$sum": 1}
-                }
-            },
-            {
-                "$sort": {"_id.year": 1, "_id.month": 1}
-            }
-        ]
+        # Get counts per status and submissions by month
+        status_groups, monthly_stats = await asyncio.gather(
+            db.contact_forms.group_counts("status", {}),
+            db.contact_forms.monthly_counts("created_at", {})
+        )
+        status_counts = {group["value"]: group["count"] for group in status_groups}
         
-        monthly_stats = await db.contact_forms.aggregate(pipeline).to_list(length=None)
+        total = sum(status_counts.values())
+        pending = status_counts.get("pending", 0)
+        contacted = status_counts.get("contacted", 0)
+        completed = status_counts.get("completed", 0)
         
         return {
             "success": True,
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.encoders import jsonable_encoder
+from models import APIResponse
+from admission import admin
+from migrations import runner
+
+router = APIRouter(prefix="/api/migrations", tags=["Migrations"])
+
+@router.get("", dependencies=[Depends(admin)])
+async def get_migrations():
+    """Get every migration with its progress and last dry run"""
+    try:
+        records = await runner.status()
+        
+        return {
+            "success": True,
+            "running": runner.running(),
+            "data": jsonable_encoder(records)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving migrations: {str(e)}")
+
+@router.post("", response_model=APIResponse, status_code=202, dependencies=[Depends(admin)])
+async def run_migrations(dry_run: bool = Query(False, description="Only record what would change")):
+    """Start applying the pending migrations in the background"""
+    if not runner.start(dry_run):
+        raise HTTPException(status_code=409, detail="Migrations are already running")
+    
+    return APIResponse(
+        success=True,
+        message="Dry run started" if dry_run else "Migrations started"
+    )
@@ -1,22 +1,46 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.encoders import jsonable_encoder
+from storage import Storage
+from typing import List, Optional, Tuple
+import base64
+import binascii
+import json
+from datetime import datetime
 from models import Project, ProjectCreate, APIResponse, PaginatedResponse
-from database import get_database
+from database import get_storage
+from admission import admin, public
+from resilience import resilient_read, cache_key
+from cache import cache
+from dataloader import Loaders, get_loaders, parse_ids
+from company_stats import adjust_statistics
+from popularity import top_projects, view_counters
+from i18n import get_language, localize, localized_fields
+from gazetteer import with_coordinates
+from publishing import publisher
+from related import RELATED_K, related_projects
 
 router = APIRouter(prefix="/api/projects", tags=["Projects"])
 
-@router.get("/", response_model=PaginatedResponse)
+MAX_NEAR_RADIUS_KM = 1000
+
+@router.get("/", response_model=PaginatedResponse, dependencies=[Depends(public)])
 async def get_projects(
+    response: Response,
     page: int = Query(1, ge=1),
     per_page: int = Query(12, ge=1, le=50),
     category: Optional[str] = Query(None),
     is_featured: Optional[bool] = Query(None),
     is_active: bool = Query(True),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    ids: Optional[str] = Query(None, description="Comma-separated ids to fetch, in order"),
+    db: Storage = Depends(get_storage),
+    loaders: Loaders = Depends(get_loaders),
+    language: str = Depends(get_language)
 ):
     """Get paginated list of projects/gallery items"""
-    try:
+    if ids:
+        return await get_projects_by_ids(parse_ids(ids), response, loaders, language)
+
+    async def load():
         # Build filter
         filter_query = {"is_active": is_active}
         if category:
@@ -24,90 +48,194 @@ async def get_projects(
         if is_featured is not None:
             filter_query["is_featured"] = is_featured
         
-        # Get total count
-        total = await db.projects.count_documents(filter_query)
-        
-        # Calculate pagination
-        skip = (page - 1) * per_page
+        # Get projects sorted by creation date (newest first) along with the total count
+        projects, total = await db.projects.paginate(
+            filter_query, [("created_at", -1)], page, per_page, fields=localized_fields(Project, language)
+        )
         total_pages = (total + per_page - 1) // per_page
         
-        # Get projects sorted by creation date (newest first)
-        cursor = db.projects.find(filter_query).sort("created_at", -1).skip(skip).limit(per_page)
-        projects = await cursor.to_list(length=per_page)
-        
-        # Convert MongoDB ObjectIds
-        for project in projects:
-            project["id"] = str(project.get("_id", ""))
-            if "_id" in project:
-                del project["_id"]
-        
-        return PaginatedResponse(
+        return jsonable_encoder(PaginatedResponse(
             success=True,
             data=projects,
             total=total,
             page=page,
             per_page=per_page,
             total_pages=total_pages
+        ))
+
+    key = cache_key("projects:list", page, per_page, category, is_featured, is_active, language)
+
+    async def fetch():
+        return await cache.get_or_load("projects", key, load)
+
+    return await resilient_read(key, fetch, response)
+
+async def get_projects_by_ids(ids: List[str], response: Response, loaders: Loaders, language: str):
+    """Fetch specific projects with one query, in the requested order"""
+    async def fetch():
+        found = await loaders.localized("projects", language).load_many(ids)
+        projects = [project for project in found if project is not None]
+        
+        return PaginatedResponse(
+            success=True,
+            data=projects,
+            total=len(projects),
+            page=1,
+            per_page=len(ids),
+            total_pages=1
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving projects: {str(e)}")
 
-@router.get("/featured")
+    return await resilient_read(cache_key("projects:ids", ",".join(ids), language), fetch, response)
+
+@router.get("/featured", dependencies=[Depends(public)])
 async def get_featured_projects(
+    response: Response,
     limit: int = Query(6, ge=1, le=20),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage),
+    language: str = Depends(get_language)
+):
+    """Get featured projects for gallery display, most popular first"""
+    async def fetch():
+        # Served from the precomputed popularity ranking, shared by every language
+        projects = await top_projects(db)
+        
+        return {
+            "success": True,
+            "data": [localize(project, Project, language) for project in projects[:limit]]
+        }
+
+    return await resilient_read(cache_key("projects:featured", limit, language), fetch, response)
+
+def encode_near_cursor(project: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([project["distance"], project["id"]]).encode()).decode()
+
+def decode_near_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        distance, project_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(distance), str(project_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/near", dependencies=[Depends(public)])
+async def get_projects_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(50, gt=0, le=MAX_NEAR_RADIUS_KM, description="Search radius in km"),
+    category: Optional[str] = Query(None),
+    is_featured: Optional[bool] = Query(None),
+    limit: int = Query(12, ge=1, le=50),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    db: Storage = Depends(get_storage),
+    language: str = Depends(get_language)
 ):
-    """Get featured projects for gallery display"""
+    """Get active projects near a point, nearest first"""
+    after = decode_near_cursor(cursor) if cursor else None
     try:
-        cursor = db.projects.find({
-            "is_featured": True,
-            "is_active": True
-        }).sort("created_at", -1).limit(limit)
+        # Build filter
+        filter_query = {"is_active": True}
+        if category:
+            filter_query["category"] = category
+        if is_featured is not None:
+            filter_query["is_featured"] = is_featured
         
-        projects = await cursor.to_list(length=limit)
+        # One extra result tells whether there is a next page
+        projects = await db.projects.near(
+            "geo", lng, lat, radius * 1000, filter_query,
+            after=after, limit=limit + 1, fields=localized_fields(Project, language)
+        )
+        next_cursor = encode_near_cursor(projects[limit - 1]) if len(projects) > limit else None
         
-        # Convert MongoDB ObjectIds
-        for project in projects:
-            project["id"] = str(project.get("_id", ""))
-            if "_id" in project:
-                del project["_id"]
+        data = []
+        for project in projects[:limit]:
+            project["distance_km"] = round(project.pop("distance") / 1000, 2)
+            data.append(project)
         
         return {
             "success": True,
-            "data": projects
+            "data": jsonable_encoder(data),
+            "next_cursor": next_cursor
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving featured projects: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error retrieving nearby projects: {str(e)}")
 
-@router.get("/{project_id}", response_model=Project)
-async def get_project(project_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+@router.get("/{project_id}", response_model=Project, response_model_exclude_unset=True, dependencies=[Depends(public)])
+async def get_project(
+    project_id: str,
+    response: Response,
+    loaders: Loaders = Depends(get_loaders),
+    language: str = Depends(get_language)
+):
     """Get a specific project by ID"""
-    try:
-        project = await db.projects.find_one({"id": project_id})
+    async def load():
+        project = await loaders.localized("projects", language).load(project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
-        # Convert MongoDB ObjectId
-        project["id"] = str(project.get("_id", project_id))
-        if "_id" in project:
-            del project["_id"]
-            
-        return Project(**project)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving project: {str(e)}")
+        return jsonable_encoder(Project(**project), exclude_unset=True)
+
+    key = cache_key("projects:get", project_id, language)
+
+    async def fetch():
+        return await cache.get_or_load("projects", key, load)
+
+    return await resilient_read(key, fetch, response, timeout=1.0)
+
+@router.get("/{project_id}/related", dependencies=[Depends(public)])
+async def get_related_projects(
+    project_id: str,
+    response: Response,
+    limit: int = Query(4, ge=1, le=RELATED_K),
+    db: Storage = Depends(get_storage),
+    loaders: Loaders = Depends(get_loaders),
+    language: str = Depends(get_language)
+):
+    """Get the projects most similar to a project, most similar first"""
+    async def load():
+        # Precomputed by the related-projects job
+        project = await db.projects.find_one({"id": project_id, "is_active": True}, fields={"related_ids": 1})
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+        
+        found = await loaders.localized("projects", language).load_many(project.get("related_ids", [])[:limit])
+        
+        return {
+            "success": True,
+            "data": jsonable_encoder([related for related in found if related and related.get("is_active")])
+        }
+
+    key = cache_key("projects:related", project_id, limit, language)
+
+    async def fetch():
+        return await cache.get_or_load("projects", key, load)
+
+    return await resilient_read(key, fetch, response, timeout=1.0)
 
-@router.post("/", response_model=APIResponse)
+@router.post("/{project_id}/view", response_model=APIResponse, dependencies=[Depends(public)])
+async def record_project_view(project_id: str):
+    """Record a project view (buffered and written in periodic batches)"""
+    view_counters.record(project_id)
+    
+    return APIResponse(
+        success=True,
+        message="View recorded"
+    )
+
+@router.post("/", response_model=APIResponse, dependencies=[Depends(admin)])
 async def create_project(
     project_data: ProjectCreate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage)
 ):
     """Create a new project"""
     try:
         # Create project object
-        project = Project(**project_data.dict())
+        project = Project(**with_coordinates(project_data.dict()))
         project_dict = project.dict()
         
-        result = await db.projects.insert_one(project_dict)
+        await db.projects.insert_one(project_dict)
+        await adjust_statistics(db, active_projects=1)
+        cache.invalidate("projects")
+        publisher.mark("projects", project.id)
+        related_projects.mark(project.id)
         
         return APIResponse(
             success=True,
@@ -117,59 +245,97 @@ async def create_project(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating project: {str(e)}")
 
-@router.put("/{project_id}", response_model=APIResponse)
+@router.put("/{project_id}", response_model=APIResponse, dependencies=[Depends(admin)])
 async def update_project(
     project_id: str,
     project_data: ProjectCreate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage)
 ):
     """Update an existing project"""
     try:
-        update_data = project_data.dict()
+        update_data = with_coordinates(project_data.dict())
+        update_data["updated_at"] = datetime.utcnow()
         
-        result = await db.projects.update_one(
+        matched = await db.projects.update_one(
             {"id": project_id},
             {"$set": update_data}
         )
         
-        if result.matched_count == 0:
+        if matched == 0:
             raise HTTPException(status_code=404, detail="Project not found")
+        cache.invalidate("projects")
+        publisher.mark("projects", project_id)
+        related_projects.mark(project_id)
         
         return APIResponse(
             success=True,
             message="Project updated successfully"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating project: {str(e)}")
 
-@router.delete("/{project_id}", response_model=APIResponse)
-async def delete_project(project_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+@router.delete("/{project_id}", response_model=APIResponse, dependencies=[Depends(admin)])
+async def delete_project(project_id: str, db: Storage = Depends(get_storage)):
     """Soft delete a project (mark as inactive)"""
     try:
-        result = await db.projects.update_one(
-            {"id": project_id},
-            {"$set": {"is_active": False}}
+        matched = await db.projects.update_one(
+            {"id": project_id, "is_active": True},
+            {"$set": {"is_active": False, "deactivated_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
         )
         
-        if result.matched_count == 0:
+        if matched == 0 and not await db.projects.find_one({"id": project_id}):
             raise HTTPException(status_code=404, detail="Project not found")
+        if matched:
+            # Only a change from active to inactive moves the count
+            await adjust_statistics(db, active_projects=-1)
+        cache.invalidate("projects")
+        publisher.mark("projects", project_id)
+        related_projects.mark(project_id)
         
         return APIResponse(
             success=True,
             message="Project deleted successfully"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting project: {str(e)}")
 
-@router.get("/categories/list")
-async def get_project_categories(db: AsyncIOMotorDatabase = Depends(get_database)):
+@router.get("/categories/list", dependencies=[Depends(public)])
+async def get_project_categories(response: Response, db: Storage = Depends(get_storage)):
     """Get list of all project categories"""
-    try:
+    async def fetch():
         categories = await db.projects.distinct("category", {"is_active": True})
         
         return {
             "success": True,
             "data": categories
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving categories: {str(e)}")
\ No newline at end of file
+
+    return await resilient_read("projects:categories", fetch, response)
+
+async def project_category_facets(db: Storage):
+    """Active and featured project counts per category"""
+    # One grouping pass yields active and featured counts per category
+    groups = await db.projects.group_counts("category", {"is_active": True}, flags=["is_featured"])
+    
+    facets = [
+        {"category": group["value"], "count": group["count"], "featured_count": group["is_featured"]}
+        for group in groups
+    ]
+    return {
+        "success": True,
+        "data": facets,
+        "total": sum(facet["count"] for facet in facets),
+        "featured_total": sum(facet["featured_count"] for facet in facets)
+    }
+
+@router.get("/categories/facets", dependencies=[Depends(public)])
+async def get_project_category_facets(response: Response, db: Storage = Depends(get_storage)):
+    """Get every project category with its active and featured counts"""
+    async def fetch():
+        return await cache.get_or_load("projects", "facets", lambda: project_category_facets(db))
+
+    return await resilient_read("projects:facets", fetch, response)
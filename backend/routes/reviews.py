@@ -1,43 +1,42 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from storage import Storage
 from typing import List, Optional
+from datetime import datetime
 from models import Review, ReviewCreate, APIResponse, PaginatedResponse
-from database import get_database
+from database import get_storage
+from admission import admin, public
+from resilience import resilient_read, cache_key
+from dataloader import Loaders, get_loaders, parse_ids
+from company_stats import adjust_statistics
+from publishing import publisher
 
 router = APIRouter(prefix="/api/reviews", tags=["Reviews"])
 
-@router.get("/", response_model=PaginatedResponse)
+@router.get("/", response_model=PaginatedResponse, dependencies=[Depends(public)])
 async def get_reviews(
+    response: Response,
     page: int = Query(1, ge=1),
     per_page: int = Query(10, ge=1, le=50),
     is_active: bool = Query(True),
     min_rating: Optional[int] = Query(None, ge=1, le=5),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    ids: Optional[str] = Query(None, description="Comma-separated ids to fetch, in order"),
+    db: Storage = Depends(get_storage),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get paginated list of reviews"""
-    try:
+    if ids:
+        return await get_reviews_by_ids(parse_ids(ids), response, loaders)
+
+    async def fetch():
         # Build filter
         filter_query = {"is_active": is_active}
         if min_rating:
             filter_query["rating"] = {"$gte": min_rating}
         
-        # Get total count
-        total = await db.reviews.count_documents(filter_query)
-        
-        # Calculate pagination
-        skip = (page - 1) * per_page
+        # Get reviews sorted by date (newest first) along with the total count
+        reviews, total = await db.reviews.paginate(filter_query, [("date", -1)], page, per_page)
         total_pages = (total + per_page - 1) // per_page
         
-        # Get reviews sorted by date (newest first)
-        cursor = db.reviews.find(filter_query).sort("date", -1).skip(skip).limit(per_page)
-        reviews = await cursor.to_list(length=per_page)
-        
-        # Convert MongoDB ObjectIds
-        for review in reviews:
-            review["id"] = str(review.get("_id", ""))
-            if "_id" in review:
-                del review["_id"]
-        
         return PaginatedResponse(
             success=True,
             data=reviews,
@@ -46,54 +45,60 @@ async def get_reviews(
             per_page=per_page,
             total_pages=total_pages
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving reviews: {str(e)}")
 
-@router.get("/featured")
+    return await resilient_read(
+        cache_key("reviews:list", page, per_page, is_active, min_rating),
+        fetch, response
+    )
+
+async def get_reviews_by_ids(ids: List[str], response: Response, loaders: Loaders):
+    """Fetch specific reviews with one query, in the requested order"""
+    async def fetch():
+        found = await loaders.reviews.load_many(ids)
+        reviews = [review for review in found if review is not None]
+        
+        return PaginatedResponse(
+            success=True,
+            data=reviews,
+            total=len(reviews),
+            page=1,
+            per_page=len(ids),
+            total_pages=1
+        )
+
+    return await resilient_read(cache_key("reviews:ids", ",".join(ids)), fetch, response)
+
+@router.get("/featured", dependencies=[Depends(public)])
 async def get_featured_reviews(
+    response: Response,
     limit: int = Query(10, ge=1, le=20),
     min_rating: int = Query(4, ge=1, le=5),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage)
 ):
     """Get top-rated reviews for display on website"""
-    try:
-        cursor = db.reviews.find({
-            "is_active": True,
-            "rating": {"$gte": min_rating}
-        }).sort([("rating", -1), ("date", -1)]).limit(limit)
-        
-        reviews = await cursor.to_list(length=limit)
-        
-        # Convert MongoDB ObjectIds
-        for review in reviews:
-            review["id"] = str(review.get("_id", ""))
-            if "_id" in review:
-                del review["_id"]
+    async def fetch():
+        reviews = await db.reviews.find_many(
+            {"is_active": True, "rating": {"$gte": min_rating}},
+            [("rating", -1), ("date", -1)],
+            limit=limit
+        )
         
         return {
             "success": True,
             "data": reviews
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving featured reviews: {str(e)}")
 
-@router.get("/stats")
-async def get_review_statistics(db: AsyncIOMotorDatabase = Depends(get_database)):
+    return await resilient_read(cache_key("reviews:featured", limit, min_rating), fetch, response)
+
+@router.get("/stats", dependencies=[Depends(public)])
+async def get_review_statistics(response: Response, db: Storage = Depends(get_storage)):
     """Get review statistics"""
-    try:
-        # Get average rating
-        pipeline = [
-            {"$match": {"is_active": True}},
-            {"$group": {
-                "_id": None,
-                "average_rating": {"$avg": "$rating"},
-                "total_reviews": {"$sum": 1}
-            }}
-        ]
-        
-        stats = await db.reviews.aggregate(pipeline).to_list(length=1)
-        
-        if not stats:
+    async def fetch():
+        # Rating distribution in one grouping pass; total and average derive from it
+        groups = await db.reviews.group_counts("rating", {"is_active": True})
+        
+        total_reviews = sum(group["count"] for group in groups)
+        if total_reviews == 0:
             return {
                 "success": True,
                 "data": {
@@ -103,17 +108,10 @@ async def get_review_statistics(db: AsyncIOMotorDatabase = Depends(get_database)
                 }
             }
         
-        avg_rating = round(stats[0]["average_rating"], 1)
-        total_reviews = stats[0]["total_reviews"]
+        avg_rating = round(sum(group["value"] * group["count"] for group in groups) / total_reviews, 1)
         
-        # Get rating distribution
-        rating_distribution = {}
-        for rating in range(1, 6):
-            count = await db.reviews.count_documents({
-                "is_active": True,
-                "rating": rating
-            })
-            rating_distribution[str(rating)] = count
+        counts = {group["value"]: group["count"] for group in groups}
+        rating_distribution = {str(rating): counts.get(rating, 0) for rating in range(1, 6)}
         
         return {
             "success": True,
@@ -123,38 +121,36 @@ async def get_review_statistics(db: AsyncIOMotorDatabase = Depends(get_database)
                 "rating_distribution": rating_distribution
             }
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving review statistics: {str(e)}")
 
-@router.get("/{review_id}", response_model=Review)
-async def get_review(review_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    return await resilient_read("reviews:stats", fetch, response, timeout=3.0)
+
+@router.get("/{review_id}", response_model=Review, dependencies=[Depends(public)])
+async def get_review(review_id: str, response: Response, loaders: Loaders = Depends(get_loaders)):
     """Get a specific review by ID"""
-    try:
-        review = await db.reviews.find_one({"id": review_id})
+    async def fetch():
+        review = await loaders.reviews.load(review_id)
         if not review:
             raise HTTPException(status_code=404, detail="Review not found")
         
-        # Convert MongoDB ObjectId
-        review["id"] = str(review.get("_id", review_id))
-        if "_id" in review:
-            del review["_id"]
-            
         return Review(**review)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving review: {str(e)}")
 
-@router.post("/", response_model=APIResponse)
+    return await resilient_read(cache_key("reviews:get", review_id), fetch, response, timeout=1.0)
+
+@router.post("/", response_model=APIResponse, dependencies=[Depends(admin)])
 async def create_review(
     review_data: ReviewCreate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage)
 ):
     """Create a new review"""
     try:
         # Create review object
-        review = Review(**review_data.dict())
+        # An omitted date means "now", not null
+        review = Review(**review_data.dict(exclude_none=True))
         review_dict = review.dict()
         
-        result = await db.reviews.insert_one(review_dict)
+        await db.reviews.insert_one(review_dict)
+        await adjust_statistics(db, active_reviews=1, active_rating_total=review.rating)
+        publisher.mark("reviews", review.id)
         
         return APIResponse(
             success=True,
@@ -164,46 +160,64 @@ async def create_review(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating review: {str(e)}")
 
-@router.put("/{review_id}", response_model=APIResponse)
+@router.put("/{review_id}", response_model=APIResponse, dependencies=[Depends(admin)])
 async def update_review(
     review_id: str,
     review_data: ReviewCreate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage)
 ):
     """Update an existing review"""
     try:
         update_data = review_data.dict()
         
-        result = await db.reviews.update_one(
+        # The old rating tells how far the rating total moves
+        review = await db.reviews.find_one({"id": review_id}, fields={"rating": 1, "is_active": 1})
+        if not review:
+            raise HTTPException(status_code=404, detail="Review not found")
+        
+        matched = await db.reviews.update_one(
             {"id": review_id},
             {"$set": update_data}
         )
         
-        if result.matched_count == 0:
+        if matched == 0:
             raise HTTPException(status_code=404, detail="Review not found")
+        if review.get("is_active") and update_data["rating"] != review["rating"]:
+            # Only active reviews count towards the rating total
+            await adjust_statistics(db, active_rating_total=update_data["rating"] - review["rating"])
+        publisher.mark("reviews", review_id)
         
         return APIResponse(
             success=True,
             message="Review updated successfully"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating review: {str(e)}")
 
-@router.delete("/{review_id}", response_model=APIResponse)
-async def delete_review(review_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+@router.delete("/{review_id}", response_model=APIResponse, dependencies=[Depends(admin)])
+async def delete_review(review_id: str, db: Storage = Depends(get_storage)):
     """Soft delete a review (mark as inactive)"""
     try:
-        result = await db.reviews.update_one(
-            {"id": review_id},
-            {"$set": {"is_active": False}}
+        matched = await db.reviews.update_one(
+            {"id": review_id, "is_active": True},
+            {"$set": {"is_active": False, "deactivated_at": datetime.utcnow()}}
         )
         
-        if result.matched_count == 0:
+        if matched == 0 and not await db.reviews.find_one({"id": review_id}):
             raise HTTPException(status_code=404, detail="Review not found")
+        if matched:
+            # Only a change from active to inactive moves the count
+            review = await db.reviews.find_one({"id": review_id}, fields={"rating": 1})
+            await adjust_statistics(db, active_reviews=-1, active_rating_total=-review["rating"])
+        publisher.mark("reviews", review_id)
         
         return APIResponse(
             success=True,
             message="Review deleted successfully"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting review: {str(e)}")
\ No newline at end of file
@@ -1,75 +1,106 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.encoders import jsonable_encoder
+from storage import Storage
 from typing import List, Optional
+from datetime import datetime
 from models import Service, ServiceCreate, APIResponse, PaginatedResponse
-from database import get_database
+from database import get_storage
+from admission import admin, public
+from resilience import resilient_read, cache_key
+from cache import cache
+from dataloader import Loaders, get_loaders, parse_ids
+from i18n import get_language, localized_fields
+from publishing import publisher
 
 router = APIRouter(prefix="/api/services", tags=["Services"])
 
-@router.get("/", response_model=PaginatedResponse)
+@router.get("/", response_model=PaginatedResponse, dependencies=[Depends(public)])
 async def get_services(
+    response: Response,
     page: int = Query(1, ge=1),
     per_page: int = Query(10, ge=1, le=50),
     category: Optional[str] = Query(None),
     is_active: bool = Query(True),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    ids: Optional[str] = Query(None, description="Comma-separated ids to fetch, in order"),
+    db: Storage = Depends(get_storage),
+    loaders: Loaders = Depends(get_loaders),
+    language: str = Depends(get_language)
 ):
     """Get paginated list of services"""
-    try:
+    if ids:
+        return await get_services_by_ids(parse_ids(ids), response, loaders, language)
+
+    async def load():
         # Build filter
         filter_query = {"is_active": is_active}
         if category:
             filter_query["category"] = category
         
-        # Get total count
-        total = await db.services.count_documents(filter_query)
-        
-        # Calculate pagination
-        skip = (page - 1) * per_page
+        # Get services along with the total count
+        services, total = await db.services.paginate(
+            filter_query, None, page, per_page, fields=localized_fields(Service, language)
+        )
         total_pages = (total + per_page - 1) // per_page
         
-        # Get services
-        cursor = db.services.find(filter_query).skip(skip).limit(per_page)
-        services = await cursor.to_list(length=per_page)
-        
-        # Convert MongoDB ObjectIds
-        for service in services:
-            service["id"] = str(service.get("_id", ""))
-            if "_id" in service:
-                del service["_id"]
-        
-        return PaginatedResponse(
+        return jsonable_encoder(PaginatedResponse(
             success=True,
             data=services,
             total=total,
             page=page,
             per_page=per_page,
             total_pages=total_pages
+        ))
+
+    key = cache_key("services:list", page, per_page, category, is_active, language)
+
+    async def fetch():
+        return await cache.get_or_load("services", key, load)
+
+    return await resilient_read(key, fetch, response)
+
+async def get_services_by_ids(ids: List[str], response: Response, loaders: Loaders, language: str):
+    """Fetch specific services with one query, in the requested order"""
+    async def fetch():
+        found = await loaders.localized("services", language).load_many(ids)
+        services = [service for service in found if service is not None]
+        
+        return PaginatedResponse(
+            success=True,
+            data=services,
+            total=len(services),
+            page=1,
+            per_page=len(ids),
+            total_pages=1
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving services: {str(e)}")
 
-@router.get("/{service_id}", response_model=Service)
-async def get_service(service_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    return await resilient_read(cache_key("services:ids", ",".join(ids), language), fetch, response)
+
+@router.get("/{service_id}", response_model=Service, response_model_exclude_unset=True, dependencies=[Depends(public)])
+async def get_service(
+    service_id: str,
+    response: Response,
+    loaders: Loaders = Depends(get_loaders),
+    language: str = Depends(get_language)
+):
     """Get a specific service by ID"""
-    try:
-        service = await db.services.find_one({"id": service_id})
+    async def load():
+        service = await loaders.localized("services", language).load(service_id)
         if not service:
             raise HTTPException(status_code=404, detail="Service not found")
         
-        # Convert MongoDB ObjectId
-        service["id"] = str(service.get("_id", service_id))
-        if "_id" in service:
-            del service["_id"]
-            
-        return Service(**service)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving service: {str(e)}")
+        return jsonable_encoder(Service(**service), exclude_unset=True)
+
+    key = cache_key("services:get", service_id, language)
+
+    async def fetch():
+        return await cache.get_or_load("services", key, load)
 
-@router.post("/", response_model=APIResponse)
+    return await resilient_read(key, fetch, response, timeout=1.0)
+
+@router.post("/", response_model=APIResponse, dependencies=[Depends(admin)])
 async def create_service(
     service_data: ServiceCreate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage)
 ):
     """Create a new service"""
     try:
@@ -77,7 +108,9 @@ async def create_service(
         service = Service(**service_data.dict())
         service_dict = service.dict()
         
-        result = await db.services.insert_one(service_dict)
+        await db.services.insert_one(service_dict)
+        cache.invalidate("services")
+        publisher.mark("services", service.id)
         
         return APIResponse(
             success=True,
@@ -87,23 +120,25 @@ async def create_service(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating service: {str(e)}")
 
-@router.put("/{service_id}", response_model=APIResponse)
+@router.put("/{service_id}", response_model=APIResponse, dependencies=[Depends(admin)])
 async def update_service(
     service_id: str,
     service_data: ServiceCreate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Storage = Depends(get_storage)
 ):
     """Update an existing service"""
     try:
         update_data = service_data.dict()
         
-        result = await db.services.update_one(
+        matched = await db.services.update_one(
             {"id": service_id},
             {"$set": update_data}
         )
         
-        if result.matched_count == 0:
+        if matched == 0:
             raise HTTPException(status_code=404, detail="Service not found")
+        cache.invalidate("services")
+        publisher.mark("services", service_id)
         
         return APIResponse(
             success=True,
@@ -112,17 +147,19 @@ async def update_service(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating service: {str(e)}")
 
-@router.delete("/{service_id}", response_model=APIResponse)
-async def delete_service(service_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+@router.delete("/{service_id}", response_model=APIResponse, dependencies=[Depends(admin)])
+async def delete_service(service_id: str, db: Storage = Depends(get_storage)):
     """Soft delete a service (mark as inactive)"""
     try:
-        result = await db.services.update_one(
+        matched = await db.services.update_one(
             {"id": service_id},
-            {"$set": {"is_active": False}}
+            {"$set": {"is_active": False, "deactivated_at": datetime.utcnow()}}
         )
         
-        if result.matched_count == 0:
+        if matched == 0:
             raise HTTPException(status_code=404, detail="Service not found")
+        cache.invalidate("services")
+        publisher.mark("services", service_id)
         
         return APIResponse(
             success=True,
@@ -131,15 +168,34 @@ async def delete_service(service_id: str, db: AsyncIOMotorDatabase = Depends(get
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting service: {str(e)}")
 
-@router.get("/categories/list")
-async def get_service_categories(db: AsyncIOMotorDatabase = Depends(get_database)):
+@router.get("/categories/list", dependencies=[Depends(public)])
+async def get_service_categories(response: Response, db: Storage = Depends(get_storage)):
     """Get list of all service categories"""
-    try:
+    async def fetch():
         categories = await db.services.distinct("category", {"is_active": True})
         
         return {
             "success": True,
             "data": categories
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving categories: {str(e)}")
\ No newline at end of file
+
+    return await resilient_read("services:categories", fetch, response)
+
+async def service_category_facets(db: Storage):
+    """Active service counts per category"""
+    groups = await db.services.group_counts("category", {"is_active": True})
+    
+    facets = [{"category": group["value"], "count": group["count"]} for group in groups]
+    return {
+        "success": True,
+        "data": facets,
+        "total": sum(facet["count"] for facet in facets)
+    }
+
+@router.get("/categories/facets", dependencies=[Depends(public)])
+async def get_service_category_facets(response: Response, db: Storage = Depends(get_storage)):
+    """Get every service category with its active count"""
+    async def fetch():
+        return await cache.get_or_load("services", "facets", lambda: service_category_facets(db))
+
+    return await resilient_read("services:facets", fetch, response)
@@ -0,0 +1,201 @@
+"""
+In-process scheduler for background jobs.
+
+Jobs run on interval or cron triggers, with optional random jitter and a
+per-run timeout. An exclusive job takes a lease in the `scheduler_leases`
+collection before running, so with several workers only one of them runs
+each occurrence. The lease is held for most of the job's period and is not
+released early. Other jobs run in every process; they work on per-process
+state such as the view counters and the read cache. Without MongoDB (the
+memory engine) there is one process and every lease is granted.
+
+Run counts and durations are exported through metrics.py.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+import metrics
+from database import database
+
+logger = logging.getLogger(__name__)
+
+LEASE_COLLECTION = "scheduler_leases"
+
+job_runs = metrics.Counter("scheduler_job_runs_total", "Job runs by outcome (success, failure, timeout, skipped)")
+job_duration = metrics.Histogram("scheduler_job_duration_seconds", "Wall time of job runs")
+job_last_success = metrics.Gauge("scheduler_job_last_success_timestamp_seconds", "Unix time of the last successful run")
+
+
+class IntervalTrigger:
+    """Fires every `seconds`"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def next_after(self, moment: datetime) -> datetime:
+        return moment + timedelta(seconds=self.seconds)
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in field.split(","):
+        expression, _, step = part.partition("/")
+        if expression == "*":
+            start, end = low, high
+        elif "-" in expression:
+            start, end = (int(bound) for bound in expression.split("-"))
+        else:
+            start = end = int(expression)
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field '{field}' is outside {low}-{high}")
+        values.update(range(start, end + 1, int(step or 1)))
+    return values
+
+
+class CronTrigger:
+    """Fires on a five-field cron expression (minute hour day month weekday), in UTC"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' needs five fields")
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        # Both 0 and 7 mean Sunday
+        self.weekdays = {day % 7 for day in _parse_cron_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        # Cron fires when either restricted day field matches
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError("Cron expression never fires")
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], Awaitable[Any]]
+    trigger: Any
+    timeout: float
+    jitter: float = 0
+    exclusive: bool = False
+    run_at_start: bool = False
+
+
+async def acquire_lease(name: str, owner: str, seconds: float) -> bool:
+    """Take or extend the lease on `name` unless another worker holds it"""
+    if database.database is None:
+        return True
+    now = datetime.utcnow()
+    try:
+        await database.database[LEASE_COLLECTION].update_one(
+            {"_id": name, "$or": [{"expires_at": {"$lte": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The lease exists and is held by someone else
+        return False
+
+
+async def release_lease(name: str, owner: str):
+    """Give up the lease on `name` if `owner` still holds it"""
+    if database.database is None:
+        return
+    await database.database[LEASE_COLLECTION].delete_one({"_id": name, "owner": owner})
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: List[asyncio.Task] = []
+
+    def add(self, job: Job):
+        self.jobs[job.name] = job
+
+    async def run_job(self, job: Job, lease_seconds: Optional[float] = None) -> str:
+        """Run one occurrence of `job`, returning its outcome"""
+        if job.exclusive:
+            try:
+                leased = await acquire_lease(job.name, self.owner, max(lease_seconds or 0, job.timeout))
+            except PyMongoError as e:
+                logger.warning(f"Could not take the lease for job {job.name}: {e!r}")
+                leased = False
+            if not leased:
+                job_runs.inc(job=job.name, status="skipped")
+                return "skipped"
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(job.func(), job.timeout)
+            status = "success"
+            job_last_success.set(time.time(), job=job.name)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            logger.warning(f"Job {job.name} timed out after {job.timeout}s")
+        except Exception as e:
+            status = "failure"
+            logger.warning(f"Job {job.name} failed: {e!r}")
+        job_runs.inc(job=job.name, status=status)
+        job_duration.observe(time.perf_counter() - started, job=job.name)
+        return status
+
+    async def _run_forever(self, job: Job):
+        now = datetime.utcnow()
+        due = now if job.run_at_start else job.trigger.next_after(now)
+        while True:
+            delay = (due - datetime.utcnow()).total_seconds() + random.uniform(0, job.jitter)
+            await asyncio.sleep(max(delay, 0))
+            following = job.trigger.next_after(due)
+            # Keep the lease for most of the period so no other worker repeats this occurrence
+            await self.run_job(job, (following - due).total_seconds() * 0.9)
+            # Occurrences missed while the job ran are skipped, not queued
+            due = job.trigger.next_after(max(due, datetime.utcnow()))
+
+    async def start(self):
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._run_forever(job), name=f"job:{job.name}"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+scheduler = Scheduler()
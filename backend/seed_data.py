@@ -10,6 +10,7 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 import random
+import uuid
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
@@ -127,7 +128,7 @@ async def seed_projects(db):
     projects = []
     for i, img in enumerate(project_images):
         project = {
-            "id": f"project_{i+1}",
+            "_id": f"project_{i+1}",
             "title": img["title"],
             "description": img["description"],
             "image_url": img["url"],
@@ -221,7 +222,7 @@ async def seed_reviews(db):
     reviews = []
     for i, review_data in enumerate(reviews_data):
         review = {
-            "id": f"review_{i+1}",
+            "_id": f"review_{i+1}",
             "name": review_data["name"],
             "rating": review_data["rating"],
             "text": review_data["text"],
@@ -247,6 +248,8 @@ async def update_statistics(db):
     stats_data = {
         "projects_completed": max(projects_count, 100),
         "happy_clients": max(reviews_count * 10, 150),
+        "active_projects": projects_count,
+        "active_reviews": reviews_count,
         "years_experience": 5,
         "team_members": 25,
         "updated_at": datetime.now()
@@ -254,7 +257,7 @@ async def update_statistics(db):
     
     await db.statistics.update_one(
         {},
-        {"$set": stats_data},
+        {"$set": stats_data, "$setOnInsert": {"_id": str(uuid.uuid4())}},
         upsert=True
     )
     
@@ -1,11 +1,24 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import logging
 from pathlib import Path
 
 # Import database connection functions
-from database import connect_to_mongo, close_mongo_connection
+from database import connect_to_database, close_mongo_connection
+import resilience
+import popularity
+import events
+import metrics
+import publishing
+from jobs import register_jobs
+from scheduler import scheduler
+from profiling import ProfilingMiddleware
+from logs import RequestLoggingMiddleware, configure_logging
+from tenancy import TenantMiddleware
+import tracing
 
 # Import route modules
 from routes.company import router as company_router
@@ -13,23 +26,39 @@ from routes.services import router as services_router
 from routes.projects import router as projects_router
 from routes.contact import router as contact_router
 from routes.reviews import router as reviews_router
+from routes.batch import router as batch_router
+from routes.migrations import router as migrations_router
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (queued, written by a background thread)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Tracing is off unless TRACING_EXPORTER is set
+tracing.configure_tracing()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up Al-Sawda Warehouses API...")
-    await connect_to_mongo()
+    await resilience.start()
+    try:
+        await connect_to_database()
+    except Exception:
+        # Keep serving the last good results until MongoDB is reachable again
+        logger.warning("MongoDB unavailable at startup, serving read snapshots")
+        resilience.breaker.trip()
+    await events.start()
+    register_jobs(scheduler)
+    await scheduler.start()
     yield
     # Shutdown
     logger.info("Shutting down Al-Sawda Warehouses API...")
+    await scheduler.stop()
+    await events.stop()
+    await popularity.stop()
+    await resilience.stop()
     await close_mongo_connection()
+    tracing.shutdown()
 
 # Create FastAPI app with lifespan
 app = FastAPI(
@@ -39,6 +68,8 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Tenant resolution runs inside CORS so its 404/429 answers carry CORS headers
+app.add_middleware(TenantMiddleware)
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -47,6 +78,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+app.add_middleware(RequestLoggingMiddleware)
 
 # Include routers
 app.include_router(company_router)
@@ -54,6 +88,12 @@ app.include_router(services_router)
 app.include_router(projects_router)
 app.include_router(contact_router)
 app.include_router(reviews_router)
+app.include_router(batch_router)
+app.include_router(migrations_router)
+
+# Sitemaps and feeds, written by the feeds-publish job (StaticFiles adds ETags)
+publishing.PUBLISH_DIR.mkdir(parents=True, exist_ok=True)
+app.mount("/api/published", StaticFiles(directory=publishing.PUBLISH_DIR), name="published")
 
 # Root endpoint
 @app.get("/api/")
@@ -73,6 +113,12 @@ async def health_check():
         "message": "Al-Sawda Warehouses API is running smoothly"
     }
 
+# Metrics endpoint (Prometheus text format)
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    # Logging is configured above; access records come from RequestLoggingMiddleware
+    uvicorn.run(app, host="0.0.0.0", port=8001, log_config=None, access_log=False)
\ No newline at end of file
@@ -0,0 +1,785 @@
+"""
+Storage engines behind the API routers.
+
+Routers talk to a `Storage` whose attributes are one `Repository` per
+collection. Filters, sorts and updates use the MongoDB query language (the
+subset the routers need), so the Motor engine passes them straight through
+while the in-memory engine evaluates them itself. The in-memory engine lets
+small edge deployments and local test runs serve the full API without mongod.
+
+Documents are identified by the model's UUID `id`. MongoDB stores it as
+`_id`; the Motor engine renames it on the way in and projects `_id` back to
+`id` on the server, so callers never see `_id`.
+
+`Storage.scoped()` limits every repository to the documents of one tenant
+(see tenancy.py).
+
+Select the engine with STORAGE_ENGINE=mongo (default) or STORAGE_ENGINE=memory.
+"""
+
+import asyncio
+import copy
+import math
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pydantic import BaseModel
+
+from models import CompanyInfo, ContactForm, Project, Review, Service, Statistics
+
+Filter = Dict[str, Any]
+Sort = Sequence[Tuple[str, int]]
+# Fields to return: {name: 1} keeps a field, {name: "$other"} or
+# {name: {"$ifNull": ["$a", "$b"]}} computes it; `id` is always returned
+Fields = Dict[str, Any]
+
+# Collection name -> model describing its documents
+COLLECTION_MODELS = {
+    "company_info": CompanyInfo,
+    "services": Service,
+    "projects": Project,
+    "reviews": Review,
+    "contact_forms": ContactForm,
+    "statistics": Statistics,
+}
+COLLECTIONS = tuple(COLLECTION_MODELS)
+
+
+# The application id: `_id`, or on documents migrate_ids has not re-keyed yet
+# the UUID they carry in `id` (their ObjectId _id as a string when they have none)
+ID_EXPRESSION = {"$ifNull": ["$id", {"$toString": "$_id"}]}
+# Documents migrate_ids has not re-keyed yet
+LEGACY_IDS = {"_id": {"$type": "objectId"}}
+
+
+def model_projection(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Projection returning a model's fields with `_id` renamed to `id` server-side"""
+    projection: Dict[str, Any] = {"_id": 0, "id": ID_EXPRESSION}
+    projection.update({name: 1 for name in model.model_fields if name != "id"})
+    return projection
+
+
+def _to_mongo_filter(filter: Filter, legacy_ids: bool = False) -> Filter:
+    """Address the application id through `_id`, or also `id` while legacy documents remain"""
+    encoded: Filter = {}
+    fallbacks = []
+    for key, condition in filter.items():
+        if key in ("$and", "$or"):
+            condition = [_to_mongo_filter(sub, legacy_ids) for sub in condition]
+        if key == "id" and legacy_ids:
+            fallbacks.append({"$or": [{"_id": condition}, {"id": condition}]})
+            continue
+        encoded["_id" if key == "id" else key] = condition
+    if fallbacks:
+        encoded["$and"] = [*encoded.get("$and", []), *fallbacks]
+    return encoded
+
+
+def _to_mongo_document(document: Dict) -> Dict:
+    if "id" not in document:
+        return document
+    encoded = {key: value for key, value in document.items() if key != "id"}
+    encoded["_id"] = document["id"]
+    return encoded
+
+
+def _from_mongo_document(document: Dict) -> Dict:
+    """A stored document addressed by `id`, the way ID_EXPRESSION reads it"""
+    decoded = {key: value for key, value in document.items() if key != "_id"}
+    decoded.setdefault("id", str(document["_id"]))
+    return decoded
+
+
+def _log_add_expression(field: str, value: float) -> Dict[str, Any]:
+    """ln(exp($field) + exp(value)), computed without leaving log space"""
+    high = {"$max": ["$$current", value]}
+    low = {"$min": ["$$current", value]}
+    return {"$let": {
+        "vars": {"current": {"$ifNull": [f"${field}", -math.inf]}},
+        "in": {"$add": [high, {"$ln": {"$add": [1, {"$exp": {"$subtract": [low, high]}}]}}]},
+    }}
+
+
+def log_add(current: Optional[float], value: float) -> float:
+    """ln(exp(current) + exp(value)), where a missing current counts as log 0"""
+    if current is None:
+        return value
+    high, low = max(current, value), min(current, value)
+    return high + math.log1p(math.exp(low - high))
+
+
+class Repository(ABC):
+    """Collection operations used by the routers"""
+
+    @abstractmethod
+    async def find_one(self, filter: Filter, fields: Optional[Fields] = None) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    async def find_many(self, filter: Filter, sort: Optional[Sort] = None, skip: int = 0, limit: int = 0,
+                        fields: Optional[Fields] = None) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    async def find_raw(self, filter: Filter, sort: Optional[Sort] = None, limit: int = 0) -> List[Dict]:
+        """Whole stored documents, fields outside the model included"""
+
+    @abstractmethod
+    async def count(self, filter: Filter) -> int:
+        ...
+
+    @abstractmethod
+    async def distinct(self, field: str, filter: Filter) -> List[Any]:
+        ...
+
+    @abstractmethod
+    async def insert_one(self, document: Dict):
+        ...
+
+    @abstractmethod
+    async def insert_many(self, documents: List[Dict]):
+        ...
+
+    @abstractmethod
+    async def update_one(self, filter: Filter, update: Dict, upsert: bool = False) -> int:
+        """Apply a $set/$inc/$unset update, returning the matched count"""
+
+    @abstractmethod
+    async def delete_one(self, filter: Filter) -> int:
+        """Delete one document, returning the deleted count"""
+
+    @abstractmethod
+    async def delete_many(self, filter: Filter) -> int:
+        """Delete every matching document, returning the deleted count"""
+
+    @abstractmethod
+    async def increment_many(self, increments: Dict[str, Dict[str, float]],
+                             log_increments: Optional[Dict[str, Dict[str, float]]] = None):
+        """Apply {id: {field: delta}} counter increments in one batch
+
+        `log_increments` {id: {field: x}} adds exp(x) to fields holding a
+        natural logarithm (a missing field counts as log 0), so sums whose
+        terms grow exponentially stay in float range. Both apply atomically
+        per document.
+        """
+
+    @abstractmethod
+    async def set_many(self, values: Dict[str, Dict[str, Any]]):
+        """Apply {id: {field: value}} updates in one batch"""
+
+    @abstractmethod
+    async def upsert_many(self, key: str, updates: Dict[Any, Dict], filter: Optional[Filter] = None):
+        """Apply {key value: update} in one batch, inserting documents not found
+
+        Each update may use $setOnInsert, including for the new document's `id`.
+        Equality conditions in `filter` narrow the match and are set on inserts.
+        """
+
+    @abstractmethod
+    async def near(self, field: str, longitude: float, latitude: float, max_meters: float, filter: Filter,
+                   after: Optional[Tuple[float, str]] = None, limit: int = 0,
+                   fields: Optional[Fields] = None) -> List[Dict]:
+        """Documents whose GeoJSON point `field` is within `max_meters`, nearest first
+
+        Each document gets its `distance` in meters. Ties are ordered by id, and
+        `after` is the (distance, id) of the last document of the previous page.
+        """
+
+    @abstractmethod
+    async def group_counts(self, field: str, filter: Filter, flags: Iterable[str] = ()) -> List[Dict]:
+        """Count documents per value of `field`, plus how many have each flag set
+
+        Returns [{"value": ..., "count": n, "<flag>": m, ...}] sorted by value.
+        """
+
+    @abstractmethod
+    async def monthly_counts(self, date_field: str, filter: Filter) -> List[Dict]:
+        """Count documents per calendar month of `date_field`
+
+        Returns [{"_id": {"year": y, "month": m}, "count": n}] in date order.
+        """
+
+    async def paginate(self, filter: Filter, sort: Optional[Sort], page: int, per_page: int,
+                       fields: Optional[Fields] = None) -> Tuple[List[Dict], int]:
+        """Return one page of documents and the total match count"""
+        items, total = await asyncio.gather(
+            self.find_many(filter, sort, skip=(page - 1) * per_page, limit=per_page, fields=fields),
+            self.count(filter)
+        )
+        return items, total
+
+
+class MotorRepository(Repository):
+    """Repository backed by a MongoDB collection keyed by the model UUID"""
+
+    def __init__(self, collection: AsyncIOMotorCollection, model: Type[BaseModel]):
+        self.collection = collection
+        self.projection = model_projection(model)
+        # Set while documents keyed by ObjectId remain, so lookups by id also try `id`
+        self.legacy_ids = False
+
+    async def detect_legacy_ids(self) -> bool:
+        """Check whether the collection still holds documents to re-key"""
+        self.legacy_ids = await self.collection.find_one(LEGACY_IDS, {"_id": 1}) is not None
+        return self.legacy_ids
+
+    def _filter(self, filter: Filter) -> Filter:
+        return _to_mongo_filter(filter, self.legacy_ids)
+
+    def _projection(self, fields: Optional[Fields]) -> Dict[str, Any]:
+        if fields is None:
+            return self.projection
+        return {"_id": 0, "id": ID_EXPRESSION, **fields}
+
+    async def find_one(self, filter, fields=None):
+        return await self.collection.find_one(self._filter(filter), self._projection(fields))
+
+    async def find_many(self, filter, sort=None, skip=0, limit=0, fields=None):
+        cursor = self.collection.find(self._filter(filter), self._projection(fields))
+        if sort:
+            cursor = cursor.sort([("_id" if field == "id" else field, direction) for field, direction in sort])
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=limit or None)
+
+    async def find_raw(self, filter, sort=None, limit=0):
+        cursor = self.collection.find(self._filter(filter))
+        if sort:
+            cursor = cursor.sort([("_id" if field == "id" else field, direction) for field, direction in sort])
+        if limit:
+            cursor = cursor.limit(limit)
+        return [_from_mongo_document(document) for document in await cursor.to_list(length=limit or None)]
+
+    async def count(self, filter):
+        if not filter:
+            # Read the size from collection metadata instead of scanning it
+            return await self.collection.estimated_document_count()
+        return await self.collection.count_documents(self._filter(filter))
+
+    async def distinct(self, field, filter):
+        return await self.collection.distinct(field, self._filter(filter))
+
+    async def insert_one(self, document):
+        await self.collection.insert_one(_to_mongo_document(document))
+
+    async def insert_many(self, documents):
+        await self.collection.insert_many([_to_mongo_document(doc) for doc in documents], ordered=False)
+
+    def _upsert(self, filter: Filter, update: Dict) -> Dict:
+        """`update` for an upsert, making sure a new document gets a UUID _id"""
+        on_insert = _to_mongo_document(update.get("$setOnInsert", {}))
+        if "_id" not in on_insert:
+            doc_id = filter.get("id")
+            if not isinstance(doc_id, str):
+                # Otherwise the server would make up an ObjectId
+                on_insert["_id"] = str(uuid.uuid4())
+            elif self.legacy_ids:
+                # The id fallback filter leaves the server no _id to insert with
+                on_insert["_id"] = doc_id
+        return {**update, "$setOnInsert": on_insert} if on_insert else update
+
+    async def update_one(self, filter, update, upsert=False):
+        if upsert:
+            update = self._upsert(filter, update)
+        result = await self.collection.update_one(self._filter(filter), update, upsert=upsert)
+        return result.matched_count
+
+    async def delete_one(self, filter):
+        result = await self.collection.delete_one(self._filter(filter))
+        return result.deleted_count
+
+    async def delete_many(self, filter):
+        result = await self.collection.delete_many(self._filter(filter))
+        return result.deleted_count
+
+    async def increment_many(self, increments, log_increments=None):
+        log_increments = log_increments or {}
+        operations = []
+        for doc_id in {**increments, **log_increments}:
+            fields, logs = increments.get(doc_id, {}), log_increments.get(doc_id, {})
+            if not logs:
+                operations.append(UpdateOne({"_id": doc_id}, {"$inc": fields}))
+                continue
+            # An update pipeline, as $inc has no logarithmic counterpart
+            stage = {field: {"$add": [{"$ifNull": [f"${field}", 0]}, delta]} for field, delta in fields.items()}
+            stage.update({field: _log_add_expression(field, value) for field, value in logs.items()})
+            operations.append(UpdateOne({"_id": doc_id}, [{"$set": stage}]))
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def set_many(self, values):
+        if not values:
+            return
+        await self.collection.bulk_write(
+            [UpdateOne({"_id": doc_id}, {"$set": fields}) for doc_id, fields in values.items()],
+            ordered=False
+        )
+
+    async def upsert_many(self, key, updates, filter=None):
+        if not updates:
+            return
+        operations = []
+        for value, update in updates.items():
+            upsert_filter = {**(filter or {}), key: value}
+            operations.append(UpdateOne(self._filter(upsert_filter), self._upsert(upsert_filter, update), upsert=True))
+        await self.collection.bulk_write(operations, ordered=False)
+
+    async def near(self, field, longitude, latitude, max_meters, filter, after=None, limit=0, fields=None):
+        geo_near = {
+            "near": {"type": "Point", "coordinates": [longitude, latitude]},
+            "key": field,
+            "distanceField": "distance",
+            "maxDistance": max_meters,
+            "spherical": True,
+            "query": self._filter(filter),
+        }
+        pipeline: List[Dict[str, Any]] = [{"$geoNear": geo_near}]
+        if after is not None:
+            distance, last_id = after
+            geo_near["minDistance"] = distance
+            pipeline.append({"$match": {"$or": [
+                {"distance": {"$gt": distance}},
+                {"distance": distance, "_id": {"$gt": last_id}},
+            ]}})
+        pipeline.append({"$sort": {"distance": 1, "_id": 1}})
+        if limit:
+            pipeline.append({"$limit": limit})
+        pipeline.append({"$project": {**self._projection(fields), "distance": 1}})
+        return await self.collection.aggregate(pipeline).to_list(length=None)
+
+    async def group_counts(self, field, filter, flags=()):
+        filter = self._filter(filter)
+        group = {"_id": f"${field}", "count": {"$sum": 1}}
+        for flag in flags:
+            group[flag] = {"$sum": {"$cond": [f"${flag}", 1, 0]}}
+        pipeline = [{"$match": filter}, {"$group": group}, {"$sort": {"_id": 1}}]
+        groups = await self.collection.aggregate(pipeline).to_list(length=None)
+        return [{"value": group.pop("_id"), **group} for group in groups]
+
+    async def monthly_counts(self, date_field, filter):
+        pipeline = [
+            {"$match": self._filter(filter)},
+            {
+                "$group": {
+                    "_id": {
+                        "year": {"$year": f"${date_field}"},
+                        "month": {"$month": f"${date_field}"}
+                    },
+                    "count": {"$sum": 1}
+                }
+            },
+            {"$sort": {"_id.year": 1, "_id.month": 1}}
+        ]
+        return await self.collection.aggregate(pipeline).to_list(length=None)
+
+
+def _get_path(document: Dict, path: str) -> Any:
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _has_path(document: Dict, path: str) -> bool:
+    """Whether the field is present, even if null (MongoDB's $exists)"""
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return False
+        value = value[part]
+    return True
+
+
+def _set_path(document: Dict, path: str, value: Any):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[leaf] = value
+
+
+def _unset_path(document: Dict, path: str):
+    *parents, leaf = path.split(".")
+    parent = _get_path(document, ".".join(parents)) if parents else document
+    if isinstance(parent, dict):
+        parent.pop(leaf, None)
+
+
+def _compare(value: Any, operator: str, operand: Any) -> bool:
+    if operator == "$eq":
+        return value == operand
+    if operator == "$ne":
+        return value != operand
+    if operator == "$in":
+        return value in operand
+    if operator == "$nin":
+        return value not in operand
+    if value is None:
+        return False
+    if operator == "$gt":
+        return value > operand
+    if operator == "$gte":
+        return value >= operand
+    if operator == "$lt":
+        return value < operand
+    if operator == "$lte":
+        return value <= operand
+    raise ValueError(f"Unsupported query operator {operator}")
+
+
+def matches(document: Dict, filter: Filter) -> bool:
+    """Evaluate a MongoDB-style filter against a document"""
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches(document, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            value = _get_path(document, key)
+            for op, operand in condition.items():
+                if op == "$exists":
+                    if _has_path(document, key) != bool(operand):
+                        return False
+                elif not _compare(value, op, operand):
+                    return False
+        elif _get_path(document, key) != condition:
+            return False
+    return True
+
+
+def _evaluate(document: Dict, expression: Any) -> Any:
+    """Evaluate the projection expressions the routers use"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get_path(document, expression[1:])
+    if isinstance(expression, dict) and "$ifNull" in expression:
+        for candidate in expression["$ifNull"]:
+            value = _evaluate(document, candidate)
+            if value is not None:
+                return value
+        return None
+    return expression
+
+
+def project(document: Dict, fields: Optional[Fields]) -> Dict:
+    """Apply a `Fields` projection to a document"""
+    if fields is None:
+        return copy.deepcopy(document)
+    projected = {"id": document["id"]}
+    for name, spec in fields.items():
+        if spec == 1 or spec is True:
+            if name in document:
+                projected[name] = copy.deepcopy(document[name])
+        else:
+            value = _evaluate(document, spec)
+            # Like MongoDB, a computed field that resolves to nothing is left out
+            if value is not None:
+                projected[name] = copy.deepcopy(value)
+    return projected
+
+
+def _distance_meters(longitude: float, latitude: float, point: Any) -> Optional[float]:
+    """Great-circle distance to a GeoJSON point, on MongoDB's earth radius"""
+    if not isinstance(point, dict) or not point.get("coordinates"):
+        return None
+    other_longitude, other_latitude = point["coordinates"]
+    phi1, phi2 = math.radians(latitude), math.radians(other_latitude)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(other_longitude - longitude)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * 6378100 * math.asin(math.sqrt(a))
+
+
+def _sort_key(value: Any) -> Tuple[bool, Any]:
+    # MongoDB orders missing/null before any value
+    return (value is not None, value if value is not None else 0)
+
+
+def apply_update(document: Dict, update: Dict, inserting: bool = False):
+    """Apply $set/$inc/$unset/$setOnInsert to a document in place"""
+    for operator, fields in update.items():
+        if operator == "$set" or (operator == "$setOnInsert" and inserting):
+            for field, value in fields.items():
+                _set_path(document, field, value)
+        elif operator == "$inc":
+            for field, delta in fields.items():
+                _set_path(document, field, (_get_path(document, field) or 0) + delta)
+        elif operator == "$unset":
+            for field in fields:
+                _unset_path(document, field)
+        elif operator != "$setOnInsert":
+            raise ValueError(f"Unsupported update operator {operator}")
+
+
+class MemoryRepository(Repository):
+    """Repository backed by a dict of documents keyed by `id`
+
+    Given a model, reads without `fields` return only the model's fields,
+    as the Motor engine does; without one they return whole documents.
+    """
+
+    def __init__(self, model: Optional[Type[BaseModel]] = None):
+        self._documents: Dict[Any, Dict] = {}
+        self.projection = {name: 1 for name in model.model_fields if name != "id"} if model else None
+
+    def _project(self, document: Dict, fields: Optional[Fields]) -> Dict:
+        return project(document, self.projection if fields is None else fields)
+
+    def _candidates(self, filter: Filter) -> Iterable[Dict]:
+        # Equality on the id is the hot single-item lookup
+        doc_id = filter.get("id")
+        if doc_id is not None and not isinstance(doc_id, dict):
+            doc = self._documents.get(doc_id)
+            return [doc] if doc is not None else []
+        return self._documents.values()
+
+    def _select(self, filter: Filter) -> List[Dict]:
+        return [doc for doc in self._candidates(filter) if matches(doc, filter)]
+
+    async def find_one(self, filter, fields=None):
+        for doc in self._candidates(filter):
+            if matches(doc, filter):
+                return self._project(doc, fields)
+        return None
+
+    def _find(self, filter: Filter, sort: Optional[Sort], skip: int, limit: int) -> List[Dict]:
+        docs = self._select(filter)
+        for field, direction in reversed(list(sort or [])):
+            docs.sort(key=lambda doc: _sort_key(_get_path(doc, field)), reverse=direction < 0)
+        return docs[skip:skip + limit] if limit else docs[skip:]
+
+    async def find_many(self, filter, sort=None, skip=0, limit=0, fields=None):
+        return [self._project(doc, fields) for doc in self._find(filter, sort, skip, limit)]
+
+    async def find_raw(self, filter, sort=None, limit=0):
+        return [copy.deepcopy(doc) for doc in self._find(filter, sort, 0, limit)]
+
+    async def count(self, filter):
+        return len(self._select(filter))
+
+    async def distinct(self, field, filter):
+        values = []
+        for doc in self._select(filter):
+            value = _get_path(doc, field)
+            if value is not None and value not in values:
+                values.append(value)
+        return values
+
+    def _store(self, document: Dict):
+        document = copy.deepcopy(document)
+        document.setdefault("id", str(uuid.uuid4()))
+        if document["id"] in self._documents:
+            raise ValueError(f"Duplicate id {document['id']}")
+        self._documents[document["id"]] = document
+
+    async def insert_one(self, document):
+        self._store(document)
+
+    async def insert_many(self, documents):
+        for document in documents:
+            self._store(document)
+
+    async def update_one(self, filter, update, upsert=False):
+        for doc in self._candidates(filter):
+            if matches(doc, filter):
+                apply_update(doc, update)
+                return 1
+        if upsert:
+            document = {k: v for k, v in filter.items() if not k.startswith("$") and not isinstance(v, dict)}
+            apply_update(document, update, inserting=True)
+            self._store(document)
+        return 0
+
+    async def delete_one(self, filter):
+        for doc in self._candidates(filter):
+            if matches(doc, filter):
+                del self._documents[doc["id"]]
+                return 1
+        return 0
+
+    async def delete_many(self, filter):
+        doomed = [doc["id"] for doc in self._select(filter)]
+        for doc_id in doomed:
+            del self._documents[doc_id]
+        return len(doomed)
+
+    async def increment_many(self, increments, log_increments=None):
+        for doc_id, fields in increments.items():
+            doc = self._documents.get(doc_id)
+            if doc is not None:
+                apply_update(doc, {"$inc": fields})
+        for doc_id, fields in (log_increments or {}).items():
+            doc = self._documents.get(doc_id)
+            if doc is not None:
+                for field, value in fields.items():
+                    _set_path(doc, field, log_add(_get_path(doc, field), value))
+
+    async def set_many(self, values):
+        for doc_id, fields in values.items():
+            doc = self._documents.get(doc_id)
+            if doc is not None:
+                apply_update(doc, {"$set": copy.deepcopy(fields)})
+
+    async def upsert_many(self, key, updates, filter=None):
+        for value, update in updates.items():
+            await self.update_one({**(filter or {}), key: value}, copy.deepcopy(update), upsert=True)
+
+    async def near(self, field, longitude, latitude, max_meters, filter, after=None, limit=0, fields=None):
+        found = []
+        for doc in self._select(filter):
+            distance = _distance_meters(longitude, latitude, _get_path(doc, field))
+            if distance is None or distance > max_meters:
+                continue
+            if after is not None and (distance, doc["id"]) <= after:
+                continue
+            found.append((distance, doc))
+        found.sort(key=lambda pair: (pair[0], pair[1]["id"]))
+        if limit:
+            found = found[:limit]
+        return [{**self._project(doc, fields), "distance": distance} for distance, doc in found]
+
+    async def group_counts(self, field, filter, flags=()):
+        groups: Dict[Any, Dict[str, int]] = {}
+        for doc in self._select(filter):
+            value = _get_path(doc, field)
+            group = groups.setdefault(value, {"count": 0, **{flag: 0 for flag in flags}})
+            group["count"] += 1
+            for flag in flags:
+                if _get_path(doc, flag):
+                    group[flag] += 1
+        return [{"value": value, **groups[value]} for value in sorted(groups, key=_sort_key)]
+
+    async def monthly_counts(self, date_field, filter):
+        counts: Dict[Tuple[int, int], int] = defaultdict(int)
+        for doc in self._select(filter):
+            value = _get_path(doc, date_field)
+            if isinstance(value, datetime):
+                counts[(value.year, value.month)] += 1
+        return [
+            {"_id": {"year": year, "month": month}, "count": counts[(year, month)]}
+            for year, month in sorted(counts)
+        ]
+
+
+class ScopedRepository(Repository):
+    """A repository limited to the documents matching `scope` (e.g. one tenant's)
+
+    Every filter is narrowed by the scope and every new document is stamped
+    with it; the scope fields are not returned, except by find_raw. Batch
+    updates by id pass through, since ids are unique across scopes and come
+    from scoped reads.
+    """
+
+    def __init__(self, repository: Repository, scope: Dict[str, Any]):
+        self.repository = repository
+        self.scope = scope
+
+    def _filter(self, filter: Filter) -> Filter:
+        return {**filter, **self.scope}
+
+    def _strip(self, document: Optional[Dict]) -> Optional[Dict]:
+        if document is not None:
+            for name in self.scope:
+                document.pop(name, None)
+        return document
+
+    async def find_one(self, filter, fields=None):
+        return self._strip(await self.repository.find_one(self._filter(filter), fields))
+
+    async def find_many(self, filter, sort=None, skip=0, limit=0, fields=None):
+        documents = await self.repository.find_many(self._filter(filter), sort, skip, limit, fields)
+        return [self._strip(document) for document in documents]
+
+    async def find_raw(self, filter, sort=None, limit=0):
+        return await self.repository.find_raw(self._filter(filter), sort, limit)
+
+    async def count(self, filter):
+        return await self.repository.count(self._filter(filter))
+
+    async def distinct(self, field, filter):
+        return await self.repository.distinct(field, self._filter(filter))
+
+    async def insert_one(self, document):
+        await self.repository.insert_one({**document, **self.scope})
+
+    async def insert_many(self, documents):
+        await self.repository.insert_many([{**document, **self.scope} for document in documents])
+
+    async def update_one(self, filter, update, upsert=False):
+        # An upsert copies the scope's equality conditions into the new document
+        return await self.repository.update_one(self._filter(filter), update, upsert)
+
+    async def delete_one(self, filter):
+        return await self.repository.delete_one(self._filter(filter))
+
+    async def delete_many(self, filter):
+        return await self.repository.delete_many(self._filter(filter))
+
+    async def increment_many(self, increments, log_increments=None):
+        await self.repository.increment_many(increments, log_increments)
+
+    async def set_many(self, values):
+        await self.repository.set_many(values)
+
+    async def upsert_many(self, key, updates, filter=None):
+        await self.repository.upsert_many(key, updates, self._filter(filter or {}))
+
+    async def near(self, field, longitude, latitude, max_meters, filter, after=None, limit=0, fields=None):
+        documents = await self.repository.near(
+            field, longitude, latitude, max_meters, self._filter(filter), after, limit, fields
+        )
+        return [self._strip(document) for document in documents]
+
+    async def group_counts(self, field, filter, flags=()):
+        return await self.repository.group_counts(field, self._filter(filter), flags)
+
+    async def monthly_counts(self, date_field, filter):
+        return await self.repository.monthly_counts(date_field, self._filter(filter))
+
+
+class Storage:
+    """One repository per collection"""
+
+    company_info: Repository
+    services: Repository
+    projects: Repository
+    reviews: Repository
+    contact_forms: Repository
+    statistics: Repository
+
+    def __init__(self, repositories: Dict[str, Repository]):
+        self._repositories = repositories
+        self._scoped: Dict[Tuple[str, Any], "Storage"] = {}
+        for name, repository in repositories.items():
+            setattr(self, name, repository)
+
+    def __getitem__(self, name: str) -> Repository:
+        return self._repositories[name]
+
+    def scoped(self, field: str, value: Any) -> "Storage":
+        """The same collections limited to documents whose `field` is `value`"""
+        storage = self._scoped.get((field, value))
+        if storage is None:
+            storage = Storage({
+                name: ScopedRepository(repository, {field: value})
+                for name, repository in self._repositories.items()
+            })
+            self._scoped[(field, value)] = storage
+        return storage
+
+
+def motor_storage(db: AsyncIOMotorDatabase) -> Storage:
+    return Storage({name: MotorRepository(db[name], model) for name, model in COLLECTION_MODELS.items()})
+
+
+def memory_storage() -> Storage:
+    return Storage({name: MemoryRepository(model) for name, model in COLLECTION_MODELS.items()})
@@ -0,0 +1,299 @@
+"""
+Multi-tenant mode: several company sites served by one deployment.
+
+With TENANCY=host the tenant is chosen by the request's Host header, and
+with TENANCY=path by a /t/<tenant> prefix, which becomes the root path.
+TENANTS_FILE lists the tenants (see tenants.example.json):
+
+    [{"id": "alsawda", "hosts": ["alsawda-warehouses.sa"],
+      "site_url": "https://alsawda-warehouses.sa", "name": "...",
+      "rate_limit": 50, "rate_burst": 100, "review_source": "..."}]
+
+Every document carries its tenant's id in `tenant_id`, which leads every
+index. `database.current_storage()` returns repositories scoped to the tenant
+of the request (or of the job) being run, and cache namespaces, read
+snapshots, event topics and published files are kept apart per tenant the
+same way. Each tenant has its own request rate limit, a token bucket per
+process, so one busy site cannot take the shared worker pool from the others.
+
+With TENANCY=off (the default) nothing is scoped and documents carry no
+tenant id, as before.
+
+Move a single-company deployment's data in with:
+    python tenancy.py adopt <tenant> --from-db <database>
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+
+import metrics
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+TENANCY = os.environ.get('TENANCY', 'off')
+TENANTS_FILE = Path(os.environ.get('TENANTS_FILE', ROOT_DIR / 'tenants.json'))
+TENANT_RATE_LIMIT = float(os.environ.get('TENANT_RATE_LIMIT', '50'))
+TENANT_RATE_BURST = int(os.environ.get('TENANT_RATE_BURST', '100'))
+ADOPT_BATCH_SIZE = int(os.environ.get('TENANT_ADOPT_BATCH_SIZE', '500'))
+
+TENANT_FIELD = "tenant_id"
+DUPLICATE_KEY = 11000
+PATH_PREFIX = "/t/"
+PUBLISHED_PATH = "/api/published/"
+# Answered without a tenant, for load balancers, the metrics scraper and
+# operators (migrations span every tenant)
+UNSCOPED_PATHS = {"/api/health", "/api/metrics", "/api/migrations"}
+
+rejections = metrics.Counter("tenant_rejections_total", "Requests turned away, by tenant and reason (unknown, rate_limited)")
+
+
+@dataclass(eq=False)
+class Tenant:
+    id: str
+    hosts: List[str] = field(default_factory=list)
+    site_url: str = ""
+    name: str = ""
+    rate_limit: float = TENANT_RATE_LIMIT
+    rate_burst: int = TENANT_RATE_BURST
+    review_source: str = ""
+
+
+class TokenBucket:
+    """Allows `rate` requests a second on average, in bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token, returning 0 or the seconds until one is available"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+
+def enabled() -> bool:
+    return TENANCY != "off"
+
+
+def root_path(tenant: Optional[Tenant]) -> str:
+    """The prefix a tenant's API is served under ("" unless TENANCY=path)"""
+    return PATH_PREFIX + tenant.id if tenant is not None and TENANCY == "path" else ""
+
+
+def load_tenants(path: Path) -> Dict[str, Tenant]:
+    with open(path, encoding="utf-8") as f:
+        return {entry["id"]: Tenant(**entry) for entry in json.load(f)}
+
+
+tenants: Dict[str, Tenant] = load_tenants(TENANTS_FILE) if enabled() else {}
+_by_host = {host.lower(): tenant for tenant in tenants.values() for host in tenant.hosts}
+_buckets = {tenant.id: TokenBucket(tenant.rate_limit, tenant.rate_burst) for tenant in tenants.values()}
+
+_tenant: contextvars.ContextVar[Optional[Tenant]] = contextvars.ContextVar("tenant", default=None)
+
+
+def current_tenant() -> Optional[Tenant]:
+    return _tenant.get()
+
+
+def current_tenant_id() -> Optional[str]:
+    tenant = _tenant.get()
+    return tenant.id if tenant else None
+
+
+def scoped(name: str, tenant_id: Optional[str] = None) -> str:
+    """`name` qualified by the current (or given) tenant, unchanged when there is none"""
+    tenant_id = tenant_id or current_tenant_id()
+    return f"{tenant_id}:{name}" if tenant_id else name
+
+
+@contextmanager
+def use_tenant(tenant: Optional[Tenant]) -> Iterator[None]:
+    """Run the block on behalf of `tenant`"""
+    token = _tenant.set(tenant)
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+
+def for_each_tenant(job: Callable[[], Awaitable[None]]) -> Callable[[], Awaitable[None]]:
+    """Wrap a scheduler job so it runs once per tenant (or once, when tenancy is off)"""
+    if not enabled():
+        return job
+
+    async def run_for_each_tenant():
+        for tenant in tenants.values():
+            with use_tenant(tenant):
+                try:
+                    await job()
+                except Exception as e:
+                    # One tenant's failure should not starve the others
+                    logger.error(f"{job.__name__} failed for tenant {tenant.id}: {e!r}")
+
+    run_for_each_tenant.__name__ = job.__name__
+    return run_for_each_tenant
+
+
+def _host(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"host":
+            return value.decode("latin-1").split(":", 1)[0].lower()
+    return ""
+
+
+def _route_path(scope) -> str:
+    root_path = scope.get("root_path", "")
+    return scope["path"][len(root_path):] if scope["path"].startswith(root_path) else scope["path"]
+
+
+def _resolve(scope) -> Optional[Tenant]:
+    if TENANCY == "host":
+        return _by_host.get(_host(scope))
+    path = _route_path(scope)
+    if not path.startswith(PATH_PREFIX):
+        return None
+    tenant_id = path[len(PATH_PREFIX):].split("/", 1)[0]
+    tenant = tenants.get(tenant_id)
+    if tenant is not None:
+        # Route below the prefix, which redirects and generated URLs keep
+        scope["root_path"] = scope.get("root_path", "") + PATH_PREFIX + tenant_id
+    return tenant
+
+
+async def _reject(send, status: int, detail: str, headers: Optional[List] = None):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    *(headers or [])],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class TenantMiddleware:
+    """ASGI middleware choosing the tenant of each request and enforcing its rate limit"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Sub-requests of a batch run inside the parent's tenant
+        if not enabled() or scope["type"] != "http" or _tenant.get() is not None:
+            await self.app(scope, receive, send)
+            return
+        if scope["path"] in UNSCOPED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        tenant = _resolve(scope)
+        if tenant is None:
+            rejections.inc(tenant="", reason="unknown")
+            await _reject(send, 404, "Unknown site")
+            return
+        retry_after = _buckets[tenant.id].take()
+        if retry_after:
+            rejections.inc(tenant=tenant.id, reason="rate_limited")
+            await _reject(send, 429, "Too many requests", [(b"retry-after", str(math.ceil(retry_after)).encode())])
+            return
+
+        # Published files live in a directory per tenant
+        path = _route_path(scope)
+        if path.startswith(PUBLISHED_PATH):
+            scope["path"] = f"{scope.get('root_path', '')}{PUBLISHED_PATH}{tenant.id}/{path[len(PUBLISHED_PATH):]}"
+            scope["raw_path"] = scope["path"].encode()
+        scope["tenant"] = tenant.id
+        with use_tenant(tenant):
+            await self.app(scope, receive, send)
+
+
+async def adopt(db, tenant_id: str, source, batch_size: int = ADOPT_BATCH_SIZE) -> Dict[str, int]:
+    """Copy a single-company database into the shared one under `tenant_id`
+
+    Re-running skips what was already copied. An id another tenant already
+    uses (seeded ids such as "review_1") gets a fresh UUID.
+    """
+    from storage import COLLECTIONS
+
+    counts = {}
+    for name in COLLECTIONS:
+        copied = 0
+        batch = []
+        async for document in source[name].find({}):
+            document[TENANT_FIELD] = tenant_id
+            batch.append(document)
+            if len(batch) == batch_size:
+                copied += await _insert_new(db[name], tenant_id, batch)
+                batch = []
+        if batch:
+            copied += await _insert_new(db[name], tenant_id, batch)
+        counts[name] = copied
+    return counts
+
+
+async def _insert_new(collection, tenant_id: str, documents: List[Dict]) -> int:
+    try:
+        result = await collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        inserted = e.details["nInserted"]
+        duplicates = {error["op"]["_id"]: error["op"] for error in e.details["writeErrors"]
+                      if error["code"] == DUPLICATE_KEY}
+        if len(duplicates) < len(e.details["writeErrors"]):
+            raise
+    # Duplicates already under this tenant come from an earlier run
+    taken = await collection.distinct(
+        "_id", {"_id": {"$in": list(duplicates)}, TENANT_FIELD: {"$ne": tenant_id}}
+    )
+    for doc_id in taken:
+        await collection.insert_one({**duplicates[doc_id], "_id": str(uuid.uuid4())})
+        logger.warning(f"{collection.name} {doc_id} is taken by another tenant, copied under a new id")
+    return inserted + len(taken)
+
+
+async def main(options: argparse.Namespace):
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
+    db = client[os.environ.get('DB_NAME', 'alsawda_warehouses')]
+
+    counts = await adopt(db, options.tenant, client[options.from_db], options.batch_size)
+    for name, count in counts.items():
+        print(f"🏢 {name}: copied {count} documents into {options.tenant}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the tenants of a shared deployment")
+    commands = parser.add_subparsers(dest="command", required=True)
+    adopt_parser = commands.add_parser("adopt", help="copy a single-company database in as a tenant")
+    adopt_parser.add_argument("tenant", help="tenant id, as listed in the tenants file")
+    adopt_parser.add_argument("--from-db", required=True, help="database of the deployment being consolidated")
+    adopt_parser.add_argument("--batch-size", type=int, default=ADOPT_BATCH_SIZE)
+    asyncio.run(main(parser.parse_args()))
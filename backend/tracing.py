@@ -0,0 +1,201 @@
+"""
+Distributed tracing with OpenTelemetry.
+
+TracingMiddleware starts a server span per request, continuing the trace of
+a W3C `traceparent` header sent by the proxy. A command listener on the
+Motor client adds a child span per MongoDB command with the collection,
+operation and duration. The read cache marks hits and misses as span events,
+and response encoding in resilient_read gets its own span.
+
+Set TRACING_EXPORTER to choose where spans go:
+    otlp  OTLP over HTTP; the endpoint comes from OTEL_EXPORTER_OTLP_ENDPOINT
+          (default http://localhost:4318)
+    file  JSON lines appended to TRACING_FILE, for tests and local runs
+
+TRACING_SAMPLE_RATIO sets the fraction of new traces that are recorded.
+Requests whose caller already decided to sample follow that decision.
+Unsampled requests create no command spans. Without an exporter, or without
+the opentelemetry packages, every helper here does nothing.
+"""
+
+import logging
+import os
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+import logs
+
+try:
+    from opentelemetry import context as otel_context, propagate, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:
+    trace = None
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', '')
+TRACING_FILE = Path(os.environ.get('TRACING_FILE', ROOT_DIR / 'traces.jsonl'))
+TRACING_SAMPLE_RATIO = float(os.environ.get('TRACING_SAMPLE_RATIO', '0.05'))
+SERVICE_NAME = os.environ.get('OTEL_SERVICE_NAME', 'alsawda-api')
+
+_provider = None
+_tracer = None
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def _exporter():
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if TRACING_EXPORTER == "file":
+        TRACING_FILE.parent.mkdir(parents=True, exist_ok=True)
+        return ConsoleSpanExporter(
+            out=open(TRACING_FILE, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n"
+        )
+    raise ValueError(f"Unknown TRACING_EXPORTER '{TRACING_EXPORTER}'")
+
+
+def configure_tracing():
+    """Set up the tracer provider when an exporter is configured"""
+    global _provider, _tracer
+    if not TRACING_EXPORTER or _tracer is not None:
+        return
+    if trace is None:
+        logger.warning("TRACING_EXPORTER is set but the opentelemetry packages are not installed")
+        return
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO))
+    )
+    # Spans are exported in batches from a background thread
+    _provider.add_span_processor(BatchSpanProcessor(_exporter()))
+    _tracer = _provider.get_tracer(__name__)
+    logger.info(f"Tracing to {TRACING_EXPORTER} at sample ratio {TRACING_SAMPLE_RATIO}")
+
+
+def shutdown():
+    """Export the spans still buffered"""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def _recording() -> bool:
+    return _tracer is not None and trace.get_current_span().is_recording()
+
+
+def span(name: str, **attributes: Any):
+    """Child span of the current request span (no-op when it is not sampled)"""
+    if not _recording():
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def annotate(name: str, **attributes: Any):
+    """Add an event to the current span"""
+    if _recording():
+        trace.get_current_span().add_event(name, attributes=attributes)
+
+
+class CommandTracer(monitoring.CommandListener):
+    """One client span per MongoDB command, parented to the issuing request"""
+
+    def __init__(self):
+        self._spans: Dict[Tuple[Any, int], Any] = {}
+
+    def started(self, event):
+        # Motor runs the command in a thread with a copy of the request's context
+        if not _recording():
+            return
+        collection = event.command.get(event.command_name)
+        attributes = {
+            "db.system": "mongodb",
+            "db.name": event.database_name,
+            "db.operation": event.command_name,
+        }
+        if isinstance(collection, str):
+            attributes["db.mongodb.collection"] = collection
+        self._spans[(event.connection_id, event.request_id)] = _tracer.start_span(
+            f"mongodb.{event.command_name}",
+            kind=SpanKind.CLIENT,
+            attributes=attributes,
+            start_time=time.time_ns()
+        )
+
+    def _end(self, event, error: str = ""):
+        command_span = self._spans.pop((event.connection_id, event.request_id), None)
+        if command_span is None:
+            return
+        command_span.set_attribute("db.duration_ms", event.duration_micros / 1000)
+        if error:
+            command_span.set_status(Status(StatusCode.ERROR, error))
+        command_span.end()
+
+    def succeeded(self, event):
+        self._end(event)
+
+    def failed(self, event):
+        self._end(event, str(event.failure.get("errmsg", "command failed")))
+
+
+def command_listeners() -> List[monitoring.CommandListener]:
+    """Listeners to register on the Motor client"""
+    return [CommandTracer()] if enabled() else []
+
+
+class TracingMiddleware:
+    """ASGI middleware starting a server span for each request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _tracer is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        token = otel_context.attach(propagate.extract(carrier))
+        status = {}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            with _tracer.start_as_current_span(
+                f"{scope['method']} {scope['path']}",
+                kind=SpanKind.SERVER,
+                attributes={"http.method": scope["method"], "url.path": scope["path"]}
+            ) as request_span:
+                if logs.current_request_id():
+                    request_span.set_attribute("http.request_id", logs.current_request_id())
+                await self.app(scope, receive, send_with_status)
+                route = scope.get("route")
+                if route is not None:
+                    # Name by route template so spans group across ids
+                    request_span.update_name(f"{scope['method']} {route.path}")
+                    request_span.set_attribute("http.route", route.path)
+                if "code" in status:
+                    request_span.set_attribute("http.status_code", status["code"])
+                    if status["code"] >= 500:
+                        request_span.set_status(Status(StatusCode.ERROR))
+        finally:
+            otel_context.detach(token)
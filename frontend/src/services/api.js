@@ -10,6 +10,8 @@ const api = axios.create({
   timeout: 10000,
   headers: {
     'Content-Type': 'application/json',
+    // The site shows the Arabic text only; skip the English copies
+    'Accept-Language': 'ar',
   },
 });
 
@@ -87,6 +89,16 @@ export const servicesApi = {
     }
   },
 
+  // Get categories with item counts (one request for all filter tabs)
+  getCategoryFacets: async () => {
+    try {
+      const response = await api.get('/services/categories/facets');
+      return { success: true, data: response.data.data };
+    } catch (error) {
+      return { success: false, error: error.response?.data?.detail || error.message };
+    }
+  },
+
   // Get single service
   getById: async (serviceId) => {
     try {
@@ -96,6 +108,16 @@ export const servicesApi = {
       return { success: false, error: error.response?.data?.detail || error.message };
     }
   },
+
+  // Get several services in one request, in the given order
+  getByIds: async (ids) => {
+    try {
+      const response = await api.get('/services', { params: { ids: ids.join(',') } });
+      return { success: true, data: response.data };
+    } catch (error) {
+      return { success: false, error: error.response?.data?.detail || error.message };
+    }
+  },
 };
 
 // Projects/Gallery
@@ -126,6 +148,33 @@ export const projectsApi = {
     }
   },
 
+  // Get projects near a point, nearest first (pass nextCursor to continue)
+  getNear: async (lat, lng, radius = 50, { category = null, featured = null, limit = 12, cursor = null } = {}) => {
+    try {
+      const params = { lat, lng, radius, limit };
+      if (category) params.category = category;
+      if (featured !== null) params.is_featured = featured;
+      if (cursor) params.cursor = cursor;
+      
+      const response = await api.get('/projects/near', { params });
+      return { success: true, data: response.data.data, nextCursor: response.data.next_cursor };
+    } catch (error) {
+      return { success: false, error: error.response?.data?.detail || error.message };
+    }
+  },
+
+  // Get the projects most similar to a project
+  getRelated: async (id, limit = 4) => {
+    try {
+      const response = await api.get(`/projects/${id}/related`, {
+        params: { limit }
+      });
+      return { success: true, data: response.data.data };
+    } catch (error) {
+      return { success: false, error: error.response?.data?.detail || error.message };
+    }
+  },
+
   // Get project categories
   getCategories: async () => {
     try {
@@ -136,6 +185,16 @@ export const projectsApi = {
     }
   },
 
+  // Get categories with item counts (one request for all filter tabs)
+  getCategoryFacets: async () => {
+    try {
+      const response = await api.get('/projects/categories/facets');
+      return { success: true, data: response.data.data };
+    } catch (error) {
+      return { success: false, error: error.response?.data?.detail || error.message };
+    }
+  },
+
   // Get single project
   getById: async (projectId) => {
     try {
@@ -145,6 +204,26 @@ export const projectsApi = {
       return { success: false, error: error.response?.data?.detail || error.message };
     }
   },
+
+  // Get several projects in one request, in the given order
+  getByIds: async (ids) => {
+    try {
+      const response = await api.get('/projects', { params: { ids: ids.join(',') } });
+      return { success: true, data: response.data };
+    } catch (error) {
+      return { success: false, error: error.response?.data?.detail || error.message };
+    }
+  },
+
+  // Record a project view (feeds the popularity ranking)
+  recordView: async (projectId) => {
+    try {
+      await api.post(`/projects/${projectId}/view`);
+      return { success: true };
+    } catch (error) {
+      return { success: false, error: error.response?.data?.detail || error.message };
+    }
+  },
 };
 
 // Reviews
@@ -193,6 +272,29 @@ export const reviewsApi = {
       return { success: false, error: error.response?.data?.detail || error.message };
     }
   },
+
+  // Get several reviews in one request, in the given order
+  getByIds: async (ids) => {
+    try {
+      const response = await api.get('/reviews', { params: { ids: ids.join(',') } });
+      return { success: true, data: response.data };
+    } catch (error) {
+      return { success: false, error: error.response?.data?.detail || error.message };
+    }
+  },
+};
+
+// Batch
+export const batchApi = {
+  // Run several GET requests in one round trip: [{ id, path, params }] -> [{ id, status, body }]
+  run: async (requests) => {
+    try {
+      const response = await api.post('/batch', { requests });
+      return { success: true, data: response.data.responses };
+    } catch (error) {
+      return { success: false, error: error.response?.data?.detail || error.message };
+    }
+  },
 };
 
 // Contact
@@ -216,6 +318,15 @@ export const contactApi = {
       return { success: false, error: error.response?.data?.detail || error.message };
     }
   },
+
+  // Listen for new submissions and status changes (admin); returns a function that stops listening
+  subscribe: (onEvent) => {
+    const source = new EventSource(`${API_BASE}/contact/stream`);
+    ['contact.created', 'contact.status', 'contact.deleted', 'resync'].forEach((type) => {
+      source.addEventListener(type, (event) => onEvent(type, JSON.parse(event.data)));
+    });
+    return () => source.close();
+  },
 };
 
 // Generic API functions
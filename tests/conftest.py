@@ -0,0 +1,15 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend is a flat set of modules run from its own directory
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("STORAGE_ENGINE", "memory")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
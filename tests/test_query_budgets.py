@@ -0,0 +1,112 @@
+"""
+Per-route MongoDB query budgets (see backend/query_audit.py).
+
+Needs a mongod at TEST_MONGO_URL (default mongodb://localhost:27017) and is
+skipped without one. The module seeds a throwaway database once, then calls
+each route in-process and fails any case over its command budget or with a
+plan that scans more than it returns.
+"""
+
+import os
+import uuid
+
+import httpx
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+import query_audit
+from database import database
+from monitoring import command_listener
+from query_audit import AuditCase
+from storage import motor_storage
+
+pytestmark = pytest.mark.anyio
+
+TEST_MONGO_URL = os.environ.get('TEST_MONGO_URL', 'mongodb://localhost:27017')
+
+# Paths may name a sample document: {project}, {service}, {review}, {form},
+# or {projects}, {services}, {reviews} for three ids of a kind
+CASES = [
+    AuditCase("/api/company/info", 1),
+    AuditCase("/api/company/info?lang=en", 1),
+    AuditCase("/api/company/stats", 1),
+    AuditCase("/api/services/", 2),
+    AuditCase("/api/services/?category=design", 2),
+    AuditCase("/api/services/?ids={services}", 1),
+    AuditCase("/api/services/{service}", 1),
+    AuditCase("/api/services/categories/list", 1),
+    AuditCase("/api/services/categories/facets", 1),
+    AuditCase("/api/projects/", 2),
+    AuditCase("/api/projects/?lang=en", 2),
+    AuditCase("/api/projects/?category={project.category}", 2),
+    AuditCase("/api/projects/?is_featured=true", 2),
+    AuditCase("/api/projects/?ids={projects}", 1),
+    AuditCase("/api/projects/featured", 2),
+    AuditCase("/api/projects/near?lat={project.lat}&lng={project.lng}", 1),
+    AuditCase("/api/projects/near?lat={project.lat}&lng={project.lng}&category={project.category}", 1),
+    AuditCase("/api/projects/{project}", 1),
+    # The stored related ids, then one batch lookup of the projects
+    AuditCase("/api/projects/{project}/related", 2),
+    AuditCase("/api/projects/categories/list", 1),
+    AuditCase("/api/projects/categories/facets", 1),
+    AuditCase("/api/reviews/", 2),
+    AuditCase("/api/reviews/?min_rating=4", 2, max_examined_ratio=3.0),
+    AuditCase("/api/reviews/?ids={reviews}", 1),
+    AuditCase("/api/reviews/featured", 1, max_examined_ratio=3.0),
+    AuditCase("/api/reviews/stats", 1),
+    AuditCase("/api/reviews/{review}", 1),
+    AuditCase("/api/contact/forms", 2),
+    AuditCase("/api/contact/forms?status=pending", 2),
+    AuditCase("/api/contact/forms/{form}", 1),
+    # Dashboard rollups over every submission
+    AuditCase("/api/contact/stats", 2, allow_collscan=True),
+]
+
+
+@pytest.fixture(scope="module")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="module")
+async def audit():
+    client = AsyncIOMotorClient(TEST_MONGO_URL, serverSelectionTimeoutMS=500, event_listeners=[command_listener])
+    try:
+        await client.admin.command("ping")
+    except PyMongoError:
+        client.close()
+        pytest.skip(f"no mongod at {TEST_MONGO_URL}")
+
+    db_name = f"query_audit_{uuid.uuid4().hex[:8]}"
+    previous = database.client, database.database, database.storage
+    database.client = client
+    database.database = client[db_name]
+    database.storage = motor_storage(database.database)
+    try:
+        await query_audit.seed()
+        values = await query_audit.sample_values()
+        sizes = await query_audit.collection_sizes()
+
+        # Imported late so the routers see the audit database
+        from server import app
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://query-audit") as http:
+            yield http, values, sizes
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+        database.client, database.database, database.storage = previous
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case.path for case in CASES])
+async def test_route_within_budget(audit, case):
+    http, values, sizes = audit
+    problems = await query_audit.audit_case(http, case, query_audit.fill_path(case.path, values), sizes)
+    assert not problems, f"{case.path}: " + "; ".join(problems)
+
+
+async def test_audit_reports_a_route_over_budget(audit):
+    http, values, sizes = audit
+    problems = await query_audit.audit_case(http, AuditCase("/api/projects/", 1), "/api/projects/", sizes)
+    assert "2 commands (budget 1)" in problems
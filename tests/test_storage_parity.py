@@ -0,0 +1,176 @@
+"""
+The memory and Motor storage engines run through the same cases.
+
+The Motor side needs a mongod at TEST_MONGO_URL (default
+mongodb://localhost:27017) and is skipped without one; each run uses a
+throwaway database.
+"""
+
+import math
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+from models import Project
+from storage import MemoryRepository, MotorRepository
+
+pytestmark = pytest.mark.anyio
+
+TEST_MONGO_URL = os.environ.get('TEST_MONGO_URL', 'mongodb://localhost:27017')
+
+PROJECTS = [
+    {"id": "p1", "title": "a", "description": "d", "image_url": "u", "category": "villas",
+     "is_featured": True, "is_active": True, "view_count": 3, "created_at": datetime(2024, 1, 5)},
+    {"id": "p2", "title": "b", "description": "d", "image_url": "u", "category": "villas",
+     "is_featured": False, "is_active": True, "view_count": 1, "created_at": datetime(2024, 1, 20)},
+    {"id": "p3", "title": "c", "description": "d", "image_url": "u", "category": "offices",
+     "is_featured": True, "is_active": True, "view_count": 7, "created_at": datetime(2024, 3, 2)},
+    {"id": "p4", "title": "d", "description": "d", "image_url": "u", "category": "shops",
+     "is_featured": False, "is_active": False, "view_count": 0, "created_at": datetime(2024, 3, 9)},
+]
+
+
+@pytest.fixture(params=["memory", "motor"])
+async def projects(request):
+    if request.param == "memory":
+        repository = MemoryRepository(Project)
+        await repository.insert_many(PROJECTS)
+        yield repository
+        return
+
+    client = AsyncIOMotorClient(TEST_MONGO_URL, serverSelectionTimeoutMS=500)
+    try:
+        await client.admin.command("ping")
+    except PyMongoError:
+        client.close()
+        pytest.skip(f"no mongod at {TEST_MONGO_URL}")
+    db_name = f"parity_{uuid.uuid4().hex[:8]}"
+    repository = MotorRepository(client[db_name]["projects"], Project)
+    await repository.insert_many(PROJECTS)
+    yield repository
+    await client.drop_database(db_name)
+    client.close()
+
+
+async def test_find_one(projects):
+    assert (await projects.find_one({"id": "p2"}))["title"] == "b"
+    assert (await projects.find_one({"category": "offices"}))["id"] == "p3"
+    assert await projects.find_one({"id": "missing"}) is None
+
+
+async def test_find_many_sorts_skips_and_limits(projects):
+    found = await projects.find_many({"is_active": True}, [("created_at", -1)], skip=1, limit=1)
+    assert [doc["id"] for doc in found] == ["p2"]
+    found = await projects.find_many({"view_count": {"$gte": 1}}, [("category", 1), ("id", -1)])
+    assert [doc["id"] for doc in found] == ["p3", "p2", "p1"]
+    found = await projects.find_many({"$or": [{"category": "shops"}, {"id": {"$in": ["p1"]}}]}, [("id", 1)])
+    assert [doc["id"] for doc in found] == ["p1", "p4"]
+
+
+async def test_reads_return_only_model_fields(projects):
+    await projects.update_one({"id": "p1"}, {"$set": {"related_ids": ["p2"], "tenant_id": "t1"}})
+    doc = await projects.find_one({"id": "p1"})
+    assert "related_ids" not in doc and "tenant_id" not in doc
+    assert [set(doc) - set(Project.model_fields) for doc in await projects.find_many({})] == [set()] * 4
+    assert (await projects.find_one({"id": "p1"}, fields={"related_ids": 1}))["related_ids"] == ["p2"]
+
+
+async def test_find_raw_returns_whole_documents(projects):
+    await projects.update_one({"id": "p1"}, {"$set": {"related_ids": ["p2"], "tenant_id": "t1"}})
+    found = await projects.find_raw({"is_active": True}, [("id", -1)], limit=2)
+    assert [doc["id"] for doc in found] == ["p3", "p2"]
+    (doc,) = await projects.find_raw({"id": "p1"})
+    assert doc["related_ids"] == ["p2"] and doc["tenant_id"] == "t1" and "_id" not in doc
+
+
+async def test_exists_counts_null_as_present(projects):
+    await projects.update_one({"id": "p1"}, {"$set": {"location": None}})
+    found = await projects.find_many({"location": {"$exists": True}})
+    assert [doc["id"] for doc in found] == ["p1"]
+    assert await projects.count({"location": {"$exists": False}}) == 3
+    assert await projects.count({"location": None}) == 4
+
+
+async def test_find_many_fields(projects):
+    found = await projects.find_many(
+        {"id": "p1"}, fields={"title": 1, "heading": {"$ifNull": ["$title_en", "$title"]}}
+    )
+    assert found == [{"id": "p1", "title": "a", "heading": "a"}]
+
+
+async def test_count_and_distinct(projects):
+    assert await projects.count({}) == 4
+    assert await projects.count({"is_active": True, "is_featured": True}) == 2
+    assert sorted(await projects.distinct("category", {"is_active": True})) == ["offices", "villas"]
+
+
+async def test_update_one(projects):
+    assert await projects.update_one({"id": "p1"}, {"$set": {"title": "z"}, "$inc": {"view_count": 2}}) == 1
+    doc = await projects.find_one({"id": "p1"})
+    assert (doc["title"], doc["view_count"]) == ("z", 5)
+    assert await projects.update_one({"id": "missing"}, {"$set": {"title": "z"}}) == 0
+
+
+async def test_update_one_upsert(projects):
+    matched = await projects.update_one(
+        {"id": "p9"}, {"$set": {"title": "new"}, "$setOnInsert": {"category": "villas"}}, upsert=True
+    )
+    assert matched == 0
+    doc = await projects.find_one({"id": "p9"})
+    assert (doc["title"], doc["category"]) == ("new", "villas")
+
+
+async def test_upsert_without_id_gets_a_uuid(projects):
+    await projects.update_one({"title": "fresh"}, {"$set": {"category": "shops"}}, upsert=True)
+    await projects.upsert_many("title", {"fresher": {"$set": {"category": "shops"}}})
+    for title in ("fresh", "fresher"):
+        doc = await projects.find_one({"title": title})
+        assert uuid.UUID(doc["id"]) and await projects.find_one({"id": doc["id"]}) == doc
+
+
+async def test_delete(projects):
+    assert await projects.delete_one({"id": "p1"}) == 1
+    assert await projects.delete_one({"id": "p1"}) == 0
+    assert await projects.delete_many({"category": "villas"}) == 1
+    assert await projects.count({}) == 2
+
+
+async def test_increment_and_set_many(projects):
+    await projects.increment_many({"p1": {"view_count": 10}, "p2": {"view_count": -1}})
+    await projects.set_many({"p3": {"is_featured": False}})
+    found = await projects.find_many({}, [("id", 1)])
+    assert [doc["view_count"] for doc in found] == [13, 0, 7, 0]
+    assert found[2]["is_featured"] is False
+
+
+async def test_paginate(projects):
+    items, total = await projects.paginate({"is_active": True}, [("created_at", -1)], page=2, per_page=2)
+    assert ([doc["id"] for doc in items], total) == (["p1"], 3)
+
+
+async def test_group_counts(projects):
+    groups = await projects.group_counts("category", {"is_active": True}, flags=["is_featured"])
+    assert groups == [
+        {"value": "offices", "count": 1, "is_featured": 1},
+        {"value": "villas", "count": 2, "is_featured": 1},
+    ]
+
+
+async def test_monthly_counts(projects):
+    assert await projects.monthly_counts("created_at", {}) == [
+        {"_id": {"year": 2024, "month": 1}, "count": 2},
+        {"_id": {"year": 2024, "month": 3}, "count": 2},
+    ]
+
+
+async def test_increment_many_in_log_space(projects):
+    await projects.increment_many({"p1": {"view_count": 1}}, {"p1": {"score": math.log(2)}, "p2": {"score": 1000.0}})
+    await projects.increment_many({}, {"p1": {"score": math.log(3)}, "p2": {"score": 1000.0}})
+    found = await projects.find_many({"id": {"$in": ["p1", "p2"]}}, [("id", 1)], fields={"view_count": 1, "score": 1})
+    assert found[0]["view_count"] == 4
+    assert found[0]["score"] == pytest.approx(math.log(5))
+    assert found[1]["score"] == pytest.approx(1000 + math.log(2))